@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end client benchmarks against a local fake Sailthru API (benchmarks/fake_api.py).
+
+Scenarios:
+    single_send      sequential send() calls, one connection
+    bulk_send        send_many() with --concurrency calls in flight
+    postback_verify  PostbackVerifier.verify_many() of signed hardbounce postbacks with send / blast lookups
+    list_upload      import_list() of --emails generated addresses, in chunks of --chunk-size
+    stats_decode     stats_send() calls with large responses, fully decoded
+
+The fake API runs in its own process and every scenario in a fresh one, so peak RSS is the scenario's own.
+Reports ops/sec, p50 / p99 latency of the HTTP calls, errors and peak RSS (and its growth during the scenario).
+
+    python benchmarks/bench_client.py [--scenario NAME ...] [--requests N] [--latency-ms N] [--error-rate F] [--json]
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+sys.path[0:0] = [""]
+
+from fake_api import add_server_arguments, serve, server_options
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_metrics import LatencyHistogram, RequestObserver
+from sailthru.sailthru_retry import RetryPolicy
+from sailthru.sailthru_signature import get_signature_hash
+
+SCENARIOS = ('single_send', 'bulk_send', 'postback_verify', 'list_upload', 'stats_decode')
+
+
+class LatencyObserver(RequestObserver):
+    """
+    Records the total time of every HTTP attempt, whatever its endpoint
+    """
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.errors = 0
+
+    def after_response(self, event):
+        self.histogram.record(event.timings['total'])
+        if event.status != 200:
+            self.errors += 1
+
+    def on_error(self, event):
+        self.histogram.record(event.timings['total'])
+        self.errors += 1
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def single_send(client, args):
+    for i in range(args.requests):
+        client.send('welcome', 'user%d@example.com' % i, {'name': 'User %d' % i})
+    return args.requests
+
+
+def bulk_send(client, args):
+    sends = (('welcome', 'user%d@example.com' % i, {'name': 'User %d' % i}) for i in range(args.requests))
+    for result in client.send_many(sends, concurrency=args.concurrency, ordered=False):
+        pass
+    return args.requests
+
+
+def postback_verify(client, args):
+    postbacks = []
+    for i in range(args.requests):
+        post_params = {'action': 'hardbounce', 'email': 'user%d@example.com' % i,
+                       'send_id': 'send%d' % (i % 200), 'blast_id': str(i % 20)}
+        post_params['sig'] = get_signature_hash(post_params, client.secret)
+        postbacks.append(post_params)
+    verifier = client.get_postback_verifier(concurrency=args.concurrency)
+    verified = verifier.verify_many(postbacks, 'hardbounce', lookup=True)
+    assert all(verified)
+    return len(postbacks)
+
+
+def list_upload(client, args):
+    emails = ('user%d@example.com' % i for i in range(args.emails))
+    client.import_list('main', emails, chunk_size=args.chunk_size)
+    return args.emails
+
+
+def stats_decode(client, args):
+    for i in range(max(args.requests // 10, 1)):
+        response = client.stats_send('welcome', '2016-01-01', '2016-12-31')
+        assert response.get_body()['count']
+    return max(args.requests // 10, 1)
+
+
+SCENARIO_FUNCTIONS = {'single_send': single_send, 'bulk_send': bulk_send, 'postback_verify': postback_verify,
+                      'list_upload': list_upload, 'stats_decode': stats_decode}
+
+
+def run_scenario(name, url, args):
+    observer = LatencyObserver()
+    retry_policy = RetryPolicy(max_attempts=args.retries + 1, backoff_base=0.01) if args.retries else None
+    client = SailthruClient('api_key', 'super_secret', api_url=url, observers=[observer], retry_policy=retry_policy,
+                            pool_maxsize=max(args.concurrency, 10))
+    rss_before = peak_rss()
+    started = time.time()
+    try:
+        ops = SCENARIO_FUNCTIONS[name](client, args)
+    finally:
+        client.close()
+    elapsed = time.time() - started
+    histogram = observer.histogram
+    return {'scenario': name,
+            'ops': ops,
+            'ops_per_second': ops / elapsed if elapsed > 0 else 0.0,
+            'requests': histogram.count,
+            'errors': observer.errors,
+            'p50_ms': (histogram.percentile(50) or 0) * 1000,
+            'p99_ms': (histogram.percentile(99) or 0) * 1000,
+            'peak_rss_mb': peak_rss() / 1048576.0,
+            'rss_growth_mb': (peak_rss() - rss_before) / 1048576.0}
+
+
+def _scenario_process(name, url, args, results):
+    results.put(run_scenario(name, url, args))
+
+
+def _server_process(options, urls):
+    serve(0, urls.put, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='scenario to run, all by default')
+    parser.add_argument('--requests', type=int, default=2000, help='calls per scenario (stats_decode makes a tenth)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--emails', type=int, default=1000000, help='addresses uploaded by list_upload')
+    parser.add_argument('--chunk-size', type=int, default=250000)
+    parser.add_argument('--retries', type=int, default=0, help='retry failed idempotent calls this many times')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_server_process, args=(server_options(args), urls))
+    server.daemon = True
+    server.start()
+    url = urls.get(timeout=10)
+
+    if not args.json:
+        print('%-16s %9s %11s %9s %9s %7s %10s %10s' % ('scenario', 'ops', 'ops/sec', 'p50 ms', 'p99 ms', 'errors',
+                                                         'peak RSS', 'RSS growth'))
+    try:
+        for name in args.scenario or SCENARIOS:
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_scenario_process, args=(name, url, args, results))
+            process.start()
+            result = results.get()
+            process.join()
+            if args.json:
+                print(json.dumps(result, sort_keys=True))
+            else:
+                print('%-16s %9d %11.1f %9.2f %9.2f %7d %8.1fMB %8.1fMB' % (
+                    name, result['ops'], result['ops_per_second'], result['p50_ms'], result['p99_ms'],
+                    result['errors'], result['peak_rss_mb'], result['rss_growth_mb']))
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
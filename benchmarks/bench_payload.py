@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of request encoding: JSON serialization, signing and form encoding of the request body.
+
+Compares the current pipeline (SailthruClient._prepare_json_payload + encode_form) with the previous one
+(payload dict signed through get_signature_hash, flatten_nested_hash, then requests' form encoding),
+for a small send and for a blast with a multi-megabyte content_html. Reports time per request and
+peak memory allocated while encoding one request.
+
+    python benchmarks/bench_payload.py [--html-mb N] [--repeat N]
+"""
+import argparse
+import hashlib
+import sys
+import timeit
+import tracemalloc
+
+sys.path[0:0] = [""]
+
+from requests.models import RequestEncodingMixin
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_http import encode_form, flatten_nested_hash, is_flat_hash
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+def legacy_encode(api_key, secret, data):
+    payload = {'api_key': api_key, 'format': 'json', 'json': json.dumps(data)}
+    str_list = sorted(str(value) for value in payload.values())
+    payload['sig'] = hashlib.md5((secret + ''.join(str_list)).encode('utf-8')).hexdigest()
+    return RequestEncodingMixin._encode_params(flatten_nested_hash(payload)).encode('utf-8')
+
+
+def current_encode(client, data):
+    payload = client._prepare_json_payload(data)
+    if not is_flat_hash(payload):
+        payload = flatten_nested_hash(payload)
+    return encode_form(payload)
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--html-mb', type=float, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = SailthruClient('api_key', 'super_secret')
+    html = ('<p>Hello {name}, here are this week\'s deals &amp; offers</p>\n' * int(args.html_mb * 1024 * 1024 / 60))
+    scenarios = [
+        ('small send', 20000, {'template': 'receipt', 'email': 'praj@sailthru.com',
+                               'vars': {'name': 'Praj', 'order': {'id': 1234, 'items': ['a', 'b']}},
+                               'options': {'replyto': 'support@example.com'}}),
+        ('blast %.0fMB content_html' % args.html_mb, 3,
+         {'name': 'Weekly', 'list': 'main', 'schedule_time': 'now', 'from_name': 'Shop',
+          'from_email': 'shop@example.com', 'subject': 'Deals', 'content_html': html, 'content_text': 'Deals'}),
+    ]
+
+    print('%-24s %14s %14s %12s %12s' % ('request', 'legacy time', 'current time', 'legacy peak', 'current peak'))
+    for name, number, data in scenarios:
+        legacy_body = legacy_encode('api_key', 'super_secret', data)
+        assert sorted(legacy_body.split(b'&')) == sorted(current_encode(client, data).split(b'&')), name
+        legacy = min(timeit.repeat(lambda: legacy_encode('api_key', 'super_secret', data), number=number, repeat=args.repeat)) / number
+        current = min(timeit.repeat(lambda: current_encode(client, data), number=number, repeat=args.repeat)) / number
+        legacy_peak = peak_memory(lambda: legacy_encode('api_key', 'super_secret', data))
+        current_peak = peak_memory(lambda: current_encode(client, data))
+        print('%-24s %12.1fus %12.1fus %10.0fKB %10.0fKB' % (name, legacy * 1e6, current * 1e6,
+                                                             legacy_peak / 1024.0, current_peak / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
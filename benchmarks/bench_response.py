@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the memory kept per result by bulk jobs: SailthruResponse versus CompactResponse.
+
+Sends --results messages with send_many against an in-process fake API (benchmarks/fake_api.py), keeps every
+BulkResult in a list, as a reconciliation job would, and reports the memory still allocated per result once
+they are all in, measured with tracemalloc. Responses are decoded first, as callers reading them would.
+
+    python benchmarks/bench_response.py [--results N] [--concurrency N]
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+
+sys.path[0:0] = [""]
+
+from fake_api import FakeSailthruAPI
+from sailthru.sailthru_client import SailthruClient
+
+
+def retained_per_result(url, count, concurrency, compact):
+    client = SailthruClient('api_key', 'super_secret', api_url=url, pool_maxsize=concurrency)
+    sends = (('welcome', 'user%d@example.com' % i, {'name': 'User %d' % i}) for i in range(count))
+    try:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        results = []
+        for result in client.send_many(sends, concurrency=concurrency, compact=compact):
+            result.response.get_body()
+            results.append(result)
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    finally:
+        client.close()
+    assert len(results) == count and all(result.is_ok() for result in results)
+    return retained / float(count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--results', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    server = FakeSailthruAPI().start()
+    try:
+        full = retained_per_result(server.url, args.results, args.concurrency, compact=False)
+        compact = retained_per_result(server.url, args.results, args.concurrency, compact=True)
+    finally:
+        server.stop()
+    print('%-18s %12s' % ('result type', 'bytes/result'))
+    print('%-18s %12.0f' % ('SailthruResponse', full))
+    print('%-18s %12.0f' % ('CompactResponse', compact))
+    print('%-18s %11.1fx' % ('reduction', full / compact if compact else float('inf')))
+
+
+if __name__ == '__main__':
+    main()
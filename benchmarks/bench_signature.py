@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of request signing on large nested vars payloads.
+
+Compares sailthru.sailthru_signature.get_signature_hash against the previous recursive
+implementation and checks both produce the same signatures.
+
+    python benchmarks/bench_signature.py [--repeat N]
+"""
+import argparse
+import hashlib
+import sys
+import timeit
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_signature import get_signature_hash
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+def legacy_extract_params(params):
+    values = []
+    if isinstance(params, dict):
+        for key, value in params.items():
+            values.extend(legacy_extract_params(value))
+    elif isinstance(params, list):
+        for value in params:
+            values.extend(legacy_extract_params(value))
+    else:
+        values.append(params)
+    return values
+
+
+def legacy_signature_hash(params, secret):
+    str_list = [str(item) for item in legacy_extract_params(params)]
+    str_list.sort()
+    return hashlib.md5((secret + ''.join(str_list)).encode('utf-8')).hexdigest()
+
+
+def nested_vars(items, depth):
+    if depth == 0:
+        return 'value'
+    return {'key%d' % i: [nested_vars(items, depth - 1), i, 'text %d' % i] for i in range(items)}
+
+
+PAYLOADS = [
+    ('postback (flat, 5 keys)', {'action': 'hardbounce', 'email': 'praj@sailthru.com', 'send_id': 'TE8EZ3-LmosnAgAA',
+                                 'blast_id': '1234', 'api_key': 'abc'}),
+    ('send payload (signed json)', {'api_key': 'abc', 'format': 'json',
+                                    'json': json.dumps({'template': 'welcome', 'email': 'praj@sailthru.com',
+                                                        'vars': nested_vars(10, 2)})}),
+    ('nested vars 10 wide, 3 deep', {'vars': nested_vars(10, 3)}),
+    ('nested vars 15 wide, 3 deep', {'vars': nested_vars(15, 3)}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    secret = 'super_secret'
+
+    print('%-30s %8s %12s %12s %8s' % ('payload', 'values', 'legacy', 'current', 'speedup'))
+    for name, params in PAYLOADS:
+        assert legacy_signature_hash(params, secret) == get_signature_hash(params, secret), name
+        values = len(legacy_extract_params(params))
+        number = max(1, int(20000 / (values + 10)))
+        legacy = min(timeit.repeat(lambda: legacy_signature_hash(params, secret), number=number, repeat=args.repeat)) / number
+        current = min(timeit.repeat(lambda: get_signature_hash(params, secret), number=number, repeat=args.repeat)) / number
+        print('%-30s %8d %10.1fus %10.1fus %7.2fx' % (name, values, legacy * 1e6, current * 1e6, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
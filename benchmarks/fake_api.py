@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Local fake of the Sailthru API for benchmarks: /send, /user, /list, /blast, /stats, /purchase, /content and /job.
+
+Answers every call with a plausible JSON body and X-Rate-Limit-* headers, after an optional latency. Errors (500)
+and throttling (429) can be injected at random, and a per-endpoint limit per minute returns 429s once used up,
+the way the API does. Request signatures are not checked.
+
+    python benchmarks/fake_api.py [--port N] [--latency-ms N] [--error-rate F] [--throttle-rate F] [--rate-limit N]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import random
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+def stats_body(days):
+    """
+    Stats response with per-day breakdowns over `days` days, about 1KB per day
+    """
+    return {'count': days * 1000, 'open_total': days * 400, 'click_total': days * 90, 'rev': days * 1234,
+            'days': dict(('2016-%03d' % day, {'count': 1000, 'open_total': 400, 'click_total': 90, 'rev': 1234,
+                                              'domains': dict(('domain%d.com' % i, {'count': 20, 'open': 8})
+                                                              for i in range(20))})
+                         for day in range(days))}
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately; without TCP_NODELAY every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = self._read_chunked()
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+        if body and self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            params.update(parse_qs(body.decode('utf-8')))
+        try:
+            payload = json.loads(params['json'][0])
+        except (KeyError, ValueError):
+            payload = {}
+        return parsed.path.strip('/'), payload
+
+    def _read_chunked(self):
+        # streamed uploads (e.g. job files of unknown size) are sent chunked, without a Content-Length
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if not size:
+                self.rfile.readline()
+                return b''.join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def _handle(self):
+        action, payload = self._params()
+        status, body, rate_limit = self.server.respond(self.command, action, payload)
+        content = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        limit, remaining, reset = rate_limit
+        self.send_header('X-Rate-Limit-Limit', str(limit))
+        self.send_header('X-Rate-Limit-Remaining', str(remaining))
+        self.send_header('X-Rate-Limit-Reset', str(reset))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+
+class FakeSailthruAPI(ThreadingMixIn, HTTPServer):
+    """
+    Threaded fake API server. start() serves it from a background thread.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, throttle_rate=0.0, rate_limit=None, stats_days=365, seed=None):
+        """
+        @param latency: seconds every response is delayed by
+        @param error_rate: share of calls answered with a 500
+        @param throttle_rate: share of calls answered with a 429
+        @param rate_limit: calls per minute allowed for each action and method, answered with 429 beyond it
+        @param stats_days: days of breakdown in /stats responses, to make them large
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', port), FakeAPIHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.stats = json.dumps(stats_body(stats_days)).encode('utf-8')
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.calls = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def _rate_limit(self, key):
+        limit = self.rate_limit or 100000
+        now = time.time()
+        reset = int(now // 60 + 1) * 60
+        with self.lock:
+            self.calls += 1
+            window_reset, used = self.windows.get(key, (reset, 0))
+            if window_reset <= now:
+                window_reset, used = reset, 0
+            used += 1
+            self.windows[key] = (window_reset, used)
+            roll = self.random.random()
+        return (limit, max(limit - used, 0), window_reset), used > limit, roll
+
+    def respond(self, method, action, payload):
+        rate_limit, over_limit, roll = self._rate_limit((action, method))
+        if self.latency:
+            time.sleep(self.latency)
+        if over_limit or roll < self.throttle_rate:
+            return 429, {'error': 43, 'errormsg': 'Too many requests'}, rate_limit
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, {'error': 9, 'errormsg': 'Internal error'}, rate_limit
+        return 200, self.body(method, action, payload), rate_limit
+
+    def body(self, method, action, payload):
+        if action == 'send':
+            if method == 'GET':
+                return {'send_id': payload.get('send_id'), 'email': 'user@example.com', 'template': 'welcome', 'status': 'delivered'}
+            return {'send_id': '%x' % self.random.getrandbits(64), 'email': payload.get('email'), 'status': 'sent'}
+        if action == 'user':
+            return {'keys': {'email': payload.get('id'), 'sid': '%x' % self.random.getrandbits(64)},
+                    'vars': payload.get('vars', {}), 'lists': payload.get('lists', {})}
+        if action == 'list':
+            return {'list': payload.get('list'), 'email_count': 12345, 'valid_count': 12000}
+        if action == 'blast':
+            return {'blast_id': payload.get('blast_id', 1234), 'name': 'Weekly', 'status': 'sent'}
+        if action == 'stats':
+            return self.stats
+        if action == 'job':
+            return {'job_id': '%x' % self.random.getrandbits(64), 'status': 'pending'}
+        return {'ok': True}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+def serve(port, ready=None, **options):
+    """
+    Run a FakeSailthruAPI until interrupted; ready(url) is called once it listens
+    """
+    server = FakeSailthruAPI(port, **options)
+    if ready is not None:
+        ready(server.url)
+    try:
+        server.serve_forever(poll_interval=0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def add_server_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=0, help='delay of every response')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of calls answered with a 500')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='share of calls answered with a 429')
+    parser.add_argument('--rate-limit', type=int, default=None, help='calls per minute per endpoint before 429s')
+    parser.add_argument('--stats-days', type=int, default=365, help='days of breakdown in /stats responses')
+
+
+def server_options(args):
+    return {'latency': args.latency_ms / 1000.0, 'error_rate': args.error_rate, 'throttle_rate': args.throttle_rate,
+            'rate_limit': args.rate_limit, 'stats_days': args.stats_days}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    serve(args.port, lambda url: print('fake Sailthru API listening on %s' % url), **server_options(args))
+
+
+if __name__ == '__main__':
+    main()
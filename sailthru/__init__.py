@@ -1,6 +1,24 @@
+from .sailthru_cache import CacheBackend, MemoryCacheBackend, ResponseCache
+from .sailthru_catalog import CatalogIndex, CatalogSync
 from .sailthru_client import SailthruClient
-from .sailthru_error import SailthruClientError
-from .sailthru_response import SailthruResponse, SailthruResponseError
+from .sailthru_error import SailthruClientError, SailthruTimeoutError
+from .sailthru_job import JobFileWriter, JobResult, JobRunner
+from .sailthru_metrics import MetricsCollector, RequestObserver, StatsdObserver, to_prometheus
+from .sailthru_outbox import Outbox
+from .sailthru_postback import PostbackVerifier
+from .sailthru_purchase import PurchaseRecorder
+from .sailthru_rate_limit import RateLimiter
+from .sailthru_response import CompactResponse, SailthruResponse, SailthruResponseError
+from .sailthru_retry import RetryPolicy
+from .sailthru_single_flight import SingleFlight
+from .sailthru_stats import StatsExporter, to_columns, write_csv, write_jsonl
+from .sailthru_stream import SailthruStreamResponse, iter_json_items
+from .sailthru_sync import UserSyncPipeline
+from .sailthru_timeout import DEFAULT_TIMEOUTS, Timeout, deadline
+
+import sys
+if sys.version_info >= (3, 5):
+    from .sailthru_async import AsyncSailthruClient
 
 __author__ = 'Sailthru Inc.'
 __doc__ = 'Python binding for Sailthru API based on Requests'
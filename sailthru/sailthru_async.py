@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import platform
+import time
+from collections import deque
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .sailthru_bulk import BulkResult, BulkResults
+from .sailthru_client import SailthruClient
+from .sailthru_compat import string_types
+from .sailthru_error import SailthruClientError, SailthruTimeoutError
+from .sailthru_http import flatten_nested_hash
+from .sailthru_job import write_email_files
+from .sailthru_multipart import is_replayable, source_filename
+from .sailthru_response import CompactResponse, SailthruResponse
+from .sailthru_timeout import DEFAULT_REQUEST_TIMEOUT, current_deadline, deadline, remaining_time
+
+
+class AsyncHttpResponse(object):
+    """
+    Buffered aiohttp response exposing the attributes SailthruResponse reads from a requests.Response
+    """
+    def __init__(self, status_code, headers, content, encoding=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, 'replace')
+
+
+class AsyncBulkResults(BulkResults):
+    """
+    asyncio flavour of BulkResults: asynchronous iterator over BulkResult objects that runs the coroutine
+    function func(item) for each input item as a task, with at most `concurrency` tasks in flight.
+    Call cancel() to stop early without waiting for the tasks in flight.
+
+    Usage:
+        async for result in client.send_many(sends, concurrency=16):
+            ...
+    """
+    def __init__(self, func, items, concurrency=10, ordered=True, compact=False):
+        BulkResults.__init__(self, func, items, concurrency, ordered, compact)
+        self._items = None
+        self._exhausted = False
+        self._in_flight = deque() if ordered else set()
+        self._done = deque()
+
+    async def _call(self, index, item):
+        try:
+            with deadline(at=self.deadline):
+                response = await self.func(item)
+            if self.compact and isinstance(response, SailthruResponse):
+                response = CompactResponse.from_response(response)
+            return BulkResult(index, item, response=response)
+        except Exception as e:
+            return BulkResult(index, item, error=e)
+
+    def __iter__(self):
+        raise TypeError('use "async for" with AsyncBulkResults')
+
+    def __aiter__(self):
+        if self._items is None:
+            self.started_at = time.time()
+            self._items = enumerate(self.items)
+        return self
+
+    def _start_tasks(self):
+        while not self._exhausted and len(self._in_flight) < self.concurrency:
+            try:
+                index, item = next(self._items)
+            except StopIteration:
+                self._exhausted = True
+                break
+            task = asyncio.ensure_future(self._call(index, item))
+            if self.ordered:
+                self._in_flight.append(task)
+            else:
+                self._in_flight.add(task)
+
+    async def __anext__(self):
+        while not self._done:
+            self._start_tasks()
+            if not self._in_flight:
+                if self.finished_at is None:
+                    self.finished_at = time.time()
+                raise StopAsyncIteration
+            if self.ordered:
+                self._done.append(await self._in_flight.popleft())
+            else:
+                done, _ = await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    self._in_flight.discard(task)
+                    self._done.append(task.result())
+        return self._record(self._done.popleft())
+
+    def cancel(self):
+        """
+        Cancel the calls in flight and stop consuming the input
+        """
+        self._exhausted = True
+        for task in self._in_flight:
+            task.cancel()
+        self._in_flight.clear()
+        self._done.clear()
+        self.finished_at = time.time()
+
+
+class AsyncSailthruClient(SailthruClient):
+
+    """
+    asyncio flavour of SailthruClient. Every API method returns an awaitable.
+    Requires aiohttp.
+
+    Usage:
+        from sailthru import AsyncSailthruClient
+        async with AsyncSailthruClient(api_key, api_secret) as client:
+            response = await client.send('welcome', 'praj@sailthru.com')
+    """
+
+    is_async = True
+
+    def __init__(self, api_key, secret, api_url=None, request_timeout=DEFAULT_REQUEST_TIMEOUT,
+                 session=None, pool_connections=10, pool_maxsize=10, keep_alive=True, rate_limiter=None,
+                 retry_policy=None, response_cache=None, observers=None, max_concurrency=None, single_flight=None,
+                 timeouts=None, compact_responses=False):
+        """
+        @param session: optional aiohttp.ClientSession used for all HTTP calls; the caller keeps ownership of it
+        @param max_concurrency: maximum number of requests in flight at once, defaults to pool_maxsize
+        """
+        if aiohttp is None:
+            raise SailthruClientError('AsyncSailthruClient requires aiohttp, install it with: pip install aiohttp')
+        self._pool_config = (pool_connections, pool_maxsize, keep_alive)
+        self.max_concurrency = max_concurrency or pool_maxsize
+        self._semaphore = None
+        SailthruClient.__init__(self, api_key, secret, api_url, request_timeout, session,
+                                pool_connections, pool_maxsize, keep_alive, rate_limiter, retry_policy,
+                                response_cache, observers, single_flight, timeouts, compact_responses)
+
+    def _create_session(self, pool_connections, pool_maxsize, keep_alive):
+        # aiohttp sessions have to be created inside the running event loop, see _get_session
+        return None
+
+    def _get_session(self):
+        if self.session is None:
+            pool_connections, pool_maxsize, keep_alive = self._pool_config
+            connector = aiohttp.TCPConnector(limit=pool_connections * pool_maxsize,
+                                             limit_per_host=pool_maxsize,
+                                             force_close=not keep_alive)
+            self.session = aiohttp.ClientSession(connector=connector)
+            self._owns_session = True
+        return self.session
+
+    def _get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def close(self):
+        """
+        Release pooled connections. Sessions passed in by the caller are left open.
+        """
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+        self.session = None
+
+    def __enter__(self):
+        raise TypeError('use "async with" with AsyncSailthruClient')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def receive_verify_post(self, post_params):
+        """
+        Returns true if the incoming request is an authenticated verify post.
+        """
+        post_params = self._check_postback(post_params, 'verify', ['action', 'email', 'send_id', 'sig'])
+        if post_params is None:
+            return False
+
+        send_response = await self.get_send(post_params['send_id'])
+        return self._check_verify_send(send_response, post_params)
+
+    async def receive_update_post(self, post_params):
+        """
+        Update postbacks
+        """
+        return SailthruClient.receive_update_post(self, post_params)
+
+    async def receive_optout_post(self, post_params):
+        """
+        Optout postbacks
+        """
+        return SailthruClient.receive_optout_post(self, post_params)
+
+    async def receive_hardbounce_post(self, post_params):
+        """
+        Hard bounce postbacks
+        """
+        post_params = self._check_postback(post_params, 'hardbounce', ['action', 'email', 'sig'])
+        if post_params is None:
+            return False
+
+        if 'send_id' in post_params:
+            send_response = await self.get_send(post_params['send_id'])
+            if not self._check_hardbounce_send(send_response):
+                return False
+
+        if 'blast_id' in post_params:
+            blast_response = await self.get_blast(post_params['blast_id'])
+            if not self._check_hardbounce_blast(blast_response):
+                return False
+
+        return True
+
+    def send_many(self, sends, concurrency=10, ordered=True, compact=False):
+        """
+        Send an email template to many recipients concurrently, see SailthruClient.send_many.
+        @return: AsyncBulkResults, iterated over with "async for"
+        """
+        return AsyncBulkResults(self._send_one, sends, concurrency, ordered, compact)
+
+    async def import_list(self, list_name, emails, chunk_size=None, options=None):
+        """
+        Import email addresses into a list through 'import' jobs, see SailthruClient.import_list.
+        Each upload is awaited before its temporary file is removed.
+        """
+        options = options or {}
+        if isinstance(emails, string_types) and os.path.isfile(emails) and not chunk_size:
+            return [await self._import_list_file(list_name, emails, options)]
+
+        responses = []
+        for path in write_email_files(emails, chunk_size):
+            try:
+                responses.append(await self._import_list_file(list_name, path, options))
+            finally:
+                os.remove(path)
+        return responses
+
+    async def api_post_multipart(self, action, data, binary_data_param):
+        """
+        Perform an HTTP Multipart POST request, using the shared-secret auth hash.
+        @param action: API action call
+        @param data: dictionary values
+        @param: binary_data_params: array of multipart keys
+        """
+        data, binary_data = self._split_file_data(data, binary_data_param)
+        try:
+            started = time.time()
+            json_payload = self._prepare_json_payload(data)
+
+            return await self._http_request(action, json_payload, 'POST', binary_data, sign_time=time.time() - started)
+        finally:
+            if self.response_cache is not None:
+                self.response_cache.invalidate(self.api_key, self.api_url, action)
+
+    async def _api_request(self, action, data, request_type, headers=None):
+        """
+        Make Request to Sailthru API with given data and api key, format and signature hash
+        GETs of cached actions are answered from the response cache, writes to them invalidate it.
+        Identical concurrent GETs share one call if the client has a SingleFlight.
+        """
+        cache = self.response_cache
+        if cache is None or not cache.is_cached(action):
+            if request_type == 'GET':
+                return await self._get_api_request(action, data, headers)
+            return await self._send_api_request(action, data, request_type, headers)
+
+        if request_type == 'GET':
+            key = cache.make_key(self.api_key, self.api_url, action, data)
+            response = cache.get(key)
+            if response is None:
+                response = await self._get_api_request(action, data, headers)
+                cache.set(action, key, response)
+            return response
+
+        try:
+            return await self._send_api_request(action, data, request_type, headers)
+        finally:
+            cache.invalidate(self.api_key, self.api_url, action)
+
+    async def _get_api_request(self, action, data, headers=None):
+        single_flight = self.single_flight
+        if single_flight is None:
+            return await self._send_api_request(action, data, 'GET', headers)
+        key = single_flight.make_key(self.api_key, action, data, headers)
+        while True:
+            task = single_flight.tasks.get(key)
+            leader = task is None
+            single_flight.count(leader)
+            if leader:
+                task = asyncio.ensure_future(self._send_api_request(action, data, 'GET', headers))
+                single_flight.tasks[key] = task
+                task.add_done_callback(lambda done: single_flight.tasks.pop(key, None))
+            # shielded, so a caller cancelled or timed out while waiting does not cancel the call for the others
+            remaining = remaining_time(action, current_deadline())
+            try:
+                if remaining is None:
+                    return await asyncio.shield(task)
+                return await asyncio.wait_for(asyncio.shield(task), remaining)
+            except SailthruTimeoutError:
+                if leader:
+                    raise
+                # the leader's deadline passed, not necessarily ours: make the call again, possibly as the new leader
+            except asyncio.TimeoutError:
+                raise SailthruTimeoutError('deadline of the %s call exceeded waiting for the same call in flight' % action)
+
+    async def _stream_api_request(self, action, data, headers=None, item_path=None):
+        raise SailthruClientError('api_get(stream=True) is not supported by AsyncSailthruClient')
+
+    async def _send_api_request(self, action, data, request_type, headers=None):
+        data, file_data = self._split_file_data(data, ('file',))
+        started = time.time()
+        json_payload = self._prepare_json_payload(data)
+        return await self._http_request(action, json_payload, request_type, file_data, headers, time.time() - started)
+
+    async def _http_request(self, action, data, method, file_data=None, headers=None, sign_time=None):
+        url = self.api_url + '/' + action
+        method = method.upper()
+        file_data = file_data or {}
+        replayable = all(is_replayable(source) for source in file_data.values())
+        positions = self._file_positions(file_data)
+        timeout = self.get_timeout(action)
+        deadline_at = timeout.get_deadline(time.time())
+        attempt = 1
+        while True:
+            started = time.time()
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.try_acquire(action, method)
+                while delay:
+                    remaining = remaining_time(action, deadline_at)
+                    if remaining is not None and delay > remaining:
+                        raise SailthruTimeoutError('deadline of the %s call exceeded waiting for the rate limit' % action)
+                    await asyncio.sleep(delay)
+                    delay = self.rate_limiter.try_acquire(action, method)
+            try:
+                async with self._get_semaphore():
+                    # started first, so observers see an attempt whose deadline passed waiting for the semaphore
+                    event = self._start_event(action, method, data, attempt, started, sign_time)
+                    remaining = remaining_time(action, deadline_at)
+                    response = await self._send_request(url, data, method, file_data, headers,
+                                                        timeout.get_request_timeout(remaining), remaining)
+            except SailthruTimeoutError as e:
+                self._finish_event(event, error=e)
+                raise
+            except SailthruClientError as e:
+                self._finish_event(event, error=e)
+                delay = self._get_retry_delay(action, method, attempt, error=e, deadline_at=deadline_at) if replayable else None
+                if delay is None:
+                    raise
+            else:
+                self._record_rate_limit_info(action, method, response)
+                self._finish_event(event, response=response)
+                delay = self._get_retry_delay(action, method, attempt, response=response,
+                                              deadline_at=deadline_at) if replayable else None
+                if delay is None:
+                    return self._make_result(response)
+            await asyncio.sleep(delay)
+            self._rewind_files(file_data, positions)
+            attempt += 1
+
+    async def _send_request(self, url, data, method, file_data=None, headers=None, request_timeout=(None, None),
+                            total=None):
+        """
+        Perform an HTTP GET / POST / DELETE request through the pooled aiohttp session
+        @param request_timeout: (connect, read) timeouts
+        @param total: timeout of the whole request
+        """
+        data = dict((key, value if isinstance(value, str) else str(value))
+                    for key, value in flatten_nested_hash(data).items())
+        params = None
+        opened = []
+        if method != 'POST':
+            params, data = data, None
+        elif file_data:
+            form = aiohttp.FormData()
+            for key, value in data.items():
+                form.add_field(key, value)
+            for key, source in file_data.items():
+                if isinstance(source, str):
+                    source = open(source, 'rb')
+                    opened.append(source)
+                elif not isinstance(source, (bytes, bytearray, memoryview)) and not hasattr(source, 'read'):
+                    source = _iterate_chunks(source)
+                form.add_field(key, source, filename=source_filename(key, file_data[key]),
+                               content_type='application/octet-stream')
+            data = form
+
+        request_headers = dict(headers) if isinstance(headers, dict) else {}
+        request_headers['User-Agent'] = 'Sailthru API Python Client %s; Python Version: %s' % ('2.4.1', platform.python_version())
+        timeout = aiohttp.ClientTimeout(total=total, sock_connect=request_timeout[0], sock_read=request_timeout[1])
+        try:
+            async with self._get_session().request(method, url, params=params, data=data,
+                                                   headers=request_headers, timeout=timeout) as response:
+                content = await response.read()
+                return SailthruResponse(AsyncHttpResponse(response.status, response.headers, content, response.charset))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise SailthruClientError(str(e) or e.__class__.__name__)
+        finally:
+            for file_handle in opened:
+                file_handle.close()
+
+
+async def _iterate_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .sailthru_error import SailthruClientError
+from .sailthru_response import CompactResponse, SailthruResponse
+from .sailthru_timeout import current_deadline, deadline
+
+
+def require_blocking_client(client, helper):
+    """
+    @raise SailthruClientError: if client is an AsyncSailthruClient, whose calls return coroutines that helper,
+        making its calls from threads, could not await
+    """
+    if getattr(client, 'is_async', False) is True:
+        raise SailthruClientError('%s makes blocking calls and does not support AsyncSailthruClient, '
+                                  'use a SailthruClient' % helper)
+
+
+class BulkResult(object):
+    """
+    Outcome of one item of a bulk operation: either a response or the exception raised for it
+    """
+    __slots__ = ('index', 'item', 'response', 'error')
+
+    def __init__(self, index, item, response=None, error=None):
+        self.index = index
+        self.item = item
+        self.response = response
+        self.error = error
+
+    def is_ok(self):
+        return self.error is None and bool(self.response is not None and self.response.is_ok())
+
+    def __repr__(self):
+        return '<BulkResult index=%d %s>' % (self.index, 'error=%r' % self.error if self.error else 'ok')
+
+
+class BulkResults(object):
+    """
+    Iterator over BulkResult objects that runs func(item) for each input item on a thread pool.
+    At most `concurrency` items are in flight, so the input is consumed lazily and may be unbounded.
+    Results come back in input order when ordered is True, otherwise as soon as they complete.
+    Calls are made under the deadline() in effect where the BulkResults is created: items still waiting
+    when it passes fail with SailthruTimeoutError.
+    With compact, SailthruResponses are kept as CompactResponses, for jobs holding on to many results.
+
+    Usage:
+        results = BulkResults(client.get_user, ids, concurrency=8)
+        for result in results:
+            ...
+        print(results.per_second)
+    """
+    def __init__(self, func, items, concurrency=10, ordered=True, compact=False):
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        self.func = func
+        self.items = items
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.compact = compact
+        self.deadline = current_deadline()
+        self.count = 0
+        self.error_count = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def per_second(self):
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def _call(self, index, item):
+        try:
+            with deadline(at=self.deadline):
+                response = self.func(item)
+            if self.compact and isinstance(response, SailthruResponse):
+                response = CompactResponse.from_response(response)
+            return BulkResult(index, item, response=response)
+        except Exception as e:
+            return BulkResult(index, item, error=e)
+
+    def _record(self, result):
+        self.count += 1
+        if not result.is_ok():
+            self.error_count += 1
+        return result
+
+    def __iter__(self):
+        self.started_at = time.time()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        in_flight = deque() if self.ordered else set()
+        try:
+            items = enumerate(self.items)
+            exhausted = False
+            while True:
+                while not exhausted and len(in_flight) < self.concurrency:
+                    try:
+                        index, item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    future = executor.submit(self._call, index, item)
+                    if self.ordered:
+                        in_flight.append(future)
+                    else:
+                        in_flight.add(future)
+                if not in_flight:
+                    break
+                if self.ordered:
+                    yield self._record(in_flight.popleft().result())
+                else:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        in_flight.discard(future)
+                        yield self._record(future.result())
+        finally:
+            for future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=True)
+            self.finished_at = time.time()
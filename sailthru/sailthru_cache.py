@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class CacheBackend(object):
+    """
+    Storage interface used by ResponseCache. Implementations must be safe to use from several threads.
+    """
+    def get(self, key):
+        """
+        Stored value of key, None if missing or expired
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value under key for ttl seconds, forever if ttl is None
+        """
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU cache with per-entry expiry
+    """
+    def __init__(self, maxsize=1000, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= self.clock():
+                return None
+            self.entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = self.clock() + ttl if ttl is not None else None
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (expires, value)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ResponseCache(object):
+    """
+    Opt-in cache of successful GET responses for rarely changing data, keyed by API key, API URL, action and
+    request data, so that clients of different accounts can share one cache.
+
+    Only actions with a TTL are cached. A POST or DELETE to an action (save_template, delete_template,
+    update_blast, delete_list, ...) invalidates every cached GET of that action for that account. Invalidation
+    works by rotating a per-account, per-action generation token stored in the backend, so it is seen by every
+    client sharing it.
+
+    Usage:
+        cache = ResponseCache(ttls={'template': 600, 'list': 300})
+        client = SailthruClient(api_key, api_secret, response_cache=cache)
+    """
+    # no 'send': every transactional send POSTs to it, which would invalidate cached get_send calls all the time
+    DEFAULT_TTLS = {'template': 300, 'list': 300, 'blast': 60}
+
+    def __init__(self, backend=None, ttls=None, maxsize=1000):
+        """
+        @param backend: CacheBackend storing the responses, an in-memory LRU of maxsize entries by default
+        @param ttls: {action: seconds} of the actions to cache, DEFAULT_TTLS if None
+        """
+        self.backend = backend if backend is not None else MemoryCacheBackend(maxsize)
+        self.ttls = dict(self.DEFAULT_TTLS if ttls is None else ttls)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def is_cached(self, action):
+        return action in self.ttls
+
+    def _generation_key(self, api_key, api_url, action):
+        return 'sailthru:generation:%s:%s' % (action, json.dumps([api_key, api_url], separators=(',', ':')))
+
+    def _generation(self, api_key, api_url, action):
+        generation_key = self._generation_key(api_key, api_url, action)
+        generation = self.backend.get(generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.backend.set(generation_key, generation)
+        return generation
+
+    def make_key(self, api_key, api_url, action, data):
+        """
+        Cache key of a GET request. Taken before the request is made, so a response racing with an
+        invalidation is stored under the old generation and never served.
+        """
+        normalized = json.dumps([api_key, api_url, data], sort_keys=True, separators=(',', ':'), default=str)
+        return 'sailthru:%s:%s:%s' % (action, self._generation(api_key, api_url, action), normalized)
+
+    def get(self, key):
+        response = self.backend.get(key)
+        with self.lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def set(self, action, key, response):
+        """
+        Store response if it is a successful one
+        """
+        if response.get_status_code() == 200 and response.is_ok():
+            self.backend.set(key, response, self.ttls[action])
+
+    def invalidate(self, api_key, api_url, action):
+        """
+        Drop every cached response of action for the account of api_key at api_url
+        """
+        if self.is_cached(action):
+            self.backend.set(self._generation_key(api_key, api_url, action), uuid.uuid4().hex)
+            with self.lock:
+                self.invalidations += 1
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_metrics(self):
+        """
+        Counters: {hits, misses, invalidations}
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
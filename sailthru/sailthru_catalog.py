@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import sqlite3
+import time
+
+from .sailthru_bulk import BulkResults, require_blocking_client
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+def build_content_data(title, url, images=None, date=None, expire_date=None, description=None, location=None,
+                       price=None, tags=None, author=None, site_name=None, spider=None, vars=None, inventory=None):
+    """
+    Request data of a content push, see SailthruClient.push_content
+    """
+    data = {'title': title,
+            'url': url}
+    if images is not None:
+        data['images'] = images
+    if date is not None:
+        data['date'] = date
+    if expire_date is not None:
+        data['expire_date'] = expire_date
+    if location is not None:
+        data['location'] = location
+    if price is not None:
+        data['price'] = price
+    if inventory is not None:
+        data['inventory'] = inventory
+    if description is not None:
+        data['description'] = description
+    if site_name is not None:
+        data['site_name'] = site_name
+    if author is not None:
+        data['author'] = author
+    if spider:
+        data['spider'] = 1
+    if tags is not None:
+        data['tags'] = ",".join(tags) if isinstance(tags, list) else tags
+    if vars:
+        data['vars'] = vars
+    return data
+
+
+def content_fingerprint(data):
+    """
+    Stable hash of content request data: equal for equal data whatever the order of its keys
+    """
+    normalized = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+class CatalogIndex(object):
+    """
+    SQLite file of the fingerprint each content URL was last pushed with, and when
+    """
+    def __init__(self, path):
+        """
+        @param path: database file, created if missing; ':memory:' keeps the index in memory
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS content '
+                                '(url TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, pushed_at REAL NOT NULL)')
+        self.connection.commit()
+
+    def get(self, url):
+        """
+        (fingerprint, pushed_at) of url, None if it was never pushed
+        """
+        return self.connection.execute('SELECT fingerprint, pushed_at FROM content WHERE url = ?', (url,)).fetchone()
+
+    def set(self, url, fingerprint, pushed_at):
+        self.connection.execute('INSERT OR REPLACE INTO content (url, fingerprint, pushed_at) VALUES (?, ?, ?)',
+                                (url, fingerprint, pushed_at))
+
+    def delete(self, url):
+        self.connection.execute('DELETE FROM content WHERE url = ?', (url,))
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM content').fetchone()[0]
+
+
+class CatalogSyncSummary(object):
+    """
+    Outcome of a CatalogSync run
+    """
+    def __init__(self, max_failures=100):
+        self.items = 0
+        self.unchanged = 0
+        self.pushed = 0
+        self.failed = 0
+        self.failures = []
+        self.max_failures = max_failures
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def add_failure(self, url, result):
+        self.failed += 1
+        if len(self.failures) < self.max_failures:
+            self.failures.append((url, result.error or result.response.get_error()))
+
+    def __repr__(self):
+        return ('<CatalogSyncSummary items=%d unchanged=%d pushed=%d failed=%d>'
+                % (self.items, self.unchanged, self.pushed, self.failed))
+
+
+class CatalogSync(object):
+    """
+    Pushes a content catalog, skipping items that have not changed since they were last pushed.
+
+    Each item is fingerprinted over the data push_content sends for it and compared with the fingerprint in a
+    local CatalogIndex. New and changed items, and items last pushed more than refresh_after seconds ago, are
+    pushed with up to `concurrency` calls in flight; the index is updated for every successful push, so a run
+    that fails half way only re-sends what was not pushed.
+
+    Usage:
+        catalog = client.get_catalog_sync('catalog.sqlite', concurrency=16, refresh_after=7 * 86400)
+        summary = catalog.run({'title': p.name, 'url': p.url, 'price': p.price, 'inventory': p.stock} for p in products)
+    """
+    def __init__(self, client, index, concurrency=8, refresh_after=None, max_failures=100, commit_every=1000, clock=time.time):
+        """
+        @param client: SailthruClient the content is pushed with
+        @param index: CatalogIndex, or the path of its SQLite file
+        @param concurrency: push_content calls in flight at once
+        @param refresh_after: seconds after which unchanged items are pushed again, never if None
+        @param max_failures: number of failures kept in the summary
+        @param commit_every: successful pushes between two commits of the index
+        """
+        require_blocking_client(client, 'CatalogSync')
+        self.client = client
+        self.index = index if isinstance(index, CatalogIndex) else CatalogIndex(index)
+        self.concurrency = concurrency
+        self.refresh_after = refresh_after
+        self.max_failures = max_failures
+        self.commit_every = commit_every
+        self.clock = clock
+
+    def is_current(self, url, fingerprint):
+        """
+        True if url was last pushed with this fingerprint and does not need refreshing yet
+        """
+        entry = self.index.get(url)
+        if entry is None or entry[0] != fingerprint:
+            return False
+        return self.refresh_after is None or self.clock() - entry[1] < self.refresh_after
+
+    def _changed(self, items, summary):
+        for item in items:
+            summary.items += 1
+            data = build_content_data(**item)
+            fingerprint = content_fingerprint(data)
+            if self.is_current(data['url'], fingerprint):
+                summary.unchanged += 1
+                continue
+            yield data, fingerprint
+
+    def _push(self, change):
+        return self.client.api_post('content', change[0])
+
+    def run(self, items):
+        """
+        Push the new, changed and stale items among items: dicts of push_content arguments (title, url, price, ...)
+        @return: CatalogSyncSummary
+        """
+        summary = CatalogSyncSummary(self.max_failures)
+        try:
+            for result in BulkResults(self._push, self._changed(items, summary), self.concurrency, ordered=False):
+                data, fingerprint = result.item
+                if result.is_ok():
+                    summary.pushed += 1
+                    self.index.set(data['url'], fingerprint, self.clock())
+                    if summary.pushed % self.commit_every == 0:
+                        self.index.commit()
+                else:
+                    summary.add_failure(data['url'], result)
+        finally:
+            self.index.commit()
+        summary.finished_at = time.time()
+        return summary
+
+    def close(self):
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,46 +1,30 @@
 # -*- coding: utf-8 -*-
 
-import hashlib
-from .sailthru_http import sailthru_http_request
+import os
+import time
+from .sailthru_bulk import BulkResults
+from .sailthru_compat import string_types
+from .sailthru_catalog import CatalogSync, build_content_data
+from .sailthru_error import SailthruClientError, SailthruTimeoutError
+from .sailthru_http import sailthru_http_request, sailthru_http_session
+from .sailthru_job import JobRunner, write_email_files
+from .sailthru_metrics import RequestEvent, payload_size
+from .sailthru_multipart import is_replayable
+from .sailthru_outbox import Outbox
+from .sailthru_postback import PostbackVerifier
+from .sailthru_purchase import PurchaseRecorder
+from .sailthru_rate_limit import RateLimitInfo
+from .sailthru_response import CompactResponse
+from .sailthru_signature import extract_params, get_signature_string, get_signature_hash, get_payload_signature
+from .sailthru_stats import StatsExporter
+from .sailthru_stream import SailthruStreamResponse
+from .sailthru_timeout import DEFAULT_REQUEST_TIMEOUT, DEFAULT_TIMEOUTS, Timeout, remaining_time
 
 try:
     import simplejson as json
 except ImportError:
     import json
 
-def extract_params(params):
-    """
-    Extracts the values of a set of parameters, recursing into nested dictionaries.
-    """
-    values = []
-    if isinstance(params, dict):
-        for key, value in params.items():
-            values.extend(extract_params(value))
-    elif isinstance(params, list):
-        for value in params:
-            values.extend(extract_params(value))
-    else:
-        values.append(params)
-    return values
-
-def get_signature_string(params, secret):
-    """
-    Returns the unhashed signature string (secret + sorted list of param values) for an API call.
-    @param params: dictionary values to generate signature string
-    @param secret: secret string
-    """
-    str_list = [str(item) for item in extract_params(params)]
-    str_list.sort()
-    return secret + ''.join(str_list)
-
-def get_signature_hash(params, secret):
-    """
-    Returns an MD5 hash of the signature string for an API call.
-    @param params: dictionary values to generate signature hash
-    @param sercret: secret string
-    """
-    return hashlib.md5(get_signature_string(params, secret).encode('utf-8')).hexdigest()
-
 
 class SailthruClient(object):
 
@@ -53,14 +37,75 @@ class SailthruClient(object):
         api_key = "your-api-key"
         api_secret = "api-secret"
         client = SailthruClient(api_key, api_secret)
+
+    A client is safe to share between threads: every call only reads the client's configuration, and the
+    state it updates (connection pool, rate limit information, limiter, cache, metrics) is thread-safe.
+
+    The client keeps a pool of keep-alive connections to the API server. Call close() when
+    done with it, or use it as a context manager:
+        with SailthruClient(api_key, api_secret) as client:
+            client.send('welcome', 'praj@sailthru.com')
     """
 
-    def __init__(self, api_key, secret, api_url=None, request_timeout=10):
+    # blocking calls: helpers making calls from threads (JobRunner, Outbox, ...) refuse asynchronous clients
+    is_async = False
+
+    def __init__(self, api_key, secret, api_url=None, request_timeout=DEFAULT_REQUEST_TIMEOUT,
+                 session=None, pool_connections=10, pool_maxsize=10, keep_alive=True, rate_limiter=None,
+                 retry_policy=None, response_cache=None, observers=None, single_flight=None, timeouts=None,
+                 compact_responses=False):
+        """
+        @param request_timeout: Timeout, seconds or (connect, read) seconds of calls to actions without their own
+            timeouts, 10 seconds if not given
+        @param session: optional requests.Session-like object used for all HTTP calls; the caller keeps ownership of it
+        @param pool_connections: number of hosts to keep connection pools for
+        @param pool_maxsize: maximum number of connections kept open per host
+        @param keep_alive: reuse connections between requests
+        @param rate_limiter: optional RateLimiter pacing calls by the API's rate limit headers
+        @param retry_policy: optional RetryPolicy retrying idempotent calls on connection errors and 429/5xx responses
+        @param response_cache: optional ResponseCache for GETs of rarely changing data (templates, lists, blasts)
+        @param observers: RequestObservers notified before and after every HTTP attempt, e.g. a MetricsCollector
+        @param single_flight: optional SingleFlight sharing one call between identical concurrent GETs
+        @param timeouts: {action: Timeout, seconds or (connect, read)} of calls to these actions; if None,
+            DEFAULT_TIMEOUTS when request_timeout is not given, none otherwise
+        @param compact_responses: return CompactResponses, which keep the decoded body but not the HTTP response
+        """
         self.api_key = api_key
         self.secret = secret
         self.api_url = api_url if api_url else 'https://api.sailthru.com'
         self.request_timeout = request_timeout
-        self.last_rate_limit_info = {}
+        if timeouts is None:
+            # an explicit request_timeout applies to every action, as it did before per-action timeouts
+            timeouts = DEFAULT_TIMEOUTS if request_timeout is DEFAULT_REQUEST_TIMEOUT else {}
+        self.timeouts = dict(timeouts)
+        self.rate_limit_info = RateLimitInfo()
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.response_cache = response_cache
+        self.observers = list(observers or [])
+        self.single_flight = single_flight
+        self.compact_responses = compact_responses
+        self._owns_session = session is None
+        if session is None:
+            session = self._create_session(pool_connections, pool_maxsize, keep_alive)
+        self.session = session
+
+    def _create_session(self, pool_connections, pool_maxsize, keep_alive):
+        return sailthru_http_session(pool_connections, pool_maxsize, keep_alive)
+
+    def close(self):
+        """
+        Release pooled connections. Sessions passed in by the caller are left open.
+        """
+        if self._owns_session and self.session is not None:
+            self.session.close()
+        self.session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def send(self, template, email, _vars=None, options=None, schedule_time=None, limit=None):
         """
@@ -78,9 +123,9 @@ class SailthruClient(object):
         data = {'template': template,
                 'email': email,
                 'vars': _vars,
-                'options': options.copy()}
+                'options': options}
         if limit:
-            data['limit'] = limit.copy()
+            data['limit'] = limit
         if schedule_time is not None:
             data['schedule_time'] = schedule_time
         return self.api_post('send', data)
@@ -100,13 +145,36 @@ class SailthruClient(object):
         options = options or {}
         data = {'template': template,
                 'email': ','.join(emails) if isinstance(emails, list) else emails,
-                'vars': _vars.copy(),
-                'evars': evars.copy(),
-                'options': options.copy()}
+                'vars': _vars,
+                'evars': evars,
+                'options': options}
         if schedule_time is not None:
             data['schedule_time'] = schedule_time
         return self.api_post('send', data)
 
+    def send_many(self, sends, concurrency=10, ordered=True, compact=False):
+        """
+        Send an email template to many recipients concurrently, each with its own vars.
+        The input is consumed lazily with at most `concurrency` sends in flight over the shared connection pool.
+        @param sends: iterable of send() keyword argument dicts, or (template, email, _vars, ...) tuples
+        @param concurrency: number of parallel sends
+        @param ordered: yield results in input order, otherwise in completion order
+        @param compact: keep CompactResponses in the results, to hold on to many of them
+        @return: BulkResults iterator of BulkResult objects; BulkResults.per_second reports throughput
+
+        Usage:
+            sends = ({'template': 'receipt', 'email': o.email, '_vars': o.vars} for o in orders)
+            for result in client.send_many(sends, concurrency=16):
+                if not result.is_ok():
+                    log(result.item, result.error or result.response.get_error())
+        """
+        return BulkResults(self._send_one, sends, concurrency, ordered, compact)
+
+    def _send_one(self, send):
+        if isinstance(send, dict):
+            return self.send(**send)
+        return self.send(*send)
+
     def get_send(self, send_id):
         """
         Get the status of a send
@@ -139,7 +207,7 @@ class SailthruClient(object):
         templates = templates or []
         send_vars = send_vars or []
         data = {'email': email,
-                'vars':  _vars.copy(),
+                'vars':  _vars,
                 'lists': lists,
                 'templates': templates,
                 'verified': int(verified)}
@@ -364,6 +432,50 @@ class SailthruClient(object):
                 'emails': ','.join(emails) if isinstance(emails, list) else emails}
         return self.api_post('list', data)
 
+    def import_list(self, list_name, emails, chunk_size=None, options=None):
+        """
+        Import email addresses into a list through an 'import' job, without building the whole list in memory.
+        Addresses are streamed to a temporary file (or read straight from the given file) and uploaded as a job file.
+        http://docs.sailthru.com/api/job
+        @param list_name: list name
+        @param emails: path of a file with one email address per line, a comma separated string of addresses,
+            or any iterable/generator of addresses
+        @param chunk_size: split the import into jobs of at most this many addresses
+        @param options: other job parameters, e.g. report_email or postback_url
+        @return: list of SailthruResponse, one per job
+        """
+        options = options or {}
+        if isinstance(emails, string_types) and os.path.isfile(emails) and not chunk_size:
+            return [self._import_list_file(list_name, emails, options)]
+
+        responses = []
+        for path in write_email_files(emails, chunk_size):
+            try:
+                responses.append(self._import_list_file(list_name, path, options))
+            finally:
+                os.remove(path)
+        return responses
+
+    def _import_list_file(self, list_name, path, options):
+        data = options.copy()
+        data['job'] = 'import'
+        data['list'] = list_name
+        data['file'] = path
+        return self.api_post('job', data)
+
+    def get_job(self, job_id):
+        """
+        Get the status of a job
+        http://docs.sailthru.com/api/job
+        """
+        return self.api_get('job', {'job_id': job_id})
+
+    def get_job_runner(self, poll_interval=2, max_poll_interval=60, backoff=2, timeout=3600):
+        """
+        JobRunner submitting jobs with streamed data files through this client and polling them until they complete
+        """
+        return JobRunner(self, poll_interval, max_poll_interval, backoff, timeout)
+
     def delete_list(self, list_name):
         """
         delete given list
@@ -410,35 +522,17 @@ class SailthruClient(object):
         @param inventory: integer value indicating current item inventory
 
         """
-        vars = vars or {}
-        data = {'title': title,
-                'url': url}
-        if images is not None:
-            data['images'] = images
-        if date is not None:
-            data['date'] = date
-        if expire_date is not None:
-            data['expire_date'] = date
-        if location is not None:
-            data['location'] = date
-        if price is not None:
-            data['price'] = price
-        if inventory is not None:
-            data['inventory'] = inventory
-        if description is not None:
-            data['description'] = description
-        if site_name is not None:
-            data['site_name'] = images
-        if author is not None:
-            data['author'] = author
-        if spider:
-            data['spider'] = 1
-        if tags is not None:
-            data['tags'] = ",".join(tags) if isinstance(tags, list) else tags
-        if len(vars) > 0:
-            data['vars'] = vars.copy()
+        data = build_content_data(title, url, images, date, expire_date, description, location, price, tags,
+                                  author, site_name, spider, vars, inventory)
         return self.api_post('content', data)
 
+    def get_catalog_sync(self, index_path, concurrency=8, refresh_after=None):
+        """
+        CatalogSync pushing only the new, changed or stale items of a content catalog through this client,
+        tracking what was pushed in the SQLite file index_path
+        """
+        return CatalogSync(self, index_path, concurrency, refresh_after)
+
     def get_alert(self, email):
         """
         Retrieve a user's alert settings.
@@ -507,6 +601,21 @@ class SailthruClient(object):
             data['extid'] = extid
         return self.api_post('purchase', data)
 
+    def get_purchase_recorder(self, max_batch=500, flush_interval=1.0, concurrency=4, max_pending=10000, on_failure=None):
+        """
+        PurchaseRecorder buffering purchase events from many threads, coalescing incomplete cart updates per email
+        and sending them through this client in the background. Close it to send what is still buffered.
+        """
+        return PurchaseRecorder(self, max_batch, flush_interval, concurrency, max_pending, on_failure)
+
+    def get_outbox(self, directory, workers=4, max_attempts=None, max_pending=None, on_failure=None):
+        """
+        Outbox queuing send, purchase and save_user calls in a durable log under directory and making them through
+        this client in the background, retrying through outages and after a crash. Close it to wait for the queue.
+        """
+        return Outbox(self, directory, workers=workers, max_attempts=max_attempts, max_pending=max_pending,
+                      on_failure=on_failure)
+
     def get_purchase(self, purchase_id, purchase_key='sid'):
         """
         Retrieve information about a purchase using the system's unique ID or a client's ID
@@ -553,13 +662,18 @@ class SailthruClient(object):
         """
         options = options or {}
         data = options.copy()
-        data = {'template': template,
-                'start_date': start_date,
-                'end_date': end_date
-                }
+        data['template'] = template
+        data['start_date'] = start_date
+        data['end_date'] = end_date
         data['stat'] = 'send'
         return self._stats(data)
 
+    def get_stats_exporter(self, concurrency=4, window='day', cache_dir=None, settle_days=2):
+        """
+        StatsExporter fetching send, blast and list stats over date ranges as rows, one per day or week, in parallel
+        """
+        return StatsExporter(self, concurrency, window, cache_dir, settle_days)
+
     def _stats(self, data, headers=None):
         """
         Make Stats API Request
@@ -570,122 +684,90 @@ class SailthruClient(object):
         """
         Returns true if the incoming request is an authenticated verify post.
         """
-        if isinstance(post_params,  dict):
-            required_params = ['action', 'email', 'send_id', 'sig']
-            if not self.check_for_valid_postback_actions(required_params, post_params):
-                return False
-        else:
-            return False
-
-        if post_params['action'] != 'verify':
-            return False
-
-        sig = post_params['sig']
-        post_params = post_params.copy()
-        del post_params['sig']
-
-        if sig != get_signature_hash(post_params, self.secret):
+        post_params = self._check_postback(post_params, 'verify', ['action', 'email', 'send_id', 'sig'])
+        if post_params is None:
             return False
 
         send_response = self.get_send(post_params['send_id'])
-
-        send_json = send_response.get_body()
-        if not isinstance(send_json, dict):
-            return False
-        if send_json.get('email') != post_params['email']:
-            return False
-
-        return True
+        return self._check_verify_send(send_response, post_params)
 
     def receive_update_post(self, post_params):
         """
         Update postbacks
         """
-
-        if isinstance(post_params, dict):
-            required_params = ['action', 'email', 'sig']
-            if not self.check_for_valid_postback_actions(required_params, post_params):
-                return False
-        else:
-            return False
-
-        if post_params['action'] != 'update':
-            return False
-
-        signature = post_params['sig']
-        post_params = post_params.copy()
-        del post_params['sig']
-
-        if signature != get_signature_hash(post_params, self.secret):
-            return False
-
-        return True
+        return self._check_postback(post_params, 'update', ['action', 'email', 'sig']) is not None
 
     def receive_optout_post(self, post_params):
         """
         Optout postbacks
         """
-        if isinstance(post_params,  dict):
-            required_params = ['action', 'email', 'sig']
-            if not self.check_for_valid_postback_actions(required_params, post_params):
-                return False
-        else:
-            return False
+        return self._check_postback(post_params, 'optout', ['action', 'email', 'sig']) is not None
 
-        if post_params['action'] != 'optout':
+    def receive_hardbounce_post(self, post_params):
+        """
+        Hard bounce postbacks
+        """
+        post_params = self._check_postback(post_params, 'hardbounce', ['action', 'email', 'sig'])
+        if post_params is None:
             return False
 
-        signature = post_params['sig']
-        post_params = post_params.copy()
-        del post_params['sig']
+        # for sends
+        if 'send_id' in post_params:
+            send_response = self.get_send(post_params['send_id'])
+            if not self._check_hardbounce_send(send_response):
+                return False
 
-        if signature != get_signature_hash(post_params, self.secret):
-            return False
+        # for blasts
+        if 'blast_id' in post_params:
+            blast_response = self.get_blast(post_params['blast_id'])
+            if not self._check_hardbounce_blast(blast_response):
+                return False
 
         return True
 
-    def receive_hardbounce_post(self, post_params):
+    def _check_postback(self, post_params, action, required_params):
         """
-        Hard bounce postbacks
+        Validates shape, action and signature of a postback.
+        Returns a copy of post_params without 'sig' if the postback is authentic, None otherwise.
         """
-        if isinstance(post_params, dict):
-            required_params = ['action', 'email', 'sig']
-            if not self.check_for_valid_postback_actions(required_params, post_params):
-                return False
-        else:
-            return False
-
-        if post_params['action'] != 'hardbounce':
-            return False
+        if not isinstance(post_params, dict):
+            return None
+        if not self.check_for_valid_postback_actions(required_params, post_params):
+            return None
+        if post_params['action'] != action:
+            return None
 
         signature = post_params['sig']
         post_params = post_params.copy()
         del post_params['sig']
 
         if signature != get_signature_hash(post_params, self.secret):
+            return None
+        return post_params
+
+    def _check_verify_send(self, send_response, post_params):
+        send_json = send_response.get_body()
+        if not isinstance(send_json, dict):
             return False
+        return send_json.get('email') == post_params['email']
 
-        # for sends
-        if 'send_id' in post_params:
-            send_id = post_params['send_id']
-            send_response = self.get_send(send_id)
-            if not send_response.is_ok():
-                return False
-            send_obj = send_response.get_body()
-            if not send_obj or 'email' not in send_obj:
-                return False
+    def _check_hardbounce_send(self, send_response):
+        if not send_response.is_ok():
+            return False
+        send_obj = send_response.get_body()
+        return bool(send_obj) and 'email' in send_obj
 
-        # for blasts
-        if 'blast_id' in post_params:
-            blast_id = post_params['blast_id']
-            blast_response = self.get_blast(blast_id)
-            if not blast_response.is_ok():
-                return False
-            blast_obj = blast_response.get_body()
-            if not blast_obj:
-                return False
+    def _check_hardbounce_blast(self, blast_response):
+        if not blast_response.is_ok():
+            return False
+        return bool(blast_response.get_body())
 
-        return True
+    def get_postback_verifier(self, lookup_ttl=300, lookup_cache_size=10000, concurrency=4):
+        """
+        PostbackVerifier for high volume webhook receivers: signature-only checks, batch verification
+        and cached send / blast lookups made through this client.
+        """
+        return PostbackVerifier(self.secret, self, lookup_ttl, lookup_cache_size, concurrency)
 
     def check_for_valid_postback_actions(self, required_keys, post_params):
         """
@@ -696,14 +778,27 @@ class SailthruClient(object):
                 return False
         return True
 
-    def api_get(self, action, data, headers=None):
+    def api_get(self, action, data, headers=None, stream=False, item_path=None):
         """
         Perform an HTTP GET request, using the shared-secret auth hash.
         @param action: API action call
         @param data: dictionary values
+        @param stream: return a SailthruStreamResponse, which parses the body while it is iterated over instead of
+            reading it whole; the response cache and single flight are bypassed
+        @param item_path: dotted keys of the array or object in the body whose entries are iterated, e.g. 'templates'
         """
+        if stream:
+            return self._stream_api_request(action, data, headers, item_path)
         return self._api_request(action, data, 'GET', headers)
 
+    def _stream_api_request(self, action, data, headers=None, item_path=None):
+        started = time.time()
+        json_payload = self._prepare_json_payload(data)
+        response = self._http_request(action, json_payload, 'GET', headers=headers, sign_time=time.time() - started,
+                                      stream=True)
+        response.item_path = item_path
+        return response
+
     def api_post(self, action, data, binary_data_param=None):
         """
         Perform an HTTP POST request, using the shared-secret auth hash.
@@ -719,26 +814,32 @@ class SailthruClient(object):
     def api_post_multipart(self, action, data, binary_data_param):
         """
         Perform an HTTP Multipart POST request, using the shared-secret auth hash.
+        The multipart keys can hold a file path, a file object, bytes, a memoryview or an iterator of byte chunks;
+        they are streamed to the server, see MultipartEncoder.
         @param action: API action call
         @param data: dictionary values
         @param: binary_data_params: array of multipart keys
         """
-        binary_data = {}
-        data = data.copy()
-
+        data, binary_data = self._split_file_data(data, binary_data_param)
         try:
-            file_handles = []
-            for param in binary_data_param:
-                if param in data:
-                    binary_data[param] = file_handle = open(data[param], 'r')
-                    file_handles.append(file_handle)
-                    del data[param]
+            started = time.time()
             json_payload = self._prepare_json_payload(data)
 
-            return self._http_request(action, json_payload, "POST", binary_data)
+            return self._http_request(action, json_payload, "POST", binary_data, sign_time=time.time() - started)
         finally:
-            for file_handle in file_handles:
-                file_handle.close()
+            if self.response_cache is not None:
+                self.response_cache.invalidate(self.api_key, self.api_url, action)
+
+    def _split_file_data(self, data, binary_data_param):
+        """
+        Move the multipart keys out of data: (other values, {key: file source})
+        """
+        data = data.copy()
+        binary_data = {}
+        for param in binary_data_param:
+            if param in data:
+                binary_data[param] = data.pop(param)
+        return data, binary_data
 
     def api_delete(self, action, data):
         """
@@ -751,31 +852,187 @@ class SailthruClient(object):
     def _api_request(self, action, data, request_type, headers=None):
         """
         Make Request to Sailthru API with given data and api key, format and signature hash
-        """
-        if 'file' in data:
-            file_data = {'file': open(data['file'], 'rb')}
-        else:
-            file_data = None
+        GETs of cached actions are answered from the response cache, writes to them invalidate it.
+        Identical concurrent GETs share one call if the client has a SingleFlight.
+        """
+        cache = self.response_cache
+        if cache is None or not cache.is_cached(action):
+            if request_type == 'GET':
+                return self._get_api_request(action, data, headers)
+            return self._send_api_request(action, data, request_type, headers)
+
+        if request_type == 'GET':
+            key = cache.make_key(self.api_key, self.api_url, action, data)
+            response = cache.get(key)
+            if response is None:
+                response = self._get_api_request(action, data, headers)
+                cache.set(action, key, response)
+            return response
+
+        try:
+            return self._send_api_request(action, data, request_type, headers)
+        finally:
+            cache.invalidate(self.api_key, self.api_url, action)
 
-        return self._http_request(action, self._prepare_json_payload(data), request_type, file_data, headers)
+    def _get_api_request(self, action, data, headers=None):
+        if self.single_flight is None:
+            return self._send_api_request(action, data, 'GET', headers)
+        key = self.single_flight.make_key(self.api_key, action, data, headers)
+        return self.single_flight.do(key, lambda: self._send_api_request(action, data, 'GET', headers), action)
 
-    def _http_request(self, action, data, method, file_data=None, headers=None):
+    def _send_api_request(self, action, data, request_type, headers=None):
+        data, file_data = self._split_file_data(data, ('file',))
+        started = time.time()
+        json_payload = self._prepare_json_payload(data)
+        return self._http_request(action, json_payload, request_type, file_data, headers, time.time() - started)
+
+    def _http_request(self, action, data, method, file_data=None, headers=None, sign_time=None, stream=False):
         url = self.api_url + '/' + action
         file_data = file_data or {}
-        response = sailthru_http_request(url, data, method, file_data, headers, self.request_timeout)
-        if (action in self.last_rate_limit_info):
-            self.last_rate_limit_info[action][method] = response.get_rate_limit_headers()
+        replayable = all(is_replayable(source) for source in file_data.values())
+        positions = self._file_positions(file_data)
+        timeout = self.get_timeout(action)
+        deadline_at = timeout.get_deadline(time.time())
+        attempt = 1
+        while True:
+            started = time.time()
+            if self.rate_limiter is not None:
+                if self.rate_limiter.acquire(action, method, remaining_time(action, deadline_at)) is None:
+                    raise SailthruTimeoutError('deadline of the %s call exceeded waiting for the rate limit' % action)
+            request_timeout = timeout.get_request_timeout(remaining_time(action, deadline_at))
+            event = self._start_event(action, method, data, attempt, started, sign_time)
+            try:
+                response = sailthru_http_request(url, data, method, file_data, headers, request_timeout, self.session,
+                                                 stream)
+            except SailthruClientError as e:
+                self._finish_event(event, error=e)
+                delay = self._get_retry_delay(action, method, attempt, error=e, deadline_at=deadline_at) if replayable else None
+                if delay is None:
+                    raise
+            else:
+                self._record_rate_limit_info(action, method, response)
+                self._finish_event(event, response=response)
+                delay = self._get_retry_delay(action, method, attempt, response=response,
+                                              deadline_at=deadline_at) if replayable else None
+                if delay is None:
+                    return response if stream else self._make_result(response)
+                if stream:
+                    response.close()
+            self.retry_policy.sleep(delay)
+            self._rewind_files(file_data, positions)
+            attempt += 1
+
+    def add_observer(self, observer):
+        """
+        Register a RequestObserver notified before and after every HTTP attempt
+        """
+        self.observers = self.observers + [observer]
+
+    def remove_observer(self, observer):
+        self.observers = [o for o in self.observers if o is not observer]
+
+    def _notify(self, callback, event):
+        for observer in self.observers:
+            method = getattr(observer, callback, None)
+            if method is not None:
+                method(event)
+
+    def _start_event(self, action, method, data, attempt, started, sign_time=None):
+        """
+        RequestEvent of an attempt about to be sent, None when nobody observes the client
+        """
+        if not self.observers:
+            return None
+        now = time.time()
+        timings = {'wait': now - started}
+        if sign_time is not None and attempt == 1:
+            timings['sign'] = sign_time
+        event = RequestEvent(action, method.upper(), payload_size(data), attempt, timings)
+        event.started = started
+        event.sent = now
+        self._notify('before_request', event)
+        return event
+
+    def _finish_event(self, event, response=None, error=None):
+        if event is None:
+            return
+        now = time.time()
+        timings = event.timings
+        timings['network'] = now - event.sent
+        if error is not None:
+            event.error = error
         else:
-            self.last_rate_limit_info[action] = { method : response.get_rate_limit_headers() }
-        return response
+            if not isinstance(response, SailthruStreamResponse):
+                self._observe_decode(event, response)
+            event.status = response.get_status_code()
+            event.rate_limit = response.get_rate_limit_headers()
+        timings['total'] = time.time() - event.started + timings.get('sign', 0)
+        self._notify('on_error' if error is not None else 'after_response', event)
+
+    def _observe_decode(self, event, response):
+        """
+        Time the decoding of the response body in event.timings['decode']: now if it is already decoded, otherwise
+        whenever it is first read, notifying after_decode then. Responses nobody reads are never decoded.
+        """
+        if response.decode_time is not None:
+            event.timings['decode'] = response.decode_time
+            return
+
+        def decoded(seconds):
+            event.timings['decode'] = seconds
+            self._notify('after_decode', event)
+        response.on_decode = decoded
+
+    def get_timeout(self, action):
+        """
+        Timeout of the calls to action: its entry in timeouts, request_timeout otherwise
+        """
+        timeout = self.timeouts.get(action)
+        return Timeout.of(self.request_timeout if timeout is None else timeout)
+
+    def _get_retry_delay(self, action, method, attempt, response=None, error=None, deadline_at=None):
+        """
+        Seconds to wait before retrying a failed attempt, None if it should not be retried
+        or the retry could not start before deadline_at
+        """
+        policy = self.retry_policy
+        if policy is None or not policy.should_retry(action, method, attempt, response, error):
+            return None
+        delay = policy.get_delay(attempt, response)
+        if deadline_at is not None and time.time() + delay >= deadline_at:
+            return None
+        policy.record_retry(action, method, attempt, delay, response, error)
+        return delay
+
+    def _file_positions(self, file_data):
+        """
+        Read positions of the file objects among file_data, to send them again from there on retries
+        """
+        return dict((key, source.tell()) for key, source in file_data.items()
+                    if hasattr(source, 'read') and is_replayable(source))
+
+    def _rewind_files(self, file_data, positions):
+        for key, position in positions.items():
+            file_data[key].seek(position)
+
+    def _make_result(self, response):
+        """
+        What API calls return for response: itself, or its CompactResponse with compact_responses
+        """
+        return CompactResponse.from_response(response) if self.compact_responses else response
+
+    def _record_rate_limit_info(self, action, method, response):
+        rate_limit_info = response.get_rate_limit_headers()
+        self.rate_limit_info.update(action, method, rate_limit_info)
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(action, method, rate_limit_info)
 
     def _prepare_json_payload(self, data):
-        payload = {'api_key': self.api_key,
-                   'format': 'json',
-                   'json': json.dumps(data)}
-        signature = get_signature_hash(payload, self.secret)
-        payload['sig'] = signature
-        return payload
+        json_data = json.dumps(data)
+        return {'api_key': self.api_key,
+                'format': 'json',
+                'json': json_data,
+                'sig': get_payload_signature(self.api_key, json_data, self.secret)}
 
     def get_last_rate_limit_info(self, action, method):
         """
@@ -784,8 +1041,19 @@ class SailthruClient(object):
         :param method: Http method, GET, POST or DELETE
         :return: dict|None
         """
-        method = method.upper()
-        if (action in self.last_rate_limit_info and method in self.last_rate_limit_info[action]):
-            return self.last_rate_limit_info[action][method]
+        return self.rate_limit_info.get(action, method)
+
+    def get_rate_limit_snapshot(self):
+        """
+        Rate limit information of the last call of every endpoint, taken at one point in time
+        :return: dict {action: {method: {limit, remaining, reset}}}
+        """
+        return self.rate_limit_info.snapshot()
+
+    @property
+    def last_rate_limit_info(self):
+        return self.rate_limit_info.snapshot()
 
-        return None
+    @last_rate_limit_info.setter
+    def last_rate_limit_info(self, value):
+        self.rate_limit_info.replace(value)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Names that differ between Python 2 and 3
+"""
+
+import io
+import sys
+
+PY2 = sys.version_info[0] == 2
+
+try:
+    # Python 2: paths and other text may be str or unicode
+    string_types = (basestring,)  # noqa: F821
+    text_type = unicode  # noqa: F821
+except NameError:
+    string_types = (str,)
+    text_type = str
+
+
+def csv_str(value):
+    """
+    value as the csv module takes it: Python 2's writes bytes, so text is encoded to UTF-8 there
+    """
+    if PY2 and isinstance(value, text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def open_csv(path):
+    """
+    File to write CSV to with the csv module: binary on Python 2, UTF-8 text without newline translation on Python 3
+    """
+    if PY2:
+        return open(path, 'wb')
+    return io.open(path, 'w', newline='', encoding='utf-8')
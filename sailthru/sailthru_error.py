@@ -2,3 +2,10 @@
 
 class SailthruClientError(Exception):
     pass
+
+
+class SailthruTimeoutError(SailthruClientError):
+    """
+    Raised when a call cannot end before its deadline
+    """
+    pass
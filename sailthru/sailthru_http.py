@@ -2,8 +2,19 @@
 
 import platform
 import requests
+from requests.adapters import HTTPAdapter
 from .sailthru_error import SailthruClientError
+from .sailthru_multipart import MultipartEncoder
 from .sailthru_response import SailthruResponse
+from .sailthru_stream import SailthruStreamResponse
+
+try:
+    from urllib.parse import quote_plus
+except ImportError:
+    from urllib import quote_plus
+
+# large values are percent-encoded in slices of this many bytes to keep the encoder's temporary objects small
+_QUOTE_CHUNK_SIZE = 65536
 
 def flatten_nested_hash(hash_table):
     """
@@ -27,22 +38,89 @@ def flatten_nested_hash(hash_table):
         return f
     return flatten(hash_table, False)
 
-def sailthru_http_request(url, data, method, file_data=None, headers=None, request_timeout=10):
+def is_flat_hash(hash_table):
+    """
+    True if no value of the dictionary needs flattening
+    """
+    for value in hash_table.values():
+        if isinstance(value, (dict, list)):
+            return False
+    return True
+
+def _quote_form_value(value, parts):
+    if not isinstance(value, bytes):
+        if not isinstance(value, str):
+            value = str(value)
+        value = value.encode('utf-8')
+    for start in range(0, len(value), _QUOTE_CHUNK_SIZE):
+        parts.append(quote_plus(value[start:start + _QUOTE_CHUNK_SIZE]).encode('ascii'))
+
+def encode_form(data):
+    """
+    URL-encode a flat dictionary into an application/x-www-form-urlencoded request body, in one pass.
+    Gives the same body as requests' own encoding, None values are left out, but never holds more than
+    a slice of each value in intermediate form.
+    """
+    parts = []
+    for key, value in data.items():
+        if value is None:
+            continue
+        if parts:
+            parts.append(b'&')
+        _quote_form_value(key, parts)
+        parts.append(b'=')
+        _quote_form_value(value, parts)
+    return b''.join(parts)
+
+def sailthru_http_session(pool_connections=10, pool_maxsize=10, keep_alive=True):
+    """
+    Create a connection-pooled requests.Session for talking to the Sailthru API.
+    The session is safe to share between threads; each thread checks a connection out of the pool.
+    @param pool_connections: number of hosts to keep connection pools for
+    @param pool_maxsize: maximum number of connections kept open per host
+    @param keep_alive: reuse connections between requests, when False every request closes its connection
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+def sailthru_http_request(url, data, method, file_data=None, headers=None, request_timeout=10, session=None, stream=False):
     """
     Perform an HTTP GET / POST / DELETE request
+    When a session is given the request goes through its connection pool, otherwise a one-off connection is used.
+    file_data maps form names to file sources (paths, file objects, bytes, memoryviews or iterators of bytes),
+    POSTed as a streamed multipart body.
+    With stream, the body is left on the connection and a SailthruStreamResponse is returned.
     """
-    data = flatten_nested_hash(data)
+    if not is_flat_hash(data):
+        data = flatten_nested_hash(data)
     method = method.upper()
     params, data = (None, data) if method == 'POST' else (data, None)
     sailthru_headers = {'User-Agent': 'Sailthru API Python Client %s; Python Version: %s' % ('2.4.1', platform.python_version())}
     if headers and isinstance(headers, dict):
-        for key, value in sailthru_headers.items():
-            headers[key] = value
+        # copied, callers may share one headers dictionary between threads
+        headers = dict(headers)
+        headers.update(sailthru_headers)
     else:
         headers = sailthru_headers
+    if data is not None and file_data:
+        # stream the files rather than letting requests read them whole into the multipart body
+        data = MultipartEncoder(data, file_data)
+        headers['Content-Type'] = data.content_type
+        file_data = None
+    elif data is not None:
+        # encode the form body ourselves, in one pass, rather than letting requests copy every value first
+        data = encode_form(data)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    transport = session if session is not None else requests
     try:
-        response = requests.request(method, url, params=params, data=data, files=file_data, headers=headers, timeout=request_timeout)
-        return SailthruResponse(response)
+        response = transport.request(method, url, params=params, data=data, files=file_data, headers=headers,
+                                     timeout=request_timeout, stream=stream)
+        return SailthruStreamResponse(response) if stream else SailthruResponse(response)
     except requests.HTTPError as e:
         raise SailthruClientError(str(e))
     except requests.RequestException as e:
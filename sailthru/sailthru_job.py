@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+import io
+import os
+import tempfile
+import time
+
+import requests
+
+from .sailthru_bulk import require_blocking_client
+from .sailthru_compat import PY2, csv_str, string_types
+from .sailthru_error import SailthruClientError
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+def iter_emails(emails):
+    """
+    Yields email addresses one at a time from a file path (one address per line), a comma separated string
+    or any iterable
+    """
+    if isinstance(emails, string_types) and not os.path.isfile(emails):
+        emails = emails.split(',')
+    if isinstance(emails, string_types):
+        with open(emails, 'r') as email_file:
+            for line in email_file:
+                email = line.strip()
+                if email:
+                    yield email
+    else:
+        for email in emails:
+            email = email.strip()
+            if email:
+                yield email
+
+
+def write_email_files(emails, chunk_size=None, directory=None):
+    """
+    Streams email addresses into temporary files of at most chunk_size addresses each, one address per line.
+    Yields the path of each file once it is complete; the caller deletes it. Only one line is held in memory at a time.
+    @param emails: file path, comma separated string or iterable of email addresses
+    @param chunk_size: maximum addresses per file, everything goes into one file if None
+    @param directory: where to create the files, the system temp directory by default
+    """
+    handle, path = None, None
+    count = 0
+    try:
+        for email in iter_emails(emails):
+            if handle is None:
+                fd, path = tempfile.mkstemp(prefix='sailthru-list-', suffix='.txt', dir=directory)
+                handle = os.fdopen(fd, 'w')
+            handle.write(email)
+            handle.write('\n')
+            count += 1
+            if chunk_size and count == chunk_size:
+                handle.close()
+                handle, count = None, 0
+                yield path
+        if handle is not None:
+            handle.close()
+            handle = None
+            yield path
+    finally:
+        if handle is not None:
+            handle.close()
+            os.remove(path)
+
+
+JOB_FORMATS = ('json', 'csv')
+JOB_PENDING_STATUSES = ('pending', 'queued', 'running')
+
+
+class JobFileWriter(object):
+    """
+    Writes records to a job file on disk as they arrive: newline-delimited JSON (one object per line) or CSV,
+    optionally gzip compressed. Only the current record is held in memory.
+
+    Usage:
+        with JobFileWriter('json', compress=True) as writer:
+            for user in users:
+                writer.write({'email': user.email, 'vars': user.vars})
+        client.get_job_runner().run('update', path=writer.path)
+    """
+    def __init__(self, format='json', fields=None, compress=False, directory=None):
+        """
+        @param format: 'json' for newline-delimited JSON or 'csv'
+        @param fields: CSV columns, the keys of the first record if None; nested values are written as JSON
+        @param compress: gzip the file
+        @param directory: where to create the file, the system temp directory by default
+        """
+        if format not in JOB_FORMATS:
+            raise ValueError('unknown job file format %r, expected one of %s' % (format, ', '.join(JOB_FORMATS)))
+        self.format = format
+        self.fields = list(fields) if fields else None
+        self.compress = compress
+        self.count = 0
+        suffix = '.' + format + ('.gz' if compress else '')
+        fd, self.path = tempfile.mkstemp(prefix='sailthru-job-', suffix=suffix, dir=directory)
+        self._raw = io.open(fd, 'wb')
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode='wb') if compress else None
+        self._stream = io.TextIOWrapper(self._gzip or self._raw, encoding='utf-8', newline='')
+        self._csv = None
+
+    def write(self, record):
+        if self.format == 'json':
+            line = json.dumps(record, separators=(',', ':'))
+            self._stream.write(line.decode('utf-8') if isinstance(line, bytes) else line)
+            self._stream.write(u'\n')
+        else:
+            if self._csv is None:
+                self.fields = self.fields or list(record)
+                # Python 2's csv writes bytes, straight to the (compressed) file under the text stream
+                stream = (self._gzip or self._raw) if PY2 else self._stream
+                self._csv = csv.DictWriter(stream, [csv_str(field) for field in self.fields])
+                self._csv.writeheader()
+            self._csv.writerow(dict((csv_str(key), csv_str(json.dumps(value) if isinstance(value, (dict, list)) else value))
+                                    for key, value in record.items()))
+        self.count += 1
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+        return self
+
+    def close(self):
+        """
+        Flush and close the file, returns its path
+        """
+        if not self._raw.closed:
+            self._stream.close()
+            if self._gzip is not None:
+                self._raw.close()
+        return self.path
+
+    def discard(self):
+        """
+        Close and delete the file
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def write_job_file(records, format='json', fields=None, compress=False, directory=None):
+    """
+    Streams records into a new job file, see JobFileWriter. Returns its path; the caller deletes it.
+    """
+    with JobFileWriter(format, fields, compress, directory) as writer:
+        writer.write_all(records)
+    return writer.path
+
+
+class JobResult(object):
+    """
+    Outcome of a job: the last job status response, with its id, status and any export_url
+    """
+    def __init__(self, response):
+        self.response = response
+        body = response.get_body() if response.is_ok() else None
+        self.body = body if isinstance(body, dict) else {}
+        self.job_id = self.body.get('job_id')
+        self.status = self.body.get('status')
+        self.export_url = self.body.get('export_url')
+
+    def is_pending(self):
+        return self.status in JOB_PENDING_STATUSES
+
+    def is_ok(self):
+        return self.response.is_ok() and self.status == 'completed'
+
+    def get_error(self):
+        return self.response.get_error()
+
+    def iter_export_rows(self, session=None, request_timeout=60):
+        """
+        Downloads the export_url of a completed export job and yields its CSV rows as dicts, as they are read
+        """
+        if not self.export_url:
+            return
+        http = session if session is not None else requests
+        response = http.get(self.export_url, stream=True, timeout=request_timeout)
+        try:
+            response.raise_for_status()
+            lines = (line.decode('utf-8') for line in response.iter_lines())
+            for row in csv.DictReader(lines):
+                yield row
+        except requests.exceptions.RequestException as e:
+            raise SailthruClientError(str(e))
+        finally:
+            response.close()
+
+    def __repr__(self):
+        return '<JobResult job_id=%s status=%s>' % (self.job_id, self.status)
+
+
+class JobRunner(object):
+    """
+    Submits jobs (http://docs.sailthru.com/api/job) with a streamed data file and waits for them to complete,
+    polling the job status with exponential backoff.
+
+    Usage:
+        runner = client.get_job_runner(poll_interval=5, timeout=3600)
+        result = runner.run('update', records=({'id': u.email, 'vars': u.vars} for u in users), compress=True)
+        if not result.is_ok():
+            ...
+    """
+    def __init__(self, client, poll_interval=2, max_poll_interval=60, backoff=2, timeout=3600,
+                 clock=time.time, sleep=time.sleep):
+        """
+        @param client: SailthruClient the jobs are submitted and polled with; AsyncSailthruClient is not supported
+        @param poll_interval: seconds before the first status check
+        @param max_poll_interval: longest wait between two status checks
+        @param backoff: factor the wait grows by after each pending status
+        @param timeout: seconds wait() polls before giving up
+        """
+        require_blocking_client(client, 'JobRunner')
+        self.client = client
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+
+    def submit(self, job, records=None, path=None, format='json', fields=None, compress=False, options=None):
+        """
+        Start a job. Its data file is either an existing file at path or written from records, then uploaded
+        as a multipart 'file' parameter and deleted.
+        @param job: job type, e.g. 'update' or 'import'
+        @param records: iterable of records (dicts) written to a temporary job file, see JobFileWriter
+        @param path: existing data file to upload
+        @param options: other job parameters, e.g. list, report_email or postback_url
+        @return: SailthruResponse of the job POST, carrying the job_id
+        """
+        data = dict(options or {})
+        data['job'] = job
+        if records is None:
+            if path is not None:
+                data['file'] = path
+            return self.client.api_post('job', data)
+
+        data['file'] = path = write_job_file(records, format, fields, compress)
+        try:
+            return self.client.api_post('job', data)
+        finally:
+            os.remove(path)
+
+    def wait(self, job_id):
+        """
+        Poll the status of job_id until it is no longer pending. Polls answered with a 429 or 5xx are retried with
+        the same backoff, other errors (e.g. an unknown job) are returned.
+        @return: JobResult
+        @raise SailthruClientError: the job is still pending after timeout seconds
+        """
+        deadline = self.clock() + self.timeout
+        interval = self.poll_interval
+        while True:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                raise SailthruClientError('job %s still pending after %s seconds' % (job_id, self.timeout))
+            self.sleep(min(interval, remaining))
+            result = JobResult(self.client.get_job(job_id))
+            status_code = result.response.get_status_code()
+            transient = status_code == 429 or status_code >= 500
+            if not transient and not result.is_pending() and (result.status is not None or not result.response.is_ok()):
+                return result
+            interval = min(interval * self.backoff, self.max_poll_interval)
+
+    def run(self, job, records=None, path=None, format='json', fields=None, compress=False, options=None):
+        """
+        submit() a job and wait() for it. A rejected submission is returned as a JobResult without status.
+        """
+        response = self.submit(job, records, path, format, fields, compress, options)
+        result = JobResult(response)
+        if not response.is_ok() or not result.job_id:
+            return result
+        return self.wait(result.job_id)
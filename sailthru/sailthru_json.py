@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Fastest available JSON decoder, chosen once at import: orjson, ujson, simplejson, then the standard library.
+"""
+
+try:
+    import orjson
+
+    JSON_BACKEND = 'orjson'
+
+    def json_loads(content):
+        return orjson.loads(content)
+except ImportError:
+    try:
+        import ujson
+
+        JSON_BACKEND = 'ujson'
+
+        def json_loads(content):
+            return ujson.loads(content)
+    except ImportError:
+        try:
+            import simplejson as json
+            JSON_BACKEND = 'simplejson'
+        except ImportError:
+            import json
+            JSON_BACKEND = 'json'
+
+        def json_loads(content):
+            if isinstance(content, bytes):
+                content = content.decode('utf-8')
+            return json.loads(content)
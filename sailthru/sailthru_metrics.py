@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+import math
+import socket
+import threading
+
+from .sailthru_compat import text_type
+
+
+class RequestEvent(object):
+    """
+    One HTTP attempt of an API call, as seen by observers.
+    timings holds seconds spent in each phase: 'sign' (JSON encoding and signing), 'wait' (rate limiter),
+    'network' (request and response transfer), 'decode' (JSON decoding of the response, set when the body is
+    first read and not part of 'total') and 'total'. payload_size is the size in bytes of the encoded JSON payload.
+    started and sent are the wall clock times the attempt began (before any rate limit wait) and was sent.
+    """
+    def __init__(self, action, method, payload_size=0, attempt=1, timings=None):
+        self.action = action
+        self.method = method
+        self.payload_size = payload_size
+        self.attempt = attempt
+        self.timings = timings if timings is not None else {}
+        self.status = None
+        self.rate_limit = None
+        self.error = None
+        self.started = None
+        self.sent = None
+
+
+class RequestObserver(object):
+    """
+    Base class of client observers, registered with SailthruClient(observers=[...]) or client.add_observer().
+    Callbacks run synchronously on the calling thread and must not raise.
+    """
+    def before_request(self, event):
+        pass
+
+    def after_response(self, event):
+        pass
+
+    def on_error(self, event):
+        pass
+
+    def after_decode(self, event):
+        """
+        Called once the body of the response of event is decoded, with timings['decode'] set; runs on the thread
+        reading the body and never if it is not read
+        """
+        pass
+
+
+def payload_size(data):
+    """
+    Bytes of the JSON payload of an API call's parameters, as sent
+    """
+    payload = data.get('json', b'')
+    if isinstance(payload, text_type):
+        payload = payload.encode('utf-8')
+    return len(payload)
+
+
+class LatencyHistogram(object):
+    """
+    HDR-style histogram: log-linear buckets keeping every recorded value within about
+    1 / 2**precision_bits of its true value, with constant memory whatever the range.
+    Values are recorded in seconds and kept with microsecond resolution.
+    """
+    def __init__(self, precision_bits=5):
+        self.precision_bits = precision_bits
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, micros):
+        if micros < (1 << self.precision_bits):
+            return micros
+        exponent = micros.bit_length() - 1 - self.precision_bits
+        return (micros >> exponent) << exponent
+
+    def record(self, seconds):
+        micros = max(int(seconds * 1e6), 0)
+        bucket = self._bucket(micros)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percent):
+        """
+        Value in seconds below which percent % of the recorded values fall, None if empty
+        """
+        if not self.count:
+            return None
+        rank = max(int(math.ceil(self.count * percent / 100.0)), 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(bucket / 1e6, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class EndpointMetrics(object):
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.network = LatencyHistogram()
+        self.requests = 0
+        self.errors = 0
+        self.statuses = {}
+        self.payload_bytes = 0
+
+
+class MetricsCollector(RequestObserver):
+    """
+    In-process metrics per (action, method): request, error and status counters, payload bytes,
+    and latency histograms of the whole attempt and of the network part.
+
+    Usage:
+        metrics = MetricsCollector()
+        client = SailthruClient(api_key, api_secret, observers=[metrics])
+        ...
+        metrics.get_endpoint('send', 'POST').latency.percentile(99)
+        print(to_prometheus(metrics))
+    """
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def _endpoint(self, event):
+        key = (event.action, event.method)
+        endpoint = self.endpoints.get(key)
+        if endpoint is None:
+            endpoint = self.endpoints[key] = EndpointMetrics()
+        return endpoint
+
+    def after_response(self, event):
+        with self.lock:
+            endpoint = self._endpoint(event)
+            endpoint.requests += 1
+            endpoint.payload_bytes += event.payload_size
+            endpoint.statuses[event.status] = endpoint.statuses.get(event.status, 0) + 1
+            endpoint.latency.record(event.timings.get('total', 0))
+            endpoint.network.record(event.timings.get('network', 0))
+
+    def on_error(self, event):
+        with self.lock:
+            endpoint = self._endpoint(event)
+            endpoint.requests += 1
+            endpoint.errors += 1
+            endpoint.payload_bytes += event.payload_size
+            endpoint.latency.record(event.timings.get('total', 0))
+
+    def get_endpoint(self, action, method):
+        """
+        EndpointMetrics of action/method, None if it was never called
+        """
+        return self.endpoints.get((action, method.upper()))
+
+    def snapshot(self):
+        """
+        Summary of every endpoint: {(action, method): {requests, errors, statuses, payload_bytes, p50, p90, p99, max}}
+        """
+        with self.lock:
+            summary = {}
+            for key, endpoint in self.endpoints.items():
+                summary[key] = {'requests': endpoint.requests,
+                                'errors': endpoint.errors,
+                                'statuses': dict(endpoint.statuses),
+                                'payload_bytes': endpoint.payload_bytes,
+                                'p50': endpoint.latency.percentile(50),
+                                'p90': endpoint.latency.percentile(90),
+                                'p99': endpoint.latency.percentile(99),
+                                'max': endpoint.latency.max}
+            return summary
+
+
+def to_prometheus(collector, prefix='sailthru'):
+    """
+    Render a MetricsCollector in the Prometheus text exposition format
+    """
+    lines = ['# TYPE %s_request_duration_seconds summary' % prefix]
+    responses, errors, payload_bytes = [], [], []
+    with collector.lock:
+        for (action, method), endpoint in sorted(collector.endpoints.items()):
+            labels = 'action="%s",method="%s"' % (action, method)
+            for quantile, percent in ((0.5, 50), (0.9, 90), (0.99, 99)):
+                value = endpoint.latency.percentile(percent)
+                lines.append('%s_request_duration_seconds{%s,quantile="%s"} %.6f' % (prefix, labels, quantile, value or 0))
+            lines.append('%s_request_duration_seconds_sum{%s} %.6f' % (prefix, labels, endpoint.latency.total))
+            lines.append('%s_request_duration_seconds_count{%s} %d' % (prefix, labels, endpoint.latency.count))
+            for status, count in sorted(endpoint.statuses.items()):
+                responses.append('%s_responses_total{%s,status="%s"} %d' % (prefix, labels, status, count))
+            errors.append('%s_request_errors_total{%s} %d' % (prefix, labels, endpoint.errors))
+            payload_bytes.append('%s_request_payload_bytes_total{%s} %d' % (prefix, labels, endpoint.payload_bytes))
+    lines.append('# TYPE %s_responses_total counter' % prefix)
+    lines.extend(responses)
+    lines.append('# TYPE %s_request_errors_total counter' % prefix)
+    lines.extend(errors)
+    lines.append('# TYPE %s_request_payload_bytes_total counter' % prefix)
+    lines.extend(payload_bytes)
+    return '\n'.join(lines) + '\n'
+
+
+class StatsdObserver(RequestObserver):
+    """
+    Observer sending one StatsD timer per phase and a counter per response status or error, over UDP.
+
+    Usage:
+        client.add_observer(StatsdObserver('statsd.local', 8125, prefix='myapp.sailthru'))
+    """
+    def __init__(self, host='127.0.0.1', port=8125, prefix='sailthru', send=None):
+        """
+        @param send: callable taking each encoded metric line, replaces the UDP socket (e.g. in tests)
+        """
+        self.prefix = prefix
+        if send is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            address = (host, port)
+            send = lambda line: sock.sendto(line, address)
+        self.send = send
+
+    def _emit(self, line):
+        try:
+            self.send(line.encode('utf-8'))
+        except (socket.error, OSError):
+            pass
+
+    def _timers(self, name, event):
+        for phase, seconds in sorted(event.timings.items()):
+            self._emit('%s.%s.%s:%.3f|ms' % (self.prefix, name, phase, seconds * 1000))
+
+    def after_response(self, event):
+        name = '%s.%s' % (event.action, event.method.lower())
+        self._timers(name, event)
+        self._emit('%s.%s.status.%s:1|c' % (self.prefix, name, event.status))
+
+    def on_error(self, event):
+        name = '%s.%s' % (event.action, event.method.lower())
+        self._timers(name, event)
+        self._emit('%s.%s.error:1|c' % (self.prefix, name))
+
+    def after_decode(self, event):
+        self._emit('%s.%s.%s.decode:%.3f|ms' % (self.prefix, event.action, event.method.lower(), event.timings['decode'] * 1000))
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import uuid
+
+from .sailthru_compat import string_types
+from .sailthru_error import SailthruClientError
+
+# files and buffers are sent in slices of this many bytes
+MULTIPART_CHUNK_SIZE = 65536
+
+
+def is_replayable(source):
+    """
+    True if a multipart file source can be sent again, e.g. when a request is retried
+    """
+    if isinstance(source, string_types + (bytes, bytearray, memoryview)):
+        return True
+    if hasattr(source, 'read'):
+        try:
+            return source.seekable()
+        except AttributeError:
+            return hasattr(source, 'seek')
+    return False
+
+
+def source_length(source):
+    """
+    Number of bytes a multipart file source will send, None if it cannot be known before reading it
+    """
+    if isinstance(source, string_types):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if isinstance(source, memoryview):
+        return source.nbytes if hasattr(source, 'nbytes') else len(source) * source.itemsize
+    if hasattr(source, 'read') and not isinstance(source, io.TextIOBase):
+        try:
+            return os.fstat(source.fileno()).st_size - source.tell()
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            pass
+        try:
+            position = source.tell()
+            end = source.seek(0, os.SEEK_END)
+            source.seek(position)
+            return end - position
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            pass
+    return None
+
+
+def source_filename(name, source):
+    if isinstance(source, string_types):
+        return os.path.basename(source)
+    filename = getattr(source, 'name', None)
+    if isinstance(filename, string_types):
+        return os.path.basename(filename)
+    return name
+
+
+def _quote_header(value):
+    return ('%s' % (value,)).replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, string_types):
+        value = str(value)
+    return value.encode('utf-8')
+
+
+class MultipartEncoder(object):
+    """
+    Streams a multipart/form-data body: form fields followed by file parts read in MULTIPART_CHUNK_SIZE slices,
+    so memory use does not depend on the size of the files.
+
+    File sources can be a path (opened in binary mode for each send and closed afterwards), a file object,
+    bytes, a bytearray, a memoryview or an iterator of byte chunks (on Python 2, where bytes is str, a str is a path). When the size of every source is known
+    `len` is the length of the body and it is sent with a Content-Length, otherwise it is sent chunked.
+    Iterating again sends the body again; file objects are read from the position they had when the encoder
+    was created, iterator sources can only be sent once.
+
+    Usage:
+        body = MultipartEncoder({'json': payload}, {'file': '/path/to/users.json'})
+        session.post(url, data=body, headers={'Content-Type': body.content_type})
+    """
+    def __init__(self, fields, files, boundary=None, chunk_size=MULTIPART_CHUNK_SIZE):
+        """
+        @param fields: flat dictionary of form values, None values are left out
+        @param files: dictionary of file sources by form name
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.content_type = 'multipart/form-data; boundary=' + self.boundary
+        self._consumed = False
+        self._reader = None
+        self._pending = b''
+
+        delimiter = b'--' + self.boundary.encode('ascii') + b'\r\n'
+        self.fields = []
+        for key, value in fields.items():
+            if value is None:
+                continue
+            header = 'Content-Disposition: form-data; name="%s"\r\n\r\n' % _quote_header(key)
+            self.fields.append(delimiter + header.encode('utf-8') + _to_bytes(value) + b'\r\n')
+
+        self.files = []
+        for name, source in files.items():
+            header = ('Content-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: application/octet-stream\r\n\r\n'
+                      % (_quote_header(name), _quote_header(source_filename(name, source))))
+            start = source.tell() if hasattr(source, 'read') and is_replayable(source) else None
+            self.files.append((delimiter + header.encode('utf-8'), source, start))
+        self.closing = b'--' + self.boundary.encode('ascii') + b'--\r\n'
+
+        self.len = sum(len(field) for field in self.fields) + len(self.closing)
+        for header, source, start in self.files:
+            length = source_length(source)
+            if length is None:
+                self.len = None
+                break
+            self.len += len(header) + length + 2
+
+    def __iter__(self):
+        if self._consumed and not all(is_replayable(source) for header, source, start in self.files):
+            raise SailthruClientError('multipart body with an iterator source can only be sent once')
+        self._consumed = True
+        for field in self.fields:
+            yield field
+        for header, source, start in self.files:
+            yield header
+            for chunk in self._read(source, start):
+                yield chunk
+            yield b'\r\n'
+        yield self.closing
+
+    def read(self, size=-1):
+        """
+        Read the body like a file, for HTTP libraries that send file objects but not iterables (Python 2's httplib)
+        """
+        if self._reader is None:
+            self._reader = iter(self)
+        chunks = [self._pending]
+        length = len(self._pending)
+        while size is None or size < 0 or length < size:
+            chunk = next(self._reader, None)
+            if chunk is None:
+                break
+            chunk = chunk.tobytes() if isinstance(chunk, memoryview) else bytes(chunk)
+            chunks.append(chunk)
+            length += len(chunk)
+        data = b''.join(chunks)
+        if size is None or size < 0:
+            self._pending = b''
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+    def _read(self, source, start):
+        chunk_size = self.chunk_size
+        if isinstance(source, string_types):
+            with open(source, 'rb') as file_handle:
+                for chunk in iter(lambda: file_handle.read(chunk_size), b''):
+                    yield chunk
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            view = memoryview(source)
+            if hasattr(view, 'cast'):
+                # count bytes, whatever the item size of the buffer (Python 2 memoryviews have no cast)
+                view = view.cast('B')
+            for offset in range(0, len(view), chunk_size):
+                yield view[offset:offset + chunk_size]
+        elif hasattr(source, 'read'):
+            if start is not None:
+                source.seek(start)
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                yield _to_bytes(chunk)
+        else:
+            for chunk in source:
+                if chunk:
+                    yield _to_bytes(chunk) if not isinstance(chunk, (bytearray, memoryview)) else chunk
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from .sailthru_bulk import require_blocking_client
+from .sailthru_error import SailthruClientError
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+def _segment_name(number):
+    return 'outbox-%012d.log' % number
+
+
+def _parse_line(line):
+    try:
+        record = json.loads(line.decode('utf-8'))
+    except ValueError:
+        # a line torn by a crash in the middle of a write
+        return None
+    return record if isinstance(record, dict) else None
+
+
+class OutboxEntry(object):
+    """
+    One queued API call: client.<action>(**args), ordered after every earlier call with the same key (email or user id)
+    """
+    def __init__(self, entry_id, action, key, args, segment):
+        self.id = entry_id
+        self.action = action
+        self.key = key
+        self.args = args
+        self.segment = segment
+        self.attempts = 0
+
+    def __repr__(self):
+        return '<OutboxEntry id=%d action=%s key=%s>' % (self.id, self.action, self.key)
+
+
+class Outbox(object):
+    """
+    Durable queue of send, purchase and save_user calls that survives API outages and process crashes.
+
+    Calls are appended to a log of segment files in `directory`; concurrent callers share one fsync
+    every fsync_interval seconds and return once their call is on disk. Background workers replay the log
+    through the client: calls with the same email / user id go to the same worker and are made in the order
+    they were queued, failures other than 4xx errors are retried with capped exponential backoff until they
+    succeed, and the client's rate limiter paces them. Completed calls are acknowledged in the log, and
+    segments whose calls are all acknowledged are deleted. After a crash, a new Outbox on the same directory
+    makes the calls that were not acknowledged (delivery is at least once).
+
+    At most workers * queue_size calls are held in memory; during a long outage the backlog stays on disk.
+
+    Usage:
+        with client.get_outbox('/var/spool/sailthru') as outbox:
+            outbox.send('welcome', 'praj@sailthru.com', {'name': 'Praj'})
+            outbox.purchase('praj@sailthru.com', items)
+    """
+    def __init__(self, client, directory, workers=4, queue_size=100, fsync_interval=0.01, segment_size=16 * 1024 * 1024,
+                 backoff_base=0.5, backoff_cap=60, max_attempts=None, max_pending=None, on_failure=None):
+        """
+        @param client: SailthruClient making the calls
+        @param directory: where the log is kept, created if missing; one Outbox at a time per directory
+        @param workers: calls in flight at once
+        @param queue_size: calls held in memory per worker
+        @param fsync_interval: seconds queued calls are gathered for before one fsync makes them durable
+        @param segment_size: bytes after which a new log segment is started
+        @param backoff_base: seconds before the first retry, doubled after each failed attempt
+        @param backoff_cap: longest wait between two attempts
+        @param max_attempts: attempts before a call is given up, retried until it succeeds if None
+        @param max_pending: calls queued and not completed above which queuing raises SailthruClientError
+        @param on_failure: callback(entry, response, error) for calls rejected by the API, given up, or raising
+            an error other than SailthruClientError; errors it raises are ignored
+        """
+        require_blocking_client(client, 'Outbox')
+        self.client = client
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.segment_size = segment_size
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self.on_failure = on_failure
+
+        self.lock = threading.Condition()
+        self.stopping = threading.Event()
+        # closed: no more calls are accepted; stopped: close() has finished
+        self.closed = False
+        self.stopped = False
+        self.segments = OrderedDict()
+        self.pending = 0
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.dirty = False
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.acked = set()
+        self.last_id = self._recover()
+        self.durable_id = self.last_id
+
+        self.segment = (max(self.segments) if self.segments else 0) + 1
+        self.segments[self.segment] = 0
+        self.file = open(self._path(self.segment), 'ab')
+        self.flushed = (self.segment, 0)
+        self.cursor = (min(self.segments), 0)
+
+        self.queues = [queue.Queue(queue_size) for i in range(workers)]
+        self.threads = [threading.Thread(target=self._flusher, name='sailthru-outbox-flusher'),
+                        threading.Thread(target=self._dispatcher, name='sailthru-outbox-dispatcher')]
+        self.threads.extend(threading.Thread(target=self._worker, args=(work_queue,), name='sailthru-outbox-worker')
+                            for work_queue in self.queues)
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, _segment_name(segment))
+
+    def _recover(self):
+        """
+        Scan the existing segments: count their calls not acknowledged yet and return the last id used
+        """
+        numbers = sorted(int(name[7:-4]) for name in os.listdir(self.directory)
+                         if name.startswith('outbox-') and name.endswith('.log'))
+        ranges = []
+        last_id = 0
+        for number in numbers:
+            first, count = None, 0
+            with open(self._path(number), 'rb') as segment:
+                for line in segment:
+                    record = _parse_line(line)
+                    if record is None:
+                        continue
+                    if 'ack' in record:
+                        self.acked.add(record['ack'])
+                    else:
+                        first = record['id'] if first is None else first
+                        last_id = max(last_id, record['id'])
+                        count += 1
+            ranges.append((number, first, last_id, count))
+        for number, first, last, count in ranges:
+            if first is not None:
+                count -= sum(1 for entry_id in self.acked if first <= entry_id <= last)
+            self.segments[number] = count
+            self.pending += count
+        return last_id
+
+    def send(self, template, email, _vars=None, options=None, schedule_time=None, limit=None):
+        """
+        Queue SailthruClient.send
+        @return: id of the queued call
+        """
+        return self._append('send', email, {'template': template, 'email': email, '_vars': _vars, 'options': options,
+                                            'schedule_time': schedule_time, 'limit': limit})
+
+    def purchase(self, email, items=None, incomplete=None, message_id=None, options=None, extid=None):
+        """
+        Queue SailthruClient.purchase
+        @return: id of the queued call
+        """
+        return self._append('purchase', email, {'email': email, 'items': items, 'incomplete': incomplete,
+                                                'message_id': message_id, 'options': options, 'extid': extid})
+
+    def save_user(self, idvalue, options=None):
+        """
+        Queue SailthruClient.save_user
+        @return: id of the queued call
+        """
+        return self._append('save_user', idvalue, {'idvalue': idvalue, 'options': options})
+
+    def _append(self, action, key, args):
+        with self.lock:
+            if self.closed:
+                raise SailthruClientError('Outbox is closed')
+            if self.max_pending is not None and self.pending >= self.max_pending:
+                raise SailthruClientError('Outbox is full: %d calls pending' % self.pending)
+            self.last_id += 1
+            entry_id = self.last_id
+            self._write({'id': entry_id, 'action': action, 'key': key, 'args': args})
+            self.segments[self.segment] += 1
+            self.pending += 1
+            self.enqueued += 1
+            while self.durable_id < entry_id:
+                self.lock.wait()
+            return entry_id
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+        if not self.dirty:
+            self.dirty = True
+            self.lock.notify_all()
+
+    def _sync(self):
+        """
+        Make everything written so far durable and visible to the dispatcher. Called with the lock held.
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.dirty = False
+        self.durable_id = self.last_id
+        self.flushed = (self.segment, self.file.tell())
+        if self.flushed[1] >= self.segment_size:
+            self.file.close()
+            self.segment += 1
+            self.segments[self.segment] = 0
+            self.file = open(self._path(self.segment), 'ab')
+            self.flushed = (self.segment, 0)
+        self.lock.notify_all()
+
+    def _flusher(self):
+        while True:
+            with self.lock:
+                while not self.dirty and not self.stopping.is_set():
+                    self.lock.wait()
+                if not self.dirty:
+                    return
+            # let more callers join this fsync
+            time.sleep(self.fsync_interval)
+            with self.lock:
+                self._sync()
+
+    def _dispatcher(self):
+        reader, reader_segment = None, None
+        try:
+            while True:
+                with self.lock:
+                    while self.cursor >= self.flushed and not self.stopping.is_set():
+                        self.lock.wait()
+                    if self.stopping.is_set():
+                        return
+                    segment, offset = self.cursor
+                    flushed_segment, flushed_offset = self.flushed
+                    next_segment = min(number for number in self.segments if number > segment) \
+                        if segment < flushed_segment else None
+
+                if reader_segment != segment:
+                    if reader is not None:
+                        reader.close()
+                    reader, reader_segment = open(self._path(segment), 'rb'), segment
+                    reader.seek(offset)
+                data = reader.read() if next_segment is not None else reader.read(flushed_offset - offset)
+                for line in data.splitlines():
+                    record = _parse_line(line)
+                    if record is None or 'ack' in record:
+                        continue
+                    if record['id'] in self.acked:
+                        self.acked.discard(record['id'])
+                        continue
+                    entry = OutboxEntry(record['id'], record['action'], record['key'], record['args'], segment)
+                    if not self._dispatch(entry):
+                        return
+                with self.lock:
+                    self.cursor = (next_segment, 0) if next_segment is not None else (segment, offset + len(data))
+                    self._delete_segments()
+        finally:
+            if reader is not None:
+                reader.close()
+
+    def _dispatch(self, entry):
+        work_queue = self.queues[zlib.crc32(str(entry.key).encode('utf-8')) % len(self.queues)]
+        while not self.stopping.is_set():
+            try:
+                work_queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _worker(self, work_queue):
+        while not self.stopping.is_set():
+            try:
+                entry = work_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                delivered = self._deliver(entry)
+            except Exception:
+                # never leave an entry unacknowledged: it would hold back pending, wait() and close()
+                delivered = True
+            if delivered:
+                self._ack(entry)
+
+    def _deliver(self, entry):
+        """
+        Make the call of entry until it succeeds, is rejected or is given up.
+        @return: False if the outbox stopped first, leaving the call to be made again later
+        """
+        while not self.stopping.is_set():
+            entry.attempts += 1
+            response, error = None, None
+            try:
+                response = getattr(self.client, entry.action)(**entry.args)
+                if response.is_ok():
+                    with self.lock:
+                        self.sent += 1
+                    return True
+                status = response.get_status_code()
+                retryable = status == 429 or status >= 500
+            except SailthruClientError as e:
+                error = e
+                retryable = True
+            except Exception as e:
+                # not an API or connection failure: making the call again would fail the same way
+                error = e
+                retryable = False
+
+            if not retryable or (self.max_attempts is not None and entry.attempts >= self.max_attempts):
+                with self.lock:
+                    self.failed += 1
+                if self.on_failure is not None:
+                    try:
+                        self.on_failure(entry, response, error)
+                    except Exception:
+                        # a failing callback must not stop the worker and stall the calls queued after this one
+                        pass
+                return True
+
+            with self.lock:
+                self.retries += 1
+            delay = min(self.backoff_cap, self.backoff_base * 2 ** (entry.attempts - 1))
+            if self.stopping.wait(delay * (0.5 + random.random() / 2)):
+                return False
+        return False
+
+    def _ack(self, entry):
+        with self.lock:
+            self._write({'ack': entry.id})
+            self.segments[entry.segment] -= 1
+            self.pending -= 1
+            self._delete_segments()
+            self.lock.notify_all()
+
+    def _delete_segments(self):
+        """
+        Delete the oldest segments once every call in them is acknowledged and the dispatcher is past them.
+        Called with the lock held.
+        """
+        for number in list(self.segments):
+            if number >= self.cursor[0] or number == self.segment or self.segments[number] > 0:
+                return
+            del self.segments[number]
+            os.remove(self._path(number))
+
+    def wait(self, timeout=None):
+        """
+        Wait until every queued call is completed.
+        @return: False if calls are still pending after timeout seconds
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.lock:
+            while self.pending > 0:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.lock.wait(remaining)
+            return True
+
+    def close(self, drain=True, timeout=None):
+        """
+        Stop accepting calls and stop the workers. With drain, first wait (up to timeout seconds) for the queued
+        calls to complete; calls still pending stay in the log and are made by the next Outbox on the directory.
+        Closing again does nothing.
+        """
+        with self.lock:
+            if self.stopped:
+                return
+            self.closed = True
+        if drain:
+            self.wait(timeout)
+        with self.lock:
+            self.stopping.set()
+            self.lock.notify_all()
+        for thread in self.threads:
+            thread.join()
+        with self.lock:
+            # a concurrent close() may have finished first
+            if not self.stopped:
+                self.stopped = True
+                self._sync()
+                self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_metrics(self):
+        """
+        Counters: {enqueued, sent, failed, retries, pending, in_memory, segments}
+        """
+        with self.lock:
+            return {'enqueued': self.enqueued,
+                    'sent': self.sent,
+                    'failed': self.failed,
+                    'retries': self.retries,
+                    'pending': self.pending,
+                    'in_memory': sum(work_queue.qsize() for work_queue in self.queues),
+                    'segments': len(self.segments)}
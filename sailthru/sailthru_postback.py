@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from .sailthru_bulk import BulkResults, require_blocking_client
+from .sailthru_error import SailthruClientError
+from .sailthru_signature import get_signature_hash
+
+POSTBACK_REQUIRED_PARAMS = {
+    'verify': ('action', 'email', 'send_id', 'sig'),
+    'update': ('action', 'email', 'sig'),
+    'optout': ('action', 'email', 'sig'),
+    'hardbounce': ('action', 'email', 'sig'),
+}
+
+
+def _is_ok(response):
+    return response.is_ok()
+
+
+class LookupCache(object):
+    """
+    TTL and size bounded cache of send / blast lookups. PostbackVerifier only caches successful responses.
+    Concurrent lookups of the same id wait for a single API call instead of each making their own, and get its
+    value or its exception.
+    """
+    def __init__(self, ttl=300, maxsize=10000, clock=time.time):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, fetch, cacheable=None):
+        """
+        Cached value of key, calling fetch() to load it on a miss
+        @param cacheable: predicate on fetched values; values it rejects (e.g. error responses) are shared with the
+            lookups waiting for them but not cached
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                self.misses += 1
+                call = self.in_flight[key] = (threading.Event(), [])
+            else:
+                self.hits += 1
+
+        event, outcome = call
+        if not leader:
+            event.wait()
+            if not outcome:
+                # the leading call was interrupted without an outcome, elect a new leader
+                return self.get(key, fetch, cacheable)
+            value, error = outcome[0]
+            if error is not None:
+                raise error
+            return value
+
+        try:
+            try:
+                value = fetch()
+            except Exception as e:
+                # waiting lookups get the same error instead of each calling fetch() in turn
+                outcome.append((None, e))
+                raise
+            outcome.append((value, None))
+            if cacheable is None or cacheable(value):
+                with self.lock:
+                    # re-inserting keeps the dict in expiry order, so eviction drops the oldest entries
+                    self.entries.pop(key, None)
+                    self.entries[key] = (self.clock() + self.ttl, value)
+                    while len(self.entries) > self.maxsize:
+                        self.entries.popitem(last=False)
+            return value
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            event.set()
+
+
+class PostbackVerifier(object):
+    """
+    Fast verification of Sailthru postbacks (verify, update, optout and hardbounce) for webhook receivers.
+
+    verify_signature() checks shape, action and signature only and never calls the API.
+    verify() additionally confirms verify / hardbounce postbacks against the send or blast they reference,
+    the way SailthruClient.receive_*_post do, but through a shared TTL cache so a burst of hardbounces
+    for one blast makes a single get_blast call.
+    verify_many() checks a batch, looking up each distinct send / blast id once, concurrently.
+
+    Usage:
+        verifier = client.get_postback_verifier(lookup_ttl=600)
+        if verifier.verify(request.form.to_dict(), 'hardbounce', lookup=True):
+            ...
+    """
+    def __init__(self, secret, client=None, lookup_ttl=300, lookup_cache_size=10000, concurrency=4, clock=time.time):
+        """
+        @param secret: API secret the postbacks are signed with
+        @param client: SailthruClient used for send / blast lookups, only needed with lookup=True
+        @param lookup_ttl: seconds a send / blast lookup is reused
+        @param lookup_cache_size: maximum number of cached lookups
+        @param concurrency: parallel lookups made by verify_many
+        """
+        self.secret = secret
+        if client is not None:
+            require_blocking_client(client, 'PostbackVerifier')
+        self.client = client
+        self.concurrency = concurrency
+        self.lookups = LookupCache(lookup_ttl, lookup_cache_size, clock)
+
+    def verify_signature(self, post_params, action=None):
+        """
+        True if post_params is a well formed postback of the given action (any known action if None) with a valid signature
+        """
+        if not isinstance(post_params, dict):
+            return False
+        postback_action = post_params.get('action')
+        if action is not None and postback_action != action:
+            return False
+        required_params = POSTBACK_REQUIRED_PARAMS.get(postback_action)
+        if required_params is None:
+            return False
+        for key in required_params:
+            if key not in post_params:
+                return False
+
+        signature = post_params['sig']
+        # the signature covers every value but 'sig' itself; a list of values signs the same as the dict
+        expected = get_signature_hash([value for key, value in post_params.items() if key != 'sig'], self.secret)
+        try:
+            return hmac.compare_digest(expected, signature)
+        except TypeError:
+            return False
+
+    def verify(self, post_params, action=None, lookup=False):
+        """
+        True if post_params is an authentic postback.
+        @param action: expected postback action, any known action if None
+        @param lookup: also confirm verify / hardbounce postbacks against the referenced send or blast
+        @raise SailthruClientError: lookup=True on a verifier without a client
+        """
+        if lookup:
+            self._require_client()
+        if not self.verify_signature(post_params, action):
+            return False
+        if lookup:
+            return self._verify_lookup(post_params)
+        return True
+
+    def verify_many(self, postbacks, action=None, lookup=False):
+        """
+        Verify a batch of postbacks.
+        With lookup=True each distinct send / blast id is looked up once, with up to `concurrency` lookups in flight.
+        @return: list of booleans, in input order
+        @raise SailthruClientError: lookup=True on a verifier without a client
+        """
+        if lookup:
+            self._require_client()
+        postbacks = list(postbacks)
+        valid = [self.verify_signature(post_params, action) for post_params in postbacks]
+        if not lookup:
+            return valid
+
+        # ids can mix types (e.g. int and str), so they are kept in first seen order rather than sorted
+        keys, seen = [], set()
+        for post_params, ok in zip(postbacks, valid):
+            if ok:
+                for key in self._lookup_keys(post_params):
+                    if key not in seen:
+                        seen.add(key)
+                        keys.append(key)
+        # responses of this batch, uncached errors included, so that each id is looked up once
+        responses = {}
+        failed = set()
+        for result in BulkResults(self._lookup, keys, self.concurrency):
+            if result.error is not None:
+                failed.add(result.item)
+            else:
+                responses[result.item] = result.response
+
+        return [ok and failed.isdisjoint(self._lookup_keys(post_params)) and self._verify_lookup(post_params, responses)
+                for post_params, ok in zip(postbacks, valid)]
+
+    def lookup_send(self, send_id):
+        """
+        Cached get_send response
+        """
+        return self._lookup(('send', send_id))
+
+    def lookup_blast(self, blast_id):
+        """
+        Cached get_blast response
+        """
+        return self._lookup(('blast', blast_id))
+
+    def get_metrics(self):
+        """
+        Lookup cache counters: {hits, misses, size}
+        """
+        with self.lookups.lock:
+            return {'hits': self.lookups.hits, 'misses': self.lookups.misses, 'size': len(self.lookups.entries)}
+
+    def _require_client(self):
+        if self.client is None:
+            raise SailthruClientError('PostbackVerifier needs a client for lookups, create it with client.get_postback_verifier()')
+
+    def _lookup(self, key):
+        kind, object_id = key
+        # a 429 or 5xx must not fail every postback of the send / blast for lookup_ttl seconds
+        if kind == 'send':
+            return self.lookups.get(key, lambda: self.client.get_send(object_id), _is_ok)
+        return self.lookups.get(key, lambda: self.client.get_blast(object_id), _is_ok)
+
+    def _lookup_keys(self, post_params):
+        action = post_params['action']
+        if action == 'verify':
+            return [('send', post_params['send_id'])]
+        if action == 'hardbounce':
+            keys = []
+            if 'send_id' in post_params:
+                keys.append(('send', post_params['send_id']))
+            if 'blast_id' in post_params:
+                keys.append(('blast', post_params['blast_id']))
+            return keys
+        return []
+
+    def _verify_lookup(self, post_params, responses=None):
+        def lookup(key):
+            response = responses.get(key) if responses is not None else None
+            return response if response is not None else self._lookup(key)
+
+        action = post_params['action']
+        if action == 'verify':
+            send_json = lookup(('send', post_params['send_id'])).get_body()
+            return isinstance(send_json, dict) and send_json.get('email') == post_params['email']
+
+        if action == 'hardbounce':
+            if 'send_id' in post_params:
+                send_response = lookup(('send', post_params['send_id']))
+                if not send_response.is_ok():
+                    return False
+                send_obj = send_response.get_body()
+                if not send_obj or 'email' not in send_obj:
+                    return False
+            if 'blast_id' in post_params:
+                blast_response = lookup(('blast', post_params['blast_id']))
+                if not blast_response.is_ok() or not blast_response.get_body():
+                    return False
+
+        return True
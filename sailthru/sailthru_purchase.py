@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .sailthru_bulk import BulkResults, require_blocking_client
+from .sailthru_error import SailthruClientError
+
+logger = logging.getLogger(__name__)
+
+
+def is_cart_update(incomplete):
+    return incomplete in (1, '1')
+
+
+class PurchaseRecorder(object):
+    """
+    Buffers purchase events from any number of threads and sends them in the background.
+
+    Incomplete cart updates (incomplete=1) are coalesced per email, so only the latest state of each cart
+    is sent; a completed purchase drops the pending cart update of its email, which it supersedes.
+    The buffer is flushed every flush_interval seconds or as soon as it holds max_batch events, through
+    at most `concurrency` calls in flight. Events of one email are always sent in the order they were recorded.
+    record() blocks while max_pending events are waiting, and close() sends everything still buffered.
+
+    Usage:
+        with client.get_purchase_recorder(flush_interval=2) as recorder:
+            recorder.record('praj@sailthru.com', cart_items, incomplete=1)
+            ...
+        recorder.get_metrics()['coalescing_ratio']
+    """
+    def __init__(self, client, max_batch=500, flush_interval=1.0, concurrency=4, max_pending=10000, on_failure=None):
+        """
+        @param client: SailthruClient the purchases are sent with
+        @param max_batch: number of buffered events that triggers a flush
+        @param flush_interval: longest time in seconds an event waits in the buffer
+        @param concurrency: purchase calls in flight at once
+        @param max_pending: buffered events above which record() waits for a flush
+        @param on_failure: callback(event, response, error) for every purchase that failed; event holds the purchase() arguments
+        """
+        require_blocking_client(client, 'PurchaseRecorder')
+        self.client = client
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.on_failure = on_failure
+
+        self.pending = OrderedDict()
+        self.lock = threading.Condition()
+        self._sequence = itertools.count()
+        self._flush_requested = False
+        self._closed = False
+        self._batches_taken = 0
+        self._batches_sent = 0
+
+        self.recorded = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.flushes = 0
+
+        self.thread = threading.Thread(target=self._run, name='sailthru-purchase-recorder')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, email, items=None, incomplete=None, message_id=None, options=None, extid=None):
+        """
+        Buffer a purchase or cart update, takes the arguments of SailthruClient.purchase
+        """
+        event = {'email': email, 'items': items, 'incomplete': incomplete,
+                 'message_id': message_id, 'options': options, 'extid': extid}
+        with self.lock:
+            while len(self.pending) >= self.max_pending and not self._closed:
+                self._request_flush()
+                self.lock.wait()
+            if self._closed:
+                raise SailthruClientError('PurchaseRecorder is closed')
+
+            self.recorded += 1
+            if self.pending.pop(('cart', email), None) is not None:
+                self.coalesced += 1
+            if is_cart_update(incomplete):
+                self.pending[('cart', email)] = event
+            else:
+                self.pending[('purchase', next(self._sequence))] = event
+            if len(self.pending) >= self.max_batch:
+                self._request_flush()
+
+    def flush(self):
+        """
+        Send every event recorded so far and wait until they are sent
+        """
+        with self.lock:
+            batch = self._batches_taken + 1
+            self._request_flush()
+            while self._batches_sent < batch and self.thread.is_alive():
+                self.lock.wait()
+
+    def close(self):
+        """
+        Send the buffered events and stop the background thread. Further record() calls raise SailthruClientError.
+        """
+        with self.lock:
+            self._closed = True
+            self.lock.notify_all()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_metrics(self):
+        """
+        Counters: {recorded, coalesced, sent, failed, queue_depth, in_flight, flushes, coalescing_ratio}
+        coalescing_ratio is the share of recorded events that were merged away instead of sent.
+        """
+        with self.lock:
+            return {'recorded': self.recorded,
+                    'coalesced': self.coalesced,
+                    'sent': self.sent,
+                    'failed': self.failed,
+                    'queue_depth': len(self.pending),
+                    'in_flight': self.in_flight,
+                    'flushes': self.flushes,
+                    'coalescing_ratio': float(self.coalesced) / self.recorded if self.recorded else 0.0}
+
+    def _request_flush(self):
+        self._flush_requested = True
+        self.lock.notify_all()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                deadline = time.time() + self.flush_interval
+                while not self._flush_requested and not self._closed:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.lock.wait(remaining)
+                batch, self.pending = self.pending, OrderedDict()
+                self._flush_requested = False
+                self._batches_taken += 1
+                self.in_flight = len(batch)
+                closing = self._closed
+                # wake up producers waiting for room in the buffer
+                self.lock.notify_all()
+
+            try:
+                if batch:
+                    self._send(batch)
+            finally:
+                with self.lock:
+                    self._batches_sent += 1
+                    self.in_flight = 0
+                    if batch:
+                        self.flushes += 1
+                    self.lock.notify_all()
+            if closing and not batch:
+                return
+
+    def _send(self, batch):
+        by_email = OrderedDict()
+        for event in batch.values():
+            by_email.setdefault(event['email'], []).append(event)
+        for result in BulkResults(self._send_events, by_email.values(), self.concurrency, ordered=False):
+            pass
+
+    def _send_events(self, events):
+        for event in events:
+            response, error = None, None
+            try:
+                response = self.client.purchase(**event)
+            except Exception as e:
+                error = e
+            ok = error is None and response.is_ok()
+            with self.lock:
+                self.in_flight -= 1
+                if ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            if not ok and self.on_failure is not None:
+                try:
+                    self.on_failure(event, response, error)
+                except Exception:
+                    # a failing callback must not stop the worker and lose the later purchases of this email
+                    logger.exception('on_failure callback failed for the purchase of %s', event['email'])
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class RateLimitInfo(object):
+    """
+    Latest X-Rate-Limit-* headers received per (action, method).
+
+    Each key is written with a single dictionary assignment, which is atomic, so threads recording responses
+    concurrently never lose each other's entries and neither writers nor readers take a lock.
+    The stored header dictionaries are never modified after being stored.
+    """
+    def __init__(self):
+        self.entries = {}
+
+    def update(self, action, method, info):
+        self.entries[(action, method.upper())] = info
+
+    def get(self, action, method):
+        return self.entries.get((action, method.upper()))
+
+    def snapshot(self):
+        """
+        Consistent copy of every entry as {action: {method: {limit, remaining, reset}}}
+        """
+        entries = self.entries.copy()
+        nested = {}
+        for (action, method), info in entries.items():
+            nested.setdefault(action, {})[method] = dict(info) if info is not None else None
+        return nested
+
+    def replace(self, nested):
+        """
+        Replace every entry with those of an {action: {method: info}} dictionary
+        """
+        self.entries = dict(((action, method.upper()), info)
+                            for action, methods in nested.items() for method, info in methods.items())
+
+
+class RateLimitBucket(object):
+    """
+    Token budget of one (action, method) pair for the current rate limit window
+    """
+    def __init__(self, limit, remaining, reset):
+        self.limit = limit
+        self.tokens = remaining
+        self.reset = reset
+        self.throttled = 0
+        self.waited = 0.0
+
+
+class RateLimiter(object):
+    """
+    Paces API calls per (action, method) just under the limits the API reports in its
+    X-Rate-Limit-Limit / X-Rate-Limit-Remaining / X-Rate-Limit-Reset headers.
+
+    A bucket is seeded from the first response of an endpoint and corrected by every later one.
+    Each call takes a token; when the budget of the current window is spent callers wait for
+    the reset. Endpoints that have not answered yet are not throttled.
+    One RateLimiter may be shared by several clients and threads.
+
+    Usage:
+        client = SailthruClient(api_key, api_secret, rate_limiter=RateLimiter())
+    """
+    def __init__(self, headroom=0.05, window=60, clock=time.time, sleep=time.sleep):
+        """
+        @param headroom: fraction of each window's limit kept in reserve (at least one request)
+        @param window: seconds until the next window when the server has not reported a new reset time yet
+        @param clock: time source, returns seconds since the epoch
+        @param sleep: function used to wait
+        """
+        self.headroom = headroom
+        self.window = window
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _reserve(self, limit):
+        return max(1, int(limit * self.headroom)) if limit > 1 else 0
+
+    def _refill(self, bucket, now):
+        if now >= bucket.reset:
+            bucket.tokens = bucket.limit - self._reserve(bucket.limit)
+            bucket.reset += (int((now - bucket.reset) // self.window) + 1) * self.window
+
+    def try_acquire(self, action, method):
+        """
+        Take a token for one call without blocking.
+        @return: 0 if the call may proceed, otherwise the number of seconds to wait before trying again
+        """
+        key = (action, method.upper())
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                return 0
+            now = self.clock()
+            self._refill(bucket, now)
+            if bucket.tokens > 0:
+                bucket.tokens -= 1
+                return 0
+            bucket.throttled += 1
+            return max(bucket.reset - now, 0.001)
+
+    def acquire(self, action, method, timeout=None):
+        """
+        Block until a call to action/method may be made.
+        @param timeout: give up after this many seconds
+        @return: seconds waited, or None if the timeout expired first
+        """
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(action, method)
+            if not delay:
+                return waited
+            if timeout is not None:
+                if waited + delay > timeout:
+                    return None
+            self.sleep(delay)
+            waited += delay
+            self._add_wait(action, method, delay)
+
+    def _add_wait(self, action, method, delay):
+        with self.lock:
+            bucket = self.buckets.get((action, method.upper()))
+            if bucket is not None:
+                bucket.waited += delay
+
+    def update(self, action, method, rate_limit_info):
+        """
+        Correct the budget of action/method from parsed rate limit headers
+        @param rate_limit_info: dict with limit, remaining and reset keys, as returned by SailthruResponse.get_rate_limit_headers()
+        """
+        if not rate_limit_info:
+            return
+        key = (action, method.upper())
+        limit = rate_limit_info['limit']
+        tokens = rate_limit_info['remaining'] - self._reserve(limit)
+        reset = rate_limit_info['reset']
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = RateLimitBucket(limit, tokens, reset)
+                return
+            if reset > bucket.reset or limit != bucket.limit:
+                bucket.limit = limit
+                bucket.tokens = tokens
+                bucket.reset = reset
+            elif reset == bucket.reset:
+                # responses arrive out of order under concurrency; the smallest budget seen is the safe one
+                bucket.tokens = min(bucket.tokens, tokens)
+
+    def get_budget(self, action, method):
+        """
+        Number of calls left in the current window, None if the endpoint has not reported its limits yet
+        """
+        with self.lock:
+            bucket = self.buckets.get((action, method.upper()))
+            if bucket is None:
+                return None
+            self._refill(bucket, self.clock())
+            return max(bucket.tokens, 0)
+
+    def get_wait_time(self, action, method):
+        """
+        Seconds a call to action/method would have to wait right now
+        """
+        with self.lock:
+            bucket = self.buckets.get((action, method.upper()))
+            if bucket is None:
+                return 0
+            now = self.clock()
+            self._refill(bucket, now)
+            return 0 if bucket.tokens > 0 else max(bucket.reset - now, 0)
+
+    def get_metrics(self):
+        """
+        Snapshot of every bucket: {(action, method): {limit, remaining, reset, wait_time, throttled, waited}}
+        """
+        with self.lock:
+            now = self.clock()
+            metrics = {}
+            for key, bucket in self.buckets.items():
+                self._refill(bucket, now)
+                metrics[key] = {'limit': bucket.limit,
+                                'remaining': max(bucket.tokens, 0),
+                                'reset': bucket.reset,
+                                'wait_time': 0 if bucket.tokens > 0 else max(bucket.reset - now, 0),
+                                'throttled': bucket.throttled,
+                                'waited': bucket.waited}
+            return metrics
@@ -1,20 +1,51 @@
 # -*- coding: utf-8 -*-
 
+import time
+
+from .sailthru_json import json_loads
+
 try:
     import simplejson as json
 except ImportError:
     import json
 
+_NOT_DECODED = object()
+
 class SailthruResponse(object):
     def __init__(self, response):
         self.response = response
-        self.json_error = None
-
+        self._json = _NOT_DECODED
+        self._json_error = None
+        # seconds spent decoding the body, None until it is decoded
+        self.decode_time = None
+        # callback(seconds) run on the thread that decodes the body, the client uses it to time the decoding
+        self.on_decode = None
+
+    def _decode(self):
+        # the body is decoded on first use only, straight from the raw bytes
+        started = time.time()
         try:
-            self.json = json.loads(response.text)
+            json_body, json_error = json_loads(self.response.content), None
         except (ValueError, TypeError) as e:
-            self.json = None
-            self.json_error = str(e)
+            json_body, json_error = None, str(e)
+        self.decode_time = time.time() - started
+        # the error is set first: responses shared between threads are read as decoded once _json is set
+        self._json_error = json_error
+        self._json = json_body
+        if self.on_decode is not None:
+            self.on_decode(self.decode_time)
+
+    @property
+    def json(self):
+        if self._json is _NOT_DECODED:
+            self._decode()
+        return self._json
+
+    @property
+    def json_error(self):
+        if self._json is _NOT_DECODED:
+            self._decode()
+        return self._json_error
 
     def is_ok(self):
         return self.json and not set(["error", "errormsg"]) == set(self.json)
@@ -54,6 +85,72 @@ class SailthruResponse(object):
 
         return None
 
+class CompactResponse(object):
+    """
+    Small stand-in for a SailthruResponse, for bulk jobs that keep many results: only the status code, the decoded
+    body or the error code and message, and the rate limit headers are kept, not the HTTP response.
+    """
+    __slots__ = ('status_code', 'body', 'error_code', 'error_message', 'rate_limit')
+
+    def __init__(self, status_code, body=None, error_code=None, error_message=None, rate_limit=None):
+        """
+        @param rate_limit: (limit, remaining, reset) tuple, None if the response had no rate limit headers
+        """
+        self.status_code = status_code
+        self.body = body
+        self.error_code = error_code
+        self.error_message = error_message
+        self.rate_limit = rate_limit
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        CompactResponse of a SailthruResponse, decoding its body if needed
+        """
+        if isinstance(response, CompactResponse):
+            return response
+        rate_limit = response.get_rate_limit_headers()
+        if rate_limit is not None:
+            rate_limit = (rate_limit['limit'], rate_limit['remaining'], rate_limit['reset'])
+        status_code = response.get_status_code()
+        body = response.json
+        if response.json_error is not None:
+            return cls(status_code, None, 0, response.json_error, rate_limit)
+        if not response.is_ok() and isinstance(body, dict) and 'error' in body:
+            return cls(status_code, None, body['error'], body.get('errormsg'), rate_limit)
+        return cls(status_code, body, rate_limit=rate_limit)
+
+    def is_ok(self):
+        return bool(self.body) and self.error_message is None
+
+    def get_body(self, as_dictionary=True):
+        """
+        Decoded body; as_dictionary=False returns it encoded again as JSON bytes, the original bytes are not kept
+        """
+        if as_dictionary:
+            return self.body
+        return json.dumps(self.body).encode('utf-8')
+
+    def get_response(self):
+        return None
+
+    def get_status_code(self):
+        return self.status_code
+
+    def get_error(self):
+        if self.is_ok():
+            return False
+        return SailthruResponseError(self.error_message or '', self.error_code or 0)
+
+    def get_rate_limit_headers(self):
+        if self.rate_limit is None:
+            return None
+        limit, remaining, reset = self.rate_limit
+        return {'limit': limit, 'remaining': remaining, 'reset': reset}
+
+    def __repr__(self):
+        return '<CompactResponse status=%d %s>' % (self.status_code, 'ok' if self.is_ok() else 'error=%r' % self.error_message)
+
 class SailthruResponseError(object):
     def __init__(self, message, code):
         self.message = message
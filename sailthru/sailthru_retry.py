@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+
+
+class RetryPolicy(object):
+    """
+    Decides whether a failed API call is retried and how long to back off before the next attempt.
+
+    Connection errors and responses with a retryable status code are retried for idempotent calls only:
+    any GET or DELETE, and POSTs to the actions listed in retry_post_actions. A POST to send, purchase or blast
+    may have been processed before the failure, so it is never retried unless explicitly listed.
+
+    Backoff grows exponentially from backoff_base up to backoff_cap, with full jitter. A 429 response waits
+    until the X-Rate-Limit-Reset time instead when the header is present.
+
+    Usage:
+        def log_retry(action, method, attempt, delay, response, error):
+            logger.warning('retrying %s %s in %.1fs (attempt %d)', method, action, delay, attempt)
+
+        client = SailthruClient(api_key, api_secret, retry_policy=RetryPolicy(max_attempts=5, on_retry=log_retry))
+    """
+    def __init__(self, max_attempts=3, backoff_base=0.5, backoff_cap=30, jitter=True,
+                 retry_statuses=(429, 500, 502, 503, 504), retry_methods=('GET', 'DELETE'),
+                 retry_post_actions=('user', 'template', 'list', 'content'), on_retry=None,
+                 clock=time.time, sleep=time.sleep, random=random.random):
+        """
+        @param max_attempts: total number of attempts per call, including the first
+        @param backoff_base: delay in seconds before the first retry
+        @param backoff_cap: maximum delay in seconds between attempts
+        @param jitter: randomize delays between 0 and the computed backoff
+        @param retry_statuses: HTTP status codes that are retried
+        @param retry_methods: HTTP methods that are always safe to retry
+        @param retry_post_actions: API actions whose POSTs are safe to retry
+        @param on_retry: callback(action, method, attempt, delay, response, error) invoked before each retry
+        """
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_methods = frozenset(m.upper() for m in retry_methods)
+        self.retry_post_actions = frozenset(retry_post_actions)
+        self.on_retry = on_retry
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random
+        self.retries = {}
+        self.lock = threading.Lock()
+
+    def is_idempotent(self, action, method):
+        method = method.upper()
+        return method in self.retry_methods or (method == 'POST' and action in self.retry_post_actions)
+
+    def should_retry(self, action, method, attempt, response=None, error=None):
+        """
+        @param attempt: number of the attempt that just failed, starting at 1
+        @param response: SailthruResponse of the attempt, if one was received
+        @param error: SailthruClientError raised by the attempt, if any
+        """
+        if attempt >= self.max_attempts or not self.is_idempotent(action, method):
+            return False
+        if error is not None:
+            return True
+        return response is not None and response.get_status_code() in self.retry_statuses
+
+    def get_delay(self, attempt, response=None):
+        """
+        Seconds to wait after the given failed attempt
+        """
+        if response is not None and response.get_status_code() == 429:
+            rate_limit_info = response.get_rate_limit_headers()
+            if rate_limit_info:
+                return max(rate_limit_info['reset'] - self.clock(), 0)
+        delay = min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay *= self.random()
+        return delay
+
+    def record_retry(self, action, method, attempt, delay, response=None, error=None):
+        """
+        Count a retry and notify the on_retry callback
+        """
+        key = (action, method.upper())
+        with self.lock:
+            self.retries[key] = self.retries.get(key, 0) + 1
+        if self.on_retry is not None:
+            self.on_retry(action, method, attempt, delay, response, error)
+
+    def get_metrics(self):
+        """
+        Number of retries made so far: {(action, method): count}
+        """
+        with self.lock:
+            return dict(self.retries)
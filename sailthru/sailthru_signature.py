@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+
+# MD5 state after hashing each secret seen so far, copied for every signature
+_secret_hashes = {}
+_MAX_CACHED_SECRETS = 64
+
+
+def iter_params(params):
+    """
+    Yields the values of a set of parameters, descending into nested dictionaries and lists.
+    Walks the structure in a single pass with an explicit stack, without building intermediate lists.
+    """
+    stack = [iter((params,))]
+    while stack:
+        for value in stack[-1]:
+            if isinstance(value, dict):
+                stack.append(iter(value.values()))
+                break
+            elif isinstance(value, list):
+                stack.append(iter(value))
+                break
+            yield value
+        else:
+            stack.pop()
+
+
+def extract_params(params):
+    """
+    Extracts the values of a set of parameters, recursing into nested dictionaries.
+    """
+    return list(iter_params(params))
+
+
+def _sorted_values(params):
+    """
+    Concatenation of the sorted string values of params.
+    Same values as extract_params, but stringified while walking and in no particular order before the sort.
+    """
+    str_list = []
+    append = str_list.append
+    stack = [params]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        value = pop()
+        value_type = type(value)
+        if value_type is str:
+            append(value)
+        elif value_type is dict or isinstance(value, dict):
+            extend(value.values())
+        elif value_type is list or isinstance(value, list):
+            extend(value)
+        else:
+            append(str(value))
+    str_list.sort()
+    return ''.join(str_list)
+
+
+def get_signature_string(params, secret):
+    """
+    Returns the unhashed signature string (secret + sorted list of param values) for an API call.
+    @param params: dictionary values to generate signature string
+    @param secret: secret string
+    """
+    return secret + _sorted_values(params)
+
+
+def _secret_hash(secret):
+    secret_hash = _secret_hashes.get(secret)
+    if secret_hash is None:
+        secret_hash = hashlib.md5(secret.encode('utf-8'))
+        if len(_secret_hashes) < _MAX_CACHED_SECRETS:
+            _secret_hashes[secret] = secret_hash
+    return secret_hash.copy()
+
+
+def get_signature_hash(params, secret):
+    """
+    Returns an MD5 hash of the signature string for an API call.
+    @param params: dictionary values to generate signature hash
+    @param secret: secret string
+    """
+    signature = _secret_hash(secret)
+    signature.update(_sorted_values(params).encode('utf-8'))
+    return signature.hexdigest()
+
+
+def get_payload_signature(api_key, json_data, secret):
+    """
+    Returns the signature of a request payload made of api_key, format=json and the JSON encoded data.
+    Same result as get_signature_hash on the payload dictionary, but hashes the three known values
+    one after the other instead of walking the payload and joining a copy of the (possibly large) JSON string.
+    @param api_key: API key string
+    @param json_data: JSON encoded request data
+    @param secret: secret string
+    """
+    signature = _secret_hash(secret)
+    for value in sorted((str(api_key), 'json', json_data)):
+        signature.update(value.encode('utf-8'))
+    return signature.hexdigest()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from .sailthru_error import SailthruTimeoutError
+from .sailthru_timeout import current_deadline, remaining_time
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class _Call(object):
+    """
+    A GET in flight, and its outcome once done
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Opt-in deduplication of identical concurrent GETs: while a GET is in flight, the same GET (same API key,
+    action, data and headers) made from other threads or tasks waits for it and gets the same SailthruResponse,
+    or the same SailthruClientError, instead of making its own call. A SailthruTimeoutError of the call in flight
+    comes from its caller's deadline, so the callers waiting for it make the call again instead.
+
+    Only calls already in flight are shared; combine with a ResponseCache to also reuse finished responses.
+    The response is shared between its callers, so treat it as read-only. With AsyncSailthruClient, calls are
+    shared between the tasks of one event loop: use one SingleFlight per loop.
+
+    Usage:
+        single_flight = SingleFlight()
+        client = SailthruClient(api_key, api_secret, single_flight=single_flight)
+        single_flight.get_metrics()  # {'calls': ..., 'deduplicated': ..., 'in_flight': ...}
+    """
+    def __init__(self):
+        self.calls = {}
+        self.tasks = {}
+        self.leaders = 0
+        self.deduplicated = 0
+        self.lock = threading.Lock()
+
+    def make_key(self, api_key, action, data, headers=None):
+        """
+        Key of a GET request, equal for equal data whatever the order of its keys
+        """
+        return json.dumps([api_key, action, data, headers], sort_keys=True, separators=(',', ':'), default=str)
+
+    def do(self, key, function, action='API'):
+        """
+        Return function(), or the outcome of the call in flight under key
+        @raise SailthruTimeoutError: if the current deadline() passes while waiting for the call in flight
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            if not call.done.wait(remaining_time(action, current_deadline())):
+                raise SailthruTimeoutError('deadline of the %s call exceeded waiting for the same call in flight' % action)
+            if isinstance(call.error, SailthruTimeoutError):
+                # the leader's deadline passed, not necessarily ours: make the call again, possibly as the new leader
+                return self.do(key, function, action)
+            if call.error is not None:
+                raise call.error
+            return call.response
+
+        try:
+            call.response = function()
+            return call.response
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def count(self, leader):
+        """
+        Count a call made (leader) or deduplicated; used by AsyncSailthruClient, which keeps its tasks in self.tasks
+        """
+        with self.lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.deduplicated += 1
+
+    def get_metrics(self):
+        """
+        Counters: {calls, deduplicated, in_flight}
+        """
+        with self.lock:
+            return {'calls': self.leaders, 'deduplicated': self.deduplicated,
+                    'in_flight': len(self.calls) + len(self.tasks)}
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import datetime
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from .sailthru_bulk import BulkResults, require_blocking_client
+from .sailthru_compat import csv_str, open_csv, string_types
+from .sailthru_error import SailthruClientError
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+STATS_WINDOWS = ('day', 'week')
+ROW_FIELDS = ('stat', 'key', 'start_date', 'end_date')
+INTEGER_PATTERN = re.compile(r'^-?\d+$')
+DECIMAL_PATTERN = re.compile(r'^-?(\d+\.\d*|\.\d+)$')
+
+
+def to_date(value):
+    """
+    datetime.date of a date, datetime or YYYY-MM-DD string
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def date_windows(start_date, end_date, window='day'):
+    """
+    Split the inclusive range start_date..end_date into (start, end) windows of one day, or of one
+    Monday to Sunday week, clipped to the range
+    """
+    if window not in STATS_WINDOWS:
+        raise ValueError('unknown stats window %r, expected one of %s' % (window, ', '.join(STATS_WINDOWS)))
+    start, end = to_date(start_date), to_date(end_date)
+    windows = []
+    while start <= end:
+        if window == 'day':
+            window_end = start
+        else:
+            window_end = min(start + datetime.timedelta(days=6 - start.weekday()), end)
+        windows.append((start, window_end))
+        start = window_end + datetime.timedelta(days=1)
+    return windows
+
+
+def _typed(value):
+    # only plain decimal numbers, names like 'nan' or 'inf' and exponents stay text
+    if isinstance(value, string_types):
+        if INTEGER_PATTERN.match(value):
+            return int(value)
+        if DECIMAL_PATTERN.match(value):
+            return float(value)
+    return value
+
+
+def stats_row(stat, key, start, end, body):
+    """
+    Flat row of a stats response: stat, key, start_date and end_date followed by every metric.
+    Nested objects become dotted columns (e.g. 'click_times.0'), numeric strings become numbers and
+    lists are kept as JSON text.
+    """
+    row = {'stat': stat, 'key': key, 'start_date': start, 'end_date': end}
+    _flatten_metrics('', body, row)
+    return row
+
+
+def _flatten_metrics(prefix, values, row):
+    for name, value in sorted(values.items()):
+        column = prefix + str(name)
+        if isinstance(value, dict):
+            _flatten_metrics(column + '.', value, row)
+        elif isinstance(value, list):
+            row[column] = json.dumps(value)
+        else:
+            row[column] = _typed(value)
+
+
+class WindowStats(object):
+    """
+    Decoded stats of one window, or the failed response in their place
+    """
+    def __init__(self, body=None, response=None):
+        self.body = body
+        self.response = response
+
+    def is_ok(self):
+        return self.body is not None
+
+
+def _window_error(response):
+    """
+    Error of a window whose stats could not be read from response
+    """
+    if not response.is_ok():
+        return response.get_error()
+    return SailthruClientError('stats response is not an object: %r' % (response.get_body(),))
+
+
+class StatsExporter(object):
+    """
+    Fetches stats over long date ranges as flat rows, one per window of a day or a week.
+
+    The windows are fetched in parallel, with up to `concurrency` requests in flight, through the client and
+    therefore its rate limiter and retry policy. With a cache_dir, responses of closed windows (ending more
+    than settle_days ago) are kept on disk, so running the export again only fetches recent days.
+    Windows that could not be fetched are left out of the rows and listed in `failures`, a new list for each
+    fetch_many call: (key, start, end, SailthruResponseError or exception).
+
+    Usage:
+        exporter = client.get_stats_exporter(cache_dir='.stats-cache', window='day')
+        rows = exporter.fetch_many('send', ['welcome', 'receipt'], '2016-01-01', '2016-03-31')
+        write_csv(rows, 'send-stats.csv')
+    """
+    def __init__(self, client, concurrency=4, window='day', cache_dir=None, settle_days=2, today=datetime.date.today):
+        """
+        @param client: SailthruClient the stats are fetched with
+        @param concurrency: stats requests in flight at once
+        @param window: 'day' or 'week'; list stats are always fetched per day
+        @param cache_dir: directory caching the responses of closed windows, no caching if None
+        @param settle_days: days after which a window's stats are considered final
+        """
+        if window not in STATS_WINDOWS:
+            raise ValueError('unknown stats window %r, expected one of %s' % (window, ', '.join(STATS_WINDOWS)))
+        require_blocking_client(client, 'StatsExporter')
+        self.client = client
+        self.concurrency = concurrency
+        self.window = window
+        self.cache_dir = cache_dir
+        self.settle_days = settle_days
+        self.today = today
+        self.failures = []
+        self.fetched = 0
+        self.cached = 0
+        self.lock = threading.Lock()
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def fetch(self, stat, key, start_date, end_date, options=None):
+        """
+        Rows of one template ('send'), blast ('blast', None for all blasts) or list ('list'), in date order
+        """
+        return self.fetch_many(stat, [key], start_date, end_date, options)
+
+    def fetch_many(self, stat, keys, start_date, end_date, options=None):
+        """
+        Rows of several templates, blasts or lists, grouped by key and in date order; yielded as they are fetched
+        """
+        if stat not in ('send', 'blast', 'list'):
+            raise ValueError('unknown stat %r, expected send, blast or list' % stat)
+        # a list of its own per call, reset now rather than once iteration starts
+        self.failures = []
+        windows = date_windows(start_date, end_date, 'day' if stat == 'list' else self.window)
+        requests = ((stat, key, start, end, options) for key in keys for start, end in windows)
+        return self._fetch_rows(requests, self.failures)
+
+    def _fetch_rows(self, requests, failures):
+        for result in BulkResults(self._fetch_window, requests, self.concurrency):
+            stat, key, start, end, options = result.item
+            if result.error is not None:
+                failures.append((key, start, end, result.error))
+            elif not result.is_ok():
+                failures.append((key, start, end, _window_error(result.response.response)))
+            else:
+                yield stats_row(stat, key, start, end, result.response.body)
+
+    def _request(self, stat, key, start, end, options):
+        if stat == 'send':
+            return self.client.stats_send(key, start.isoformat(), end.isoformat(), options)
+        if stat == 'blast':
+            return self.client.stats_blast(key, start.isoformat(), end.isoformat(), options)
+        return self.client.stats_list(key, start.isoformat())
+
+    def _cache_path(self, stat, key, start, end, options):
+        request = json.dumps([stat, key, start.isoformat(), end.isoformat(), options], sort_keys=True, default=str)
+        return os.path.join(self.cache_dir, 'stats-%s.json' % hashlib.sha1(request.encode('utf-8')).hexdigest())
+
+    def is_closed(self, end):
+        return (self.today() - end).days >= self.settle_days
+
+    def _fetch_window(self, request):
+        """
+        WindowStats of one window, from the cache if it has it
+        """
+        path = None
+        if self.cache_dir and self.is_closed(request[3]):
+            path = self._cache_path(*request)
+            if os.path.exists(path):
+                with open(path, 'r') as cache_file:
+                    body = json.load(cache_file)
+                with self.lock:
+                    self.cached += 1
+                return WindowStats(body)
+
+        response = self._request(*request)
+        with self.lock:
+            self.fetched += 1
+        body = response.get_body() if response.is_ok() else None
+        if not isinstance(body, dict):
+            return WindowStats(response=response)
+        if path is not None:
+            fd, temp_path = tempfile.mkstemp(prefix='.stats-', dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(body, cache_file)
+            os.rename(temp_path, path)
+        return WindowStats(body, response)
+
+
+def _columns(rows):
+    columns = list(ROW_FIELDS)
+    seen = set(columns)
+    for row in rows:
+        for name in row:
+            if name not in seen:
+                seen.add(name)
+                columns.append(name)
+    return columns
+
+
+def _text(value):
+    return value.isoformat() if isinstance(value, datetime.date) else value
+
+
+def write_csv(rows, path, fields=None):
+    """
+    Write stats rows to a CSV file. With fields the rows are streamed; otherwise they are read first to find every column.
+    @return: number of rows written
+    """
+    if fields is None:
+        rows = list(rows)
+        fields = _columns(rows)
+    count = 0
+    with open_csv(path) as csv_file:
+        writer = csv.DictWriter(csv_file, [csv_str(name) for name in fields], extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict((csv_str(name), csv_str(_text(value))) for name, value in row.items()))
+            count += 1
+    return count
+
+
+def write_jsonl(rows, path):
+    """
+    Write stats rows to a newline-delimited JSON file, one row at a time
+    @return: number of rows written
+    """
+    count = 0
+    with open(path, 'w') as jsonl_file:
+        for row in rows:
+            jsonl_file.write(json.dumps(row, default=_text))
+            jsonl_file.write('\n')
+            count += 1
+    return count
+
+
+def to_columns(rows):
+    """
+    Columnar form of stats rows, {column: [values]} with None for missing values, ready for
+    pandas.DataFrame(columns) or pyarrow.table(columns) and so Parquet
+    """
+    rows = list(rows)
+    return dict((name, [row.get(name) for row in rows]) for name in _columns(rows))
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import codecs
+import re
+
+import requests
+
+from .sailthru_error import SailthruClientError
+from .sailthru_response import SailthruResponse
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+STREAM_CHUNK_SIZE = 65536
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_PART = '0123456789.eE+-'
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_END = re.compile(r'["\\]')
+_decoder = json.JSONDecoder()
+
+
+class _JSONStream(object):
+    """
+    Cursor over a JSON text arriving in chunks of UTF-8 bytes. Only the part of the text not consumed yet is
+    buffered: at most one value being read and one chunk.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """
+        Append the next chunk to the buffer, dropping what was consumed.
+        @return: False at the end of the body
+        """
+        while not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self.decoder.decode(b'', True)
+            else:
+                text = self.decoder.decode(chunk)
+            if text:
+                self.buffer = self.buffer[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def _error(self, message):
+        return SailthruClientError('invalid JSON in streamed response: %s' % message)
+
+    def peek(self):
+        """
+        Next character that is not whitespace, without consuming it; None at the end of the body
+        """
+        while True:
+            buffer = self.buffer
+            while self.pos < len(buffer) and buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(buffer):
+                return buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None:
+            raise self._error('body ends early')
+        if char not in chars:
+            raise self._error('expected %s, found %r' % (' or '.join(chars), char))
+        self.pos += 1
+        return char
+
+    def read_value(self):
+        """
+        Decode the next value, reading as many chunks as it spans
+        """
+        if self.peek() is None:
+            raise self._error('body ends early')
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise self._error('body ends early or is malformed')
+            if isinstance(value, (int, float)) and (end == len(self.buffer) or self.buffer[end] in _NUMBER_PART) \
+                    and self._fill():
+                # the number may go on in the next chunk
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """
+        Consume the next value without decoding it, in constant memory
+        """
+        char = self.peek()
+        if char is None:
+            raise self._error('body ends early')
+        if char not in '"[{':
+            self.read_value()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            if self.pos >= len(self.buffer):
+                if not self._fill():
+                    raise self._error('body ends early')
+                continue
+            if in_string:
+                match = _STRING_END.search(self.buffer, self.pos)
+                if match is None:
+                    self.pos = len(self.buffer)
+                elif match.group() == '\\':
+                    if match.end() == len(self.buffer):
+                        # the escaped character is in the next chunk
+                        self.pos = match.start()
+                        if not self._fill():
+                            raise self._error('body ends early')
+                    else:
+                        self.pos = match.end() + 1
+                else:
+                    self.pos = match.end()
+                    in_string = False
+                    if depth == 0:
+                        return
+                continue
+            match = _STRUCTURE.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                continue
+            self.pos = match.end()
+            char = match.group()
+            if char == '"':
+                in_string = True
+            elif char in '[{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def find_key(self, key):
+        """
+        Move to the value of key in the object starting here, skipping the values before it.
+        @return: False if there is no object here or it has no such key
+        """
+        if self.peek() != '{':
+            return False
+        self.pos += 1
+        if self.peek() == '}':
+            return False
+        while True:
+            name = self.read_value()
+            self.expect(':')
+            if name == key:
+                return True
+            self.skip_value()
+            if self.expect(',}') == '}':
+                return False
+
+
+def iter_json_items(chunks, item_path=None):
+    """
+    Parse a JSON body arriving in chunks of bytes and yield the entries of the array or object at item_path,
+    one at a time: the values of an array, (key, value) pairs of an object. The rest of the body is skipped
+    without being decoded, so memory stays proportional to one entry, not to the body.
+    @param item_path: dotted keys leading to the array or object, e.g. 'templates'; the whole body if None
+    """
+    stream = _JSONStream(chunks)
+    for key in item_path.split('.') if item_path else []:
+        if not stream.find_key(key):
+            return
+
+    char = stream.peek()
+    if char not in ('[', '{'):
+        if char is not None:
+            yield stream.read_value()
+        return
+    stream.pos += 1
+    closing = ']' if char == '[' else '}'
+    if stream.peek() == closing:
+        stream.pos += 1
+        return
+    while True:
+        if char == '[':
+            yield stream.read_value()
+        else:
+            name = stream.read_value()
+            stream.expect(':')
+            yield name, stream.read_value()
+        if stream.expect(',' + closing) == closing:
+            return
+
+
+class SailthruStreamResponse(SailthruResponse):
+    """
+    Response of api_get(..., stream=True). The body is left on the connection and parsed while iterating over the
+    response, which yields the entries at item_path one at a time (see iter_json_items).
+
+    is_ok() only looks at the status code. Error bodies are small: get_error() and get_body() read them whole.
+    Iterate over the response or close it, so that its connection goes back to the pool.
+
+    Usage:
+        with client.api_get('template', {}, stream=True, item_path='templates') as templates:
+            if not templates.is_ok():
+                raise ...
+            for template in templates:
+                ...
+    """
+    def __init__(self, response, item_path=None, chunk_size=STREAM_CHUNK_SIZE):
+        SailthruResponse.__init__(self, response)
+        self.item_path = item_path
+        self.chunk_size = chunk_size
+
+    def is_ok(self):
+        return self.get_status_code() == 200
+
+    def get_error(self):
+        if self.is_ok():
+            return False
+        return SailthruResponse.get_error(self)
+
+    def iter_items(self, item_path=None):
+        """
+        Entries at item_path, at self.item_path if None
+        @raise SailthruClientError: if the response is an error, its body is not valid JSON or cannot be read whole
+        """
+        if not self.is_ok():
+            error = self.get_error()
+            raise SailthruClientError('streamed request failed: %s (error %s)' % (error.get_message(), error.get_error_code()))
+        try:
+            for item in iter_json_items(self._iter_chunks(), self.item_path if item_path is None else item_path):
+                yield item
+        finally:
+            self.close()
+
+    def _iter_chunks(self):
+        try:
+            for chunk in self.response.iter_content(self.chunk_size):
+                yield chunk
+        except requests.RequestException as e:
+            raise SailthruClientError(str(e))
+
+    def __iter__(self):
+        return self.iter_items()
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
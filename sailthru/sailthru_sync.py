@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import os
+import time
+from collections import OrderedDict
+
+from .sailthru_bulk import BulkResults, require_blocking_client
+
+
+def merge_user_options(options, update):
+    """
+    Merge a later save_user update into earlier options: nested dictionaries such as vars and lists
+    are merged key by key, any other value is replaced. options is modified in place and returned.
+    """
+    for key, value in update.items():
+        current = options.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            options[key] = merge_user_options(dict(current), value)
+        else:
+            options[key] = value
+    return options
+
+
+class SyncSummary(object):
+    """
+    Outcome of a UserSyncPipeline run
+    """
+    def __init__(self, max_failures=100):
+        self.records = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.failures = []
+        self.max_failures = max_failures
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def per_second(self):
+        """
+        save_user calls made per second
+        """
+        elapsed = self.elapsed
+        return (self.succeeded + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def add_failure(self, idvalue, result):
+        self.failed += 1
+        if len(self.failures) < self.max_failures:
+            self.failures.append((idvalue, result.error or result.response.get_error()))
+
+    def __repr__(self):
+        return ('<SyncSummary records=%d skipped=%d coalesced=%d succeeded=%d failed=%d per_second=%.1f>'
+                % (self.records, self.skipped, self.coalesced, self.succeeded, self.failed, self.per_second))
+
+
+class UserSyncPipeline(object):
+    """
+    Streams user records into save_user calls.
+
+    Records are read in windows of `window` records; updates to the same id within a window are merged
+    into a single call. Each window is sent with at most `concurrency` calls in flight over the client's
+    connection pool, so memory stays flat however long the input is. After each window the number of
+    records consumed is written to checkpoint_path, and a later run with the same checkpoint resumes after them;
+    clear_checkpoint() starts over.
+
+    Usage:
+        records = ((row.user_id, {'key': 'extid', 'vars': row.vars}) for row in crm_export())
+        summary = UserSyncPipeline(client, concurrency=16, checkpoint_path='crm-sync.checkpoint').run(records)
+    """
+    def __init__(self, client, concurrency=8, window=1000, checkpoint_path=None, on_failure=None, max_failures=100):
+        """
+        @param client: SailthruClient
+        @param concurrency: save_user calls in flight at once
+        @param window: number of records coalesced and sent together
+        @param checkpoint_path: file recording progress, for resuming a crashed run
+        @param on_failure: callback(idvalue, options, BulkResult) for every failed save_user, e.g. to dead-letter it
+        @param max_failures: number of failures kept in the summary
+        """
+        require_blocking_client(client, 'UserSyncPipeline')
+        self.client = client
+        self.concurrency = concurrency
+        self.window = window
+        self.checkpoint_path = checkpoint_path
+        self.on_failure = on_failure
+        self.max_failures = max_failures
+
+    def read_checkpoint(self):
+        """
+        Number of records a previous run completed
+        """
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, 'r') as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+
+    def write_checkpoint(self, offset):
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as checkpoint:
+            checkpoint.write(str(offset))
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.rename(temp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _split(self, record):
+        if isinstance(record, dict):
+            options = dict(record)
+            return options.pop('id'), options
+        idvalue, options = record
+        return idvalue, dict(options or {})
+
+    def _save(self, user):
+        return self.client.save_user(user[0], user[1])
+
+    def run(self, records):
+        """
+        Sync every record: a dict with an 'id' key plus save_user options, or an (idvalue, options) tuple.
+        @return: SyncSummary
+        """
+        summary = SyncSummary(self.max_failures)
+        offset = self.read_checkpoint()
+        records = iter(records)
+        if offset:
+            summary.skipped = sum(1 for record in itertools.islice(records, offset))
+
+        while True:
+            batch = OrderedDict()
+            for record in itertools.islice(records, self.window):
+                idvalue, options = self._split(record)
+                summary.records += 1
+                if idvalue in batch:
+                    summary.coalesced += 1
+                    merge_user_options(batch[idvalue], options)
+                else:
+                    batch[idvalue] = options
+            if not batch:
+                break
+
+            for result in BulkResults(self._save, batch.items(), self.concurrency, ordered=False):
+                if result.is_ok():
+                    summary.succeeded += 1
+                else:
+                    summary.add_failure(result.item[0], result)
+                    if self.on_failure is not None:
+                        self.on_failure(result.item[0], result.item[1], result)
+            if self.checkpoint_path:
+                self.write_checkpoint(summary.skipped + summary.records)
+
+        summary.finished_at = time.time()
+        return summary
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from contextlib import contextmanager
+
+from .sailthru_error import SailthruTimeoutError
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+
+class Timeout(object):
+    """
+    Timeouts of the calls to one action, in seconds; None means no limit.
+
+    connect and read apply to every HTTP attempt: read is the longest wait for data from the server, not the
+    time taken by the whole response. total bounds the call from start to finish, retries and rate limit
+    waits included, and read and connect are shortened to fit in what is left of it.
+    """
+    def __init__(self, connect=None, read=None, total=None):
+        self.connect = connect
+        self.read = read
+        self.total = total
+
+    @classmethod
+    def of(cls, value):
+        """
+        Timeout from a Timeout, a number of seconds for both connect and read, or a (connect, read) tuple
+        """
+        if isinstance(value, Timeout):
+            return value
+        if isinstance(value, tuple):
+            return cls(*value)
+        return cls(value, value)
+
+    def get_deadline(self, now):
+        """
+        Time by which a call started at now has to end: the earliest of its total and of the current deadline()
+        """
+        end = current_deadline()
+        if self.total is not None and (end is None or now + self.total < end):
+            end = now + self.total
+        return end
+
+    def get_request_timeout(self, remaining=None):
+        """
+        (connect, read) timeouts of one attempt with `remaining` seconds left before the deadline
+        """
+        if remaining is None:
+            return self.connect, self.read
+        return (remaining if self.connect is None else min(self.connect, remaining),
+                remaining if self.read is None else min(self.read, remaining))
+
+    def __eq__(self, other):
+        return isinstance(other, Timeout) and \
+            (self.connect, self.read, self.total) == (other.connect, other.read, other.total)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<Timeout connect=%r read=%r total=%r>' % (self.connect, self.read, self.total)
+
+
+# request_timeout of clients created without one; only then do the DEFAULT_TIMEOUTS below apply
+DEFAULT_REQUEST_TIMEOUT = Timeout(connect=10, read=10)
+
+# latency-sensitive calls fail fast, reporting and job calls get time to assemble large responses; no totals, so
+# that calls keep waiting for the rate limit unless a deadline() or a Timeout with a total says otherwise
+DEFAULT_TIMEOUTS = {'send': Timeout(connect=2, read=5),
+                    'purchase': Timeout(connect=2, read=5),
+                    'user': Timeout(connect=2, read=5),
+                    'stats': Timeout(connect=5, read=60),
+                    'job': Timeout(connect=5, read=120)}
+
+
+if contextvars is not None:
+    # follows asyncio tasks as well as threads
+    _current = contextvars.ContextVar('sailthru_deadline', default=None)
+
+    def current_deadline():
+        """
+        Time (seconds since the epoch) by which API calls made here have to end, None if there is no deadline
+        """
+        return _current.get()
+
+    def _set_deadline(end):
+        return _current.set(end)
+
+    def _reset_deadline(token):
+        _current.reset(token)
+else:
+    _local = threading.local()
+
+    def current_deadline():
+        """
+        Time (seconds since the epoch) by which API calls made here have to end, None if there is no deadline
+        """
+        return getattr(_local, 'deadline', None)
+
+    def _set_deadline(end):
+        token = current_deadline()
+        _local.deadline = end
+        return token
+
+    def _reset_deadline(token):
+        _local.deadline = token
+
+
+@contextmanager
+def deadline(seconds=None, at=None):
+    """
+    Make every API call within the block end in `seconds` from now, or by the time `at`, retries and rate limit
+    waits included. A call that cannot start an attempt in time raises SailthruTimeoutError, an attempt cut short
+    fails like any timed out request. A nested deadline can only shorten the one around it, and bulk helpers
+    (send_many, BulkResults) pass the deadline on to their worker threads.
+
+    Usage:
+        with deadline(2.5):
+            client.get_user('praj@sailthru.com')
+            client.send('welcome', 'praj@sailthru.com')
+    """
+    end = at if seconds is None else time.time() + seconds
+    outer = current_deadline()
+    if outer is not None and (end is None or outer < end):
+        end = outer
+    token = _set_deadline(end)
+    try:
+        yield end
+    finally:
+        _reset_deadline(token)
+
+
+def remaining_time(action, end, now=None):
+    """
+    Seconds left before the deadline end, None if there is none
+    @raise SailthruTimeoutError: if the deadline has passed
+    """
+    if end is None:
+        return None
+    remaining = end - (time.time() if now is None else now)
+    if remaining <= 0:
+        raise SailthruTimeoutError('deadline of the %s call exceeded' % action)
+    return remaining
@@ -15,8 +15,12 @@ setup(name='sailthru-client',
     ],
     install_requires=[
         'requests >= 2.6.0',
-        'simplejson >= 3.0.7'
+        'simplejson >= 3.0.7',
+        'futures >= 3.0.0; python_version < "3"'
     ],
+    extras_require={
+        'async': ['aiohttp >= 3.3'],
+    },
     keywords='sailthru api',
     author='Sailthru Inc.',
     author_email='support@sailthru.com',
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal local HTTP server standing in for api.sailthru.com in tests
+"""
+import json
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+def request_payload(request):
+    """
+    Decoded 'json' parameter of a signed API request, from the form body or the query string
+    """
+    params = request['query']
+    if request['method'] == 'POST':
+        params = parse_qs(request['body'].decode('utf-8'))
+    return json.loads(params['json'][0])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        parsed = urlparse(self.path)
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = self._read_chunked()
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+        request = {'method': self.command,
+                   'action': parsed.path.lstrip('/'),
+                   'query': parse_qs(parsed.query),
+                   'headers': dict(self.headers.items()),
+                   'body': body,
+                   'client_port': self.client_address[1]}
+        status, payload, headers = self.server.respond(request)
+        content = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if not size:
+                self.rfile.readline()
+                return b''.join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    do_GET = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Records every request and answers with handler(request) -> (status, payload, headers).
+    The default handler echoes the action back with a 200.
+    """
+    daemon_threads = True
+
+    def __init__(self, handler=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.handler = handler
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def respond(self, request):
+        with self.lock:
+            self.requests.append(request)
+        if self.handler is not None:
+            return self.handler(request)
+        return 200, {'ok': True, 'action': request['action']}, None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
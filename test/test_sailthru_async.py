@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for AsyncSailthruClient
+"""
+import os
+import unittest
+import threading
+import time
+import sys
+
+sys.path[0:0] = [""]
+
+if sys.version_info < (3, 5):
+    raise unittest.SkipTest('AsyncSailthruClient requires Python 3.5+')
+
+try:
+    import aiohttp
+except ImportError:
+    raise unittest.SkipTest('AsyncSailthruClient requires aiohttp')
+
+import asyncio
+from mock import MagicMock, patch
+from sailthru.sailthru_async import AsyncSailthruClient
+from sailthru.sailthru_response import CompactResponse
+from sailthru.sailthru_single_flight import SingleFlight
+from sailthru.sailthru_timeout import deadline
+from stub_server import StubServer
+
+
+class TestAsyncSailthruClient(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.client = AsyncSailthruClient('test', 'super_secret', api_url=self.server.url)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.client.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.server.stop()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_methods_are_awaitable(self):
+        response = self.run_async(self.client.send('welcome', 'praj@sailthru.com', {'name': 'Praj'}))
+        self.assertTrue(response.is_ok())
+        self.assertEqual(response.get_status_code(), 200)
+        self.assertEqual(response.get_body()['action'], 'send')
+
+        response = self.run_async(self.client.stats_list('main'))
+        self.assertEqual(response.get_body()['action'], 'stats')
+
+        methods = [(r['method'], r['action']) for r in self.server.requests]
+        self.assertEqual(methods, [('POST', 'send'), ('GET', 'stats')])
+        self.assertEqual(self.server.requests[1]['query']['format'], ['json'])
+
+    def test_records_rate_limit_info(self):
+        self.server.handler = lambda request: (200, {}, {'X-Rate-Limit-Limit': 100,
+                                                        'X-Rate-Limit-Remaining': 99,
+                                                        'X-Rate-Limit-Reset': 1459520925})
+        self.run_async(self.client.get_user('praj@sailthru.com'))
+        self.assertEqual(self.client.get_last_rate_limit_info('user', 'GET'),
+                         {'limit': 100, 'remaining': 99, 'reset': 1459520925})
+
+    def test_concurrency_is_bounded(self):
+        state = {'active': 0, 'peak': 0}
+        lock = threading.Lock()
+
+        def handler(request):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.05)
+            with lock:
+                state['active'] -= 1
+            return 200, {}, None
+
+        self.server.handler = handler
+        self.client.max_concurrency = 3
+        calls = [self.client.get_template('t%d' % i) for i in range(10)]
+        responses = self.run_async(asyncio.gather(*calls))
+        self.assertEqual(len(responses), 10)
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertLessEqual(state['peak'], 3)
+
+    def test_observers_see_deadlines_passed_waiting_for_the_semaphore(self):
+        from sailthru.sailthru_error import SailthruTimeoutError
+
+        def handler(request):
+            time.sleep(0.2)
+            return 200, {}, None
+
+        async def late():
+            await asyncio.sleep(0.02)
+            with deadline(0.05):
+                try:
+                    await self.client.get_template('late')
+                except SailthruTimeoutError as e:
+                    return e
+
+        self.server.handler = handler
+        self.client.max_concurrency = 1
+        observer = MagicMock()
+        self.client.add_observer(observer)
+        response, error = self.run_async(asyncio.gather(self.client.get_template('first'), late()))
+        self.assertIsInstance(error, SailthruTimeoutError)
+        event = observer.on_error.call_args[0][0]
+        self.assertIs(event.error, error)
+        self.assertEqual(observer.after_response.call_count, 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_single_flight(self):
+        def handler(request):
+            time.sleep(0.05)
+            return 200, {'name': 'welcome'}, None
+
+        self.server.handler = handler
+        self.client.single_flight = SingleFlight()
+        calls = [self.client.get_template('welcome') for i in range(5)] + [self.client.get_template('receipt')]
+        responses = self.run_async(asyncio.gather(*calls))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertTrue(all(response is responses[0] for response in responses[:5]))
+        self.assertEqual(self.client.single_flight.get_metrics(), {'calls': 2, 'deduplicated': 4, 'in_flight': 0})
+
+    def test_single_flight_followers_keep_their_own_deadline(self):
+        from sailthru.sailthru_error import SailthruTimeoutError
+
+        def handler(request):
+            time.sleep(0.5)
+            return 200, {'name': 'welcome'}, None
+
+        async def follower():
+            await asyncio.sleep(0.05)
+            with deadline(0.1):
+                try:
+                    await self.client.get_template('welcome')
+                except SailthruTimeoutError:
+                    return time.time()
+
+        self.server.handler = handler
+        self.client.single_flight = SingleFlight()
+        started = time.time()
+        response, timed_out = self.run_async(asyncio.gather(self.client.get_template('welcome'), follower()))
+        self.assertTrue(response.is_ok())
+        self.assertLess(timed_out - started, 0.4)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_single_flight_followers_retry_after_the_leaders_deadline(self):
+        from sailthru.sailthru_error import SailthruTimeoutError
+        calls = []
+
+        async def send_api_request(action, data, request_type, headers=None):
+            calls.append(action)
+            await asyncio.sleep(0.05)
+            if len(calls) == 1:
+                raise SailthruTimeoutError('deadline of the template call exceeded')
+            return 'response'
+
+        async def leader():
+            try:
+                await self.client.get_template('welcome')
+            except SailthruTimeoutError as e:
+                return e
+
+        self.client.single_flight = SingleFlight()
+        with patch.object(self.client, '_send_api_request', send_api_request):
+            error, response = self.run_async(asyncio.gather(leader(), self.client.get_template('welcome')))
+        self.assertIsInstance(error, SailthruTimeoutError)
+        self.assertEqual(response, 'response')
+        self.assertEqual(len(calls), 2)
+
+    def test_deadline(self):
+        def handler(request):
+            time.sleep(0.5)
+            return 200, {}, None
+
+        self.server.handler = handler
+        from sailthru.sailthru_error import SailthruClientError
+        started = time.time()
+        with deadline(0.1):
+            with self.assertRaises(SailthruClientError):
+                self.run_async(self.client.get_template('welcome'))
+        self.assertLess(time.time() - started, 0.4)
+
+    def test_receive_verify_post(self):
+        self.server.handler = lambda request: (200, {'email': 'menglander@sailthru.com'}, None)
+        post_params = {'action': 'verify', 'email': 'menglander@sailthru.com', 'send_id': 'abc123', 'sig': 'sighelloworld'}
+        with patch('sailthru.sailthru_client.get_signature_hash', return_value='sighelloworld'):
+            self.assertTrue(self.run_async(self.client.receive_verify_post(post_params)))
+            self.assertTrue(self.run_async(self.client.receive_hardbounce_post(dict(post_params, action='hardbounce'))))
+            self.assertFalse(self.run_async(self.client.receive_optout_post(post_params)))
+        self.assertEqual(self.server.requests[0]['query']['api_key'], ['test'])
+
+    def test_file_uploads(self):
+        lines = (('{"id":"user%d@example.com"}\n' % i).encode('utf-8') for i in range(3))
+        self.run_async(self.client.api_post('job', {'job': 'update', 'file': lines}))
+        self.run_async(self.client.api_post('job', {'job': 'update', 'file': b'{"id":"a@example.com"}\n'}))
+        self.assertIn(b'{"id":"user2@example.com"}\n', self.server.requests[0]['body'])
+        self.assertIn(b'{"id":"a@example.com"}\n', self.server.requests[1]['body'])
+        self.assertIn('multipart/form-data', self.server.requests[1]['headers']['Content-Type'])
+
+    def test_import_list(self):
+        emails = ('user%d@example.com' % i for i in range(5))
+        responses = self.run_async(self.client.import_list('main', emails, chunk_size=3))
+        self.assertEqual([r.get_status_code() for r in responses], [200, 200])
+        self.assertIn(b'user4@example.com\n', self.server.requests[1]['body'])
+
+    def test_send_many(self):
+        async def send_all(ordered):
+            sends = ({'template': 'welcome', 'email': 'user%d@example.com' % i} for i in range(7))
+            results = self.client.send_many(sends, concurrency=3, ordered=ordered, compact=True)
+            return results, [result async for result in results]
+
+        results, items = self.run_async(send_all(True))
+        self.assertEqual([result.index for result in items], list(range(7)))
+        self.assertTrue(all(result.is_ok() for result in items))
+        self.assertTrue(isinstance(items[0].response, CompactResponse))
+        self.assertEqual(results.count, 7)
+        results, items = self.run_async(send_all(False))
+        self.assertEqual(sorted(result.index for result in items), list(range(7)))
+        self.assertEqual(len(self.server.requests), 14)
+        self.assertRaises(TypeError, list, results)
+
+    def test_thread_based_helpers_refuse_the_client(self):
+        from sailthru.sailthru_error import SailthruClientError
+        from sailthru.sailthru_sync import UserSyncPipeline
+        self.assertRaises(SailthruClientError, self.client.get_job_runner)
+        self.assertRaises(SailthruClientError, self.client.get_purchase_recorder)
+        self.assertRaises(SailthruClientError, self.client.get_outbox, 'outbox')
+        self.assertRaises(SailthruClientError, self.client.get_catalog_sync, ':memory:')
+        self.assertRaises(SailthruClientError, self.client.get_stats_exporter)
+        self.assertRaises(SailthruClientError, self.client.get_postback_verifier)
+        self.assertRaises(SailthruClientError, UserSyncPipeline, self.client)
+        self.assertFalse(os.path.exists('outbox'))
+
+    def test_connection_error_raises_client_error(self):
+        from sailthru.sailthru_error import SailthruClientError
+        client = AsyncSailthruClient('test', 'super_secret', api_url='http://127.0.0.1:1')
+        with self.assertRaises(SailthruClientError):
+            self.run_async(client.get_template('welcome'))
+        self.run_async(client.close())
+
+
+if __name__ == '__main__':
+    unittest.main()
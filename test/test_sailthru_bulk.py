@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for concurrent bulk operations
+"""
+import threading
+import time
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_bulk import BulkResults
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_response import CompactResponse
+from stub_server import StubServer, request_payload
+
+
+class TestSendMany(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def handler(self, request):
+        payload = request_payload(request)
+        index = int(payload['vars']['n'])
+        # later sends answer first so completion order differs from input order
+        time.sleep(0.01 * (5 - index % 5))
+        if payload['email'] == 'bad@example.com':
+            return 400, {'error': 99, 'errormsg': 'Invalid email'}, None
+        return 200, {'email': payload['email'], 'n': index}, None
+
+    def test_results_in_input_order(self):
+        sends = [{'template': 'receipt', 'email': 'user%d@example.com' % i, '_vars': {'n': i}} for i in range(10)]
+        results = self.client.send_many(sends, concurrency=5)
+        bodies = [result.response.get_body()['n'] for result in results]
+        self.assertEqual(bodies, list(range(10)))
+        self.assertEqual(results.count, 10)
+        self.assertEqual(results.error_count, 0)
+        self.assertTrue(results.per_second > 0)
+
+    def test_results_in_completion_order(self):
+        sends = [('receipt', 'user%d@example.com' % i, {'n': i}) for i in range(5)]
+        results = list(self.client.send_many(sends, concurrency=5, ordered=False))
+        self.assertEqual(sorted(r.index for r in results), list(range(5)))
+        self.assertEqual([r.index for r in results][0], 4)
+
+    def test_api_errors_are_reported_per_item(self):
+        sends = [('receipt', 'bad@example.com', {'n': 0}), ('receipt', 'ok@example.com', {'n': 1})]
+        results = self.client.send_many(sends)
+        first, second = list(results)
+        self.assertFalse(first.is_ok())
+        self.assertEqual(first.response.get_error().get_error_code(), 99)
+        self.assertTrue(second.is_ok())
+        self.assertEqual(results.error_count, 1)
+
+    def test_compact_results(self):
+        sends = [('receipt', 'bad@example.com', {'n': 0}), ('receipt', 'ok@example.com', {'n': 1})]
+        first, second = list(self.client.send_many(sends, compact=True))
+        self.assertTrue(isinstance(second.response, CompactResponse))
+        self.assertEqual(second.response.get_body(), {'email': 'ok@example.com', 'n': 1})
+        self.assertEqual(first.response.get_error().get_error_code(), 99)
+
+        client = SailthruClient('test', 'super_secret', api_url=self.server.url, compact_responses=True)
+        response = client.send('receipt', 'ok@example.com', {'n': 2})
+        client.close()
+        self.assertTrue(isinstance(response, CompactResponse))
+        self.assertTrue(response.is_ok())
+
+
+class TestBulkResults(unittest.TestCase):
+    def test_input_is_consumed_lazily(self):
+        consumed = []
+        release = threading.Event()
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+
+        def func(item):
+            release.wait()
+            return None
+
+        results = iter(BulkResults(func, items(), concurrency=4))
+        thread = threading.Timer(0.05, release.set)
+        thread.start()
+        next(results)
+        self.assertLessEqual(len(consumed), 5)
+        results.close()
+        thread.join()
+
+    def test_exceptions_are_captured(self):
+        def func(item):
+            if item == 2:
+                raise SailthruClientError('connection reset')
+            return None
+
+        results = list(BulkResults(func, range(4), concurrency=2))
+        self.assertEqual([r.index for r in results], [0, 1, 2, 3])
+        self.assertIsInstance(results[2].error, SailthruClientError)
+        self.assertIsNone(results[1].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
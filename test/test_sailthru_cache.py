@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the response cache
+"""
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_cache import MemoryCacheBackend, ResponseCache
+from sailthru.sailthru_client import SailthruClient
+from stub_server import StubServer, request_payload
+
+
+class TestMemoryCacheBackend(unittest.TestCase):
+    def test_lru_eviction(self):
+        backend = MemoryCacheBackend(maxsize=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(len(backend), 2)
+
+    def test_ttl(self):
+        now = [100]
+        backend = MemoryCacheBackend(clock=lambda: now[0])
+        backend.set('a', 1, ttl=10)
+        backend.set('b', 2)
+        now[0] = 110
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.get('b'), 2)
+
+
+class TestClientResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(self.handler).start()
+        self.cache = ResponseCache()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url, response_cache=self.cache)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def handler(self, request):
+        payload = request_payload(request)
+        if payload.get('template') == 'missing':
+            return 400, {'error': 14, 'errormsg': 'Unknown template'}, None
+        return 200, {'request': len(self.server.requests), 'payload': payload}, None
+
+    def test_repeated_gets_are_cached(self):
+        first = self.client.get_template('welcome')
+        second = self.client.get_template('welcome')
+        self.assertIs(first, second)
+        self.client.get_templates()
+        self.client.get_list('main', {'fields': {'vars': 1}})
+        self.client.get_list('main', {'fields': {'vars': 1}})
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.cache.get_metrics(), {'hits': 2, 'misses': 3, 'invalidations': 0})
+
+    def test_uncached_actions_and_errors_go_to_the_api(self):
+        self.client.get_user('praj@sailthru.com')
+        self.client.get_user('praj@sailthru.com')
+        self.client.get_template('missing')
+        self.client.get_template('missing')
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_writes_invalidate_action(self):
+        self.client.get_template('welcome')
+        self.client.get_blast(42)
+        self.client.save_template('welcome', {'subject': 'Hi'})
+        self.client.get_template('welcome')
+        self.client.get_blast(42)
+        self.client.delete_template('welcome')
+        self.client.get_template('welcome')
+        self.assertEqual([r['method'] + ' ' + r['action'] for r in self.server.requests],
+                         ['GET template', 'GET blast', 'POST template', 'GET template',
+                          'DELETE template', 'GET template'])
+        self.assertEqual(self.cache.get_metrics()['invalidations'], 2)
+
+    def test_clients_of_different_accounts_share_a_cache(self):
+        other = SailthruClient('other', 'other_secret', api_url=self.server.url, response_cache=self.cache)
+        try:
+            mine = self.client.get_template('welcome')
+            theirs = other.get_template('welcome')
+            self.assertIsNot(mine, theirs)
+            other.save_template('welcome', {'subject': 'Hi'})
+            self.assertIs(self.client.get_template('welcome'), mine)
+            other.get_template('welcome')
+        finally:
+            other.close()
+        self.assertEqual([r['method'] + ' ' + r['action'] for r in self.server.requests],
+                         ['GET template', 'GET template', 'POST template', 'GET template'])
+        self.assertEqual(self.server.requests[1]['query']['api_key'], ['other'])
+
+
+if __name__ == '__main__':
+    unittest.main()
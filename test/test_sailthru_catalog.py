@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for push_content and CatalogSync
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_catalog import CatalogIndex, CatalogSync, build_content_data, content_fingerprint
+from sailthru.sailthru_client import SailthruClient
+from stub_server import StubServer, request_payload
+
+
+class TestPushContent(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_every_field_is_sent_under_its_own_name(self):
+        self.client.push_content('Red shoes', 'http://example.com/shoes/red',
+                                 images={'full': 'http://example.com/red.jpg'}, date='2016-01-01',
+                                 expire_date='2016-12-31', description='Shoes, red', location=[-73.98, 40.75],
+                                 price=4999, tags=['shoes', 'red'], author='Praj', site_name='Example Shoes',
+                                 spider=True, vars={'color': 'red'}, inventory=12)
+        payload = request_payload(self.server.requests[0])
+        self.assertEqual(payload['expire_date'], '2016-12-31')
+        self.assertEqual(payload['location'], [-73.98, 40.75])
+        self.assertEqual(payload['site_name'], 'Example Shoes')
+        self.assertEqual(payload['images'], {'full': 'http://example.com/red.jpg'})
+        self.assertEqual(payload['date'], '2016-01-01')
+        self.assertEqual(payload['tags'], 'shoes,red')
+        self.assertEqual((payload['price'], payload['inventory'], payload['spider']), (4999, 12, 1))
+        self.assertEqual(payload['vars'], {'color': 'red'})
+
+    def test_unset_fields_are_left_out(self):
+        self.assertEqual(build_content_data('Red shoes', 'http://example.com/shoes/red', vars={}, spider=False),
+                         {'title': 'Red shoes', 'url': 'http://example.com/shoes/red'})
+
+
+class TestCatalogSync(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+        self.directory = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.directory, 'catalog.sqlite')
+        self.now = [1000.0]
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def handler(self, request):
+        if request_payload(request)['url'].endswith('/broken'):
+            return 400, {'error': 99, 'errormsg': 'Invalid url'}, None
+        return 200, {'ok': True}, None
+
+    def catalog(self, **kwargs):
+        return CatalogSync(self.client, self.index_path, clock=lambda: self.now[0], **kwargs)
+
+    def items(self, prices):
+        return [{'title': 'Item %d' % i, 'url': 'http://example.com/%d' % i, 'price': price, 'tags': ['a', 'b']}
+                for i, price in enumerate(prices)]
+
+    def pushed_urls(self):
+        return sorted(request_payload(r)['url'] for r in self.server.requests)
+
+    def test_fingerprint_is_stable(self):
+        self.assertEqual(content_fingerprint({'title': 'a', 'vars': {'x': 1, 'y': 2}}),
+                         content_fingerprint({'vars': {'y': 2, 'x': 1}, 'title': 'a'}))
+        self.assertNotEqual(content_fingerprint({'title': 'a', 'price': 1}), content_fingerprint({'title': 'a', 'price': 2}))
+
+    def test_only_new_and_changed_items_are_pushed(self):
+        with self.catalog() as catalog:
+            summary = catalog.run(self.items([10, 20, 30]))
+        self.assertEqual((summary.items, summary.pushed, summary.unchanged), (3, 3, 0))
+
+        del self.server.requests[:]
+        with self.catalog(concurrency=2) as catalog:
+            summary = catalog.run(self.items([10, 25, 30, 40]))
+        self.assertEqual((summary.items, summary.pushed, summary.unchanged), (4, 2, 2))
+        self.assertEqual(self.pushed_urls(), ['http://example.com/1', 'http://example.com/3'])
+        index = CatalogIndex(self.index_path)
+        self.assertEqual(len(index), 4)
+        index.close()
+
+    def test_stale_items_are_refreshed(self):
+        with self.catalog(refresh_after=86400) as catalog:
+            catalog.run(self.items([10, 20]))
+            self.now[0] += 3600
+            self.assertEqual(catalog.run(self.items([10, 20])).pushed, 0)
+            self.now[0] += 86400
+            self.assertEqual(catalog.run(self.items([10, 20])).pushed, 2)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_failed_pushes_are_retried_next_run(self):
+        items = self.items([10]) + [{'title': 'Broken', 'url': 'http://example.com/broken'}]
+        with self.catalog() as catalog:
+            summary = catalog.run(items)
+            self.assertEqual((summary.pushed, summary.failed), (1, 1))
+            self.assertEqual(summary.failures[0][0], 'http://example.com/broken')
+            self.assertEqual(summary.failures[0][1].get_error_code(), 99)
+            summary = catalog.run(items)
+            self.assertEqual((summary.pushed, summary.unchanged, summary.failed), (0, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the pooled HTTP transport
+"""
+from mock import MagicMock
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_http import encode_form, sailthru_http_session
+from stub_server import StubServer
+
+
+class TestPooledTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_keep_alive_reuses_connection(self):
+        with SailthruClient('test', 'super_secret', api_url=self.server.url) as client:
+            for i in range(5):
+                response = client.get_template('welcome')
+                self.assertTrue(response.is_ok())
+        ports = set(r['client_port'] for r in self.server.requests)
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(ports), 1)
+
+    def test_keep_alive_disabled(self):
+        with SailthruClient('test', 'super_secret', api_url=self.server.url, keep_alive=False) as client:
+            for i in range(3):
+                client.get_template('welcome')
+        ports = set(r['client_port'] for r in self.server.requests)
+        self.assertEqual(len(ports), 3)
+
+    def test_injected_session_is_used_and_left_open(self):
+        session = sailthru_http_session()
+        session.close = MagicMock()
+        client = SailthruClient('test', 'super_secret', api_url=self.server.url, session=session)
+        client.send('welcome', 'praj@sailthru.com')
+        client.close()
+        self.assertFalse(session.close.called)
+        self.assertEqual(self.server.requests[0]['method'], 'POST')
+        self.assertEqual(self.server.requests[0]['action'], 'send')
+
+    def test_close_releases_owned_session(self):
+        client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+        session = client.session
+        session.close = MagicMock()
+        with client:
+            pass
+        self.assertTrue(session.close.called)
+        self.assertIsNone(client.session)
+
+    def test_post_body_is_form_encoded(self):
+        with SailthruClient('test', 'super_secret', api_url=self.server.url) as client:
+            client.send('welcome', 'praj@sailthru.com', {'name': u'J\xfcrgen & co'})
+        request = self.server.requests[0]
+        self.assertEqual(request['headers']['Content-Type'], 'application/x-www-form-urlencoded')
+        self.assertIn(b'api_key=test', request['body'])
+        self.assertIn(b'J%5Cu00fcrgen+%26+co', request['body'])
+
+
+class TestEncodeForm(unittest.TestCase):
+    def test_matches_requests_encoding(self):
+        import requests
+        data = {'api_key': 'test', 'json': u'{"a": "b c&d=\xe9"}', 'format': 'json', 'n': 1, 'none': None}
+        prepared = requests.Request('POST', 'http://localhost/', data=data).prepare()
+        self.assertEqual(sorted(encode_form(data).split(b'&')), sorted(prepared.body.encode('ascii').split(b'&')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for job file helpers and list imports
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_job import JobFileWriter, JobRunner, iter_emails, write_email_files, write_job_file
+from stub_server import StubServer
+
+
+class TestEmailFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_chunks(self):
+        emails = ('user%d@example.com' % i for i in range(5))
+        paths = list(write_email_files(emails, chunk_size=2, directory=self.directory))
+        contents = [open(path).read().split() for path in paths]
+        self.assertEqual([len(c) for c in contents], [2, 2, 1])
+        self.assertEqual(contents[2], ['user4@example.com'])
+
+    def test_no_file_for_empty_input(self):
+        self.assertEqual(list(write_email_files([], directory=self.directory)), [])
+
+    def test_abandoned_file_is_removed(self):
+        files = write_email_files(['a@example.com', 'b@example.com'], chunk_size=1, directory=self.directory)
+        next(files)
+        files.close()
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_iter_emails_from_path(self):
+        path = os.path.join(self.directory, 'emails.txt')
+        with open(path, 'w') as f:
+            f.write('a@example.com\n\n b@example.com \n')
+        self.assertEqual(list(iter_emails(path)), ['a@example.com', 'b@example.com'])
+
+    def test_iter_emails_from_comma_separated_string(self):
+        self.assertEqual(list(iter_emails(u'a@example.com, b@example.com,')), ['a@example.com', 'b@example.com'])
+
+
+class TestImportList(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer().start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_import_from_generator_in_chunks(self):
+        emails = ('user%d@example.com' % i for i in range(25))
+        responses = self.client.import_list('main', emails, chunk_size=10, options={'report_email': 'ops@example.com'})
+        self.assertEqual(len(responses), 3)
+        self.assertTrue(all(r.is_ok() for r in responses))
+        bodies = [r['body'] for r in self.server.requests]
+        self.assertEqual([r['action'] for r in self.server.requests], ['job'] * 3)
+        self.assertIn(b'user9@example.com\n', bodies[0])
+        self.assertNotIn(b'user10@example.com', bodies[0])
+        self.assertIn(b'user24@example.com\n', bodies[2])
+        self.assertIn(b'report_email', bodies[0])
+        self.assertEqual([f for f in os.listdir(tempfile.gettempdir()) if f.startswith('sailthru-list-')], [])
+
+    def test_import_from_path_uploads_file_directly(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'emails.txt')
+            with open(path, 'w') as f:
+                f.write('a@example.com\nb@example.com\n')
+            self.client.import_list('main', path)
+            self.assertTrue(os.path.exists(path))
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIn(b'a@example.com\nb@example.com\n', self.server.requests[0]['body'])
+
+
+class TestJobFileWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.records = [{'id': 'a@example.com', 'vars': {'plan': 'gold'}},
+                        {'id': 'b@example.com', 'vars': {'plan': 'free', 'tags': ['x']}}]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ndjson(self):
+        path = write_job_file(self.records, directory=self.directory)
+        self.assertTrue(path.endswith('.json'))
+        with open(path) as f:
+            self.assertEqual([json.loads(line) for line in f], self.records)
+
+    def test_ndjson_gzip(self):
+        path = write_job_file(iter(self.records), compress=True, directory=self.directory)
+        self.assertTrue(path.endswith('.json.gz'))
+        with gzip.open(path, 'rb') as f:
+            self.assertEqual([json.loads(line.decode('utf-8')) for line in f], self.records)
+
+    def test_csv(self):
+        path = write_job_file([{'email': 'a@example.com', 'name': u'Zo\xeb'}, {'email': 'b@example.com', 'vars': {'a': 1}}],
+                              format='csv', fields=['email', 'name', 'vars'], directory=self.directory)
+        with open(path, 'rb') as f:
+            lines = f.read().decode('utf-8').splitlines()
+        self.assertEqual(lines, ['email,name,vars', u'a@example.com,Zo\xeb,', 'b@example.com,,"{""a"": 1}"'])
+
+    def test_failed_write_removes_file(self):
+        def records():
+            yield {'id': 'a@example.com'}
+            raise IOError('source went away')
+
+        with self.assertRaises(IOError):
+            write_job_file(records(), directory=self.directory)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            JobFileWriter('xml', directory=self.directory)
+
+
+class TestJobRunner(unittest.TestCase):
+    def setUp(self):
+        self.statuses = ['pending', 'pending', 'completed']
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+        self.sleeps = []
+        self.now = [0.0]
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now[0] += seconds
+
+    def runner(self, **kwargs):
+        return JobRunner(self.client, clock=lambda: self.now[0], sleep=self.sleep, **kwargs)
+
+    def handler(self, request):
+        if request['action'] == 'export.csv':
+            return 200, b'email,plan\na@example.com,gold\nb@example.com,free\n', None
+        if request['method'] == 'POST':
+            return 200, {'job_id': 'job1', 'status': 'pending'}, None
+        status = self.statuses.pop(0)
+        if isinstance(status, int):
+            return status, {'error': 9, 'errormsg': 'Temporarily unavailable'}, None
+        body = {'job_id': 'job1', 'status': status}
+        if body['status'] == 'completed':
+            body['export_url'] = self.server.url + '/export.csv'
+        return 200, body, None
+
+    def test_run_uploads_file_and_polls_with_backoff(self):
+        records = ({'id': 'user%d@example.com' % i, 'vars': {'n': i}} for i in range(3))
+        result = self.runner(poll_interval=1, max_poll_interval=3).run('update', records, options={'report_email': 'ops@example.com'})
+        self.assertTrue(result.is_ok())
+        self.assertEqual(result.job_id, 'job1')
+        self.assertEqual(self.sleeps, [1, 2, 3])
+
+        upload = self.server.requests[0]
+        self.assertEqual(upload['method'], 'POST')
+        self.assertIn('multipart/form-data', upload['headers']['Content-Type'])
+        self.assertIn(b'{"id":"user2@example.com","vars":{"n":2}}\n', upload['body'])
+        self.assertIn(b'report_email', upload['body'])
+        self.assertEqual([r['query'].get('json') is not None for r in self.server.requests[1:]], [True] * 3)
+        self.assertEqual([f for f in os.listdir(tempfile.gettempdir()) if f.startswith('sailthru-job-')], [])
+
+        rows = list(result.iter_export_rows(self.client.session))
+        self.assertEqual(rows, [{'email': 'a@example.com', 'plan': 'gold'}, {'email': 'b@example.com', 'plan': 'free'}])
+
+    def test_wait_polls_through_transient_errors(self):
+        self.statuses = [503, 429, 'completed']
+        result = self.runner(poll_interval=1).wait('job1')
+        self.assertTrue(result.is_ok())
+        self.assertEqual(self.sleeps, [1, 2, 4])
+
+        self.server.handler = lambda request: (400, {'error': 99, 'errormsg': 'Unknown job'}, None)
+        result = self.runner().wait('job2')
+        self.assertFalse(result.is_ok())
+        self.assertEqual(result.get_error().get_error_code(), 99)
+
+    def test_wait_times_out(self):
+        self.statuses = ['pending'] * 10
+        with self.assertRaises(SailthruClientError):
+            self.runner(poll_interval=4, timeout=10).wait('job1')
+        self.assertEqual(self.sleeps, [4, 6])
+
+    def test_rejected_submission(self):
+        self.server.handler = lambda request: (400, {'error': 99, 'errormsg': 'Invalid job'}, None)
+        result = self.runner().run('update', [{'id': 'a@example.com'}])
+        self.assertFalse(result.is_ok())
+        self.assertIsNone(result.status)
+        self.assertEqual(result.get_error().get_error_code(), 99)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
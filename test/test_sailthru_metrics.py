@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for request observers and metrics
+"""
+from mock import MagicMock
+import random
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_metrics import LatencyHistogram, MetricsCollector, StatsdObserver, payload_size, to_prometheus
+from stub_server import StubServer
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles_within_precision(self):
+        histogram = LatencyHistogram(precision_bits=5)
+        rng = random.Random(7)
+        values = sorted(rng.uniform(0.001, 2.0) for i in range(10000))
+        for value in values:
+            histogram.record(value)
+        for percent in (50, 90, 99, 99.9):
+            exact = values[int(len(values) * percent / 100.0) - 1]
+            self.assertAlmostEqual(histogram.percentile(percent), exact, delta=exact / 16.0)
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.max, values[-1])
+        self.assertLess(len(histogram.buckets), 400)
+
+    def test_empty(self):
+        self.assertIsNone(LatencyHistogram().percentile(50))
+
+    def test_payload_size_in_bytes(self):
+        self.assertEqual(payload_size({'json': u'{"name":"Ren\u00e9e"}'}), 17)
+        self.assertEqual(payload_size({'json': b'{}'}), 2)
+        self.assertEqual(payload_size({}), 0)
+
+
+class TestObservers(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(lambda request: (200, {'ok': True}, {'X-Rate-Limit-Limit': 10,
+                                                                      'X-Rate-Limit-Remaining': 9,
+                                                                      'X-Rate-Limit-Reset': 100})).start()
+        self.metrics = MetricsCollector()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url, observers=[self.metrics])
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_observer_callbacks(self):
+        observer = MagicMock()
+        self.client.add_observer(observer)
+        response = self.client.send('welcome', u'prāj@sailthru.com')
+        event = observer.before_request.call_args[0][0]
+        self.assertIs(observer.after_response.call_args[0][0], event)
+        self.assertEqual((event.action, event.method, event.status, event.attempt), ('send', 'POST', 200, 1))
+        self.assertEqual(event.rate_limit, {'limit': 10, 'remaining': 9, 'reset': 100})
+        self.assertEqual(event.payload_size, len(parse_qs(self.server.requests[0]['body'].decode('utf-8'))['json'][0].encode('utf-8')))
+        self.assertGreaterEqual(event.timings['total'], event.timings['network'])
+        # the body is only decoded, and timed, when it is read
+        self.assertEqual(set(event.timings), set(['sign', 'wait', 'network', 'total']))
+        self.assertFalse(observer.after_decode.called)
+        response.get_body()
+        response.get_body()
+        self.assertEqual(set(event.timings), set(['sign', 'wait', 'network', 'decode', 'total']))
+        self.assertEqual(observer.after_decode.call_count, 1)
+        self.assertIs(observer.after_decode.call_args[0][0], event)
+        self.client.remove_observer(observer)
+        self.client.send('welcome', 'praj@sailthru.com')
+        self.assertEqual(observer.after_response.call_count, 1)
+
+    def test_collector_and_exporters(self):
+        for i in range(3):
+            self.client.get_template('welcome')
+        self.client.send('welcome', 'praj@sailthru.com')
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot[('template', 'GET')]['requests'], 3)
+        self.assertEqual(snapshot[('template', 'GET')]['statuses'], {200: 3})
+        self.assertIsNotNone(snapshot[('send', 'POST')]['p99'])
+
+        text = to_prometheus(self.metrics)
+        self.assertIn('# TYPE sailthru_request_duration_seconds summary', text)
+        self.assertIn('sailthru_request_duration_seconds_count{action="template",method="GET"} 3', text)
+        self.assertIn('sailthru_responses_total{action="send",method="POST",status="200"} 1', text)
+        self.assertIn('sailthru_request_duration_seconds{action="template",method="GET",quantile="0.9"}', text)
+        self.assertIn('sailthru_request_duration_seconds{action="template",method="GET",quantile="0.99"}', text)
+
+    def test_statsd_and_errors(self):
+        lines = []
+        client = SailthruClient('test', 'super_secret', api_url='http://127.0.0.1:1',
+                                observers=[self.metrics, StatsdObserver(prefix='app', send=lines.append)])
+        with self.assertRaises(SailthruClientError):
+            client.get_user('praj@sailthru.com')
+        client.close()
+        self.assertEqual(self.metrics.get_endpoint('user', 'GET').errors, 1)
+        self.assertIn(b'app.user.get.error:1|c', lines)
+        self.assertTrue(any(line.startswith(b'app.user.get.network:') and line.endswith(b'|ms') for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the streaming multipart encoder and multipart uploads
+"""
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from urllib3.filepost import encode_multipart_formdata
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_multipart import MultipartEncoder
+from sailthru.sailthru_retry import RetryPolicy
+from stub_server import StubServer
+
+
+class TestMultipartEncoder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'users.json')
+        with open(self.path, 'wb') as f:
+            f.write(b'{"id":"a@example.com"}\n\xff\x00')
+        self.fields = {'api_key': 'test', 'json': '{"job":"update"}', 'sig': 'abc'}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def encode(self, source, filename='users.json'):
+        encoder = MultipartEncoder(self.fields, {'file': source}, boundary='xxBOUNDARYxx', chunk_size=8)
+        body = b''.join(bytes(chunk) for chunk in encoder)
+        return encoder, body
+
+    def expected(self, filename='users.json'):
+        fields = list(self.fields.items()) + [('file', (filename, b'{"id":"a@example.com"}\n\xff\x00', 'application/octet-stream'))]
+        return encode_multipart_formdata(fields, boundary='xxBOUNDARYxx')[0]
+
+    def test_sources_encode_like_urllib3(self):
+        with open(self.path, 'rb') as file_handle:
+            content = file_handle.read()
+            file_handle.seek(0)
+            sources = [(self.path, 'users.json'), (file_handle, 'users.json'), (content, 'file'),
+                       (bytearray(content), 'file'), (memoryview(content), 'file'), (io.BytesIO(content), 'file')]
+            for source, filename in sources:
+                encoder, body = self.encode(source)
+                self.assertEqual(body, self.expected(filename))
+                self.assertEqual(encoder.len, len(body))
+
+    def test_iterator_source_has_unknown_length(self):
+        encoder, body = self.encode(iter([b'{"id":"a@example.com"}\n', b'\xff\x00']))
+        self.assertIsNone(encoder.len)
+        self.assertEqual(body, self.expected('file'))
+        with self.assertRaises(SailthruClientError):
+            list(encoder)
+
+    def test_replay_from_initial_position(self):
+        file_handle = io.BytesIO(b'header\n{"id":"a@example.com"}\n\xff\x00')
+        file_handle.readline()
+        encoder = MultipartEncoder(self.fields, {'file': file_handle}, boundary='xxBOUNDARYxx')
+        self.assertEqual(b''.join(encoder), self.expected('file'))
+        self.assertEqual(b''.join(encoder), self.expected('file'))
+        self.assertEqual(encoder.len, len(self.expected('file')))
+
+    def test_read_like_a_file(self):
+        for size in (1, 5, 100, 4096):
+            encoder = MultipartEncoder(self.fields, {'file': self.path}, boundary='xxBOUNDARYxx', chunk_size=8)
+            body = b''.join(iter(lambda: encoder.read(size), b''))
+            self.assertEqual(body, self.expected())
+        encoder = MultipartEncoder(self.fields, {'file': memoryview(bytearray(b'{"id":"a@example.com"}\n\xff\x00'))},
+                                   boundary='xxBOUNDARYxx')
+        self.assertEqual(encoder.read(), self.expected('file'))
+        self.assertEqual(encoder.read(), b'')
+
+    def test_constant_memory(self):
+        with open(self.path, 'wb') as f:
+            for i in range(160):
+                f.write(os.urandom(65536))
+        encoder = MultipartEncoder(self.fields, {'file': self.path})
+        tracemalloc.start()
+        try:
+            sent = sum(len(chunk) for chunk in encoder)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(sent, encoder.len)
+        self.assertLess(peak, 1024 * 1024)
+
+
+class TestMultipartUploads(unittest.TestCase):
+    def setUp(self):
+        self.status = 200
+        self.server = StubServer(lambda request: (self.status, {'ok': self.status == 200}, None)).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_post_multipart_path_sent_as_binary(self):
+        path = os.path.join(self.directory, 'list.csv')
+        with open(path, 'wb') as f:
+            f.write(b'email\n\xe9t\xe9@example.com\n')
+        self.client.api_post('job', {'job': 'import', 'list': 'main', 'file': path}, ['file'])
+        request = self.server.requests[0]
+        self.assertIn(b'filename="list.csv"', request['body'])
+        self.assertIn(b'email\n\xe9t\xe9@example.com\n', request['body'])
+        self.assertEqual(int(request['headers']['Content-Length']), len(request['body']))
+
+    def test_bytes_file(self):
+        self.client.api_post('job', {'job': 'update', 'file': b'{"id":"a@example.com"}\n'})
+        request = self.server.requests[0]
+        self.assertIn(b'{"id":"a@example.com"}\n', request['body'])
+        self.assertIn('Content-Length', request['headers'])
+
+    def test_generator_file_is_sent_chunked(self):
+        lines = (('{"id":"user%d@example.com"}\n' % i).encode('utf-8') for i in range(100))
+        self.client.api_post('job', {'job': 'update', 'file': lines})
+        request = self.server.requests[0]
+        self.assertEqual(request['headers'].get('Transfer-Encoding'), 'chunked')
+        self.assertIn(b'{"id":"user99@example.com"}\n', request['body'])
+
+    def test_retries_resend_files_but_not_iterators(self):
+        self.status = 503
+        self.client.retry_policy = RetryPolicy(max_attempts=2, backoff_base=0, jitter=False, retry_post_actions=('job',))
+        file_handle = io.BytesIO(b'skipped\n{"id":"a@example.com"}\n')
+        file_handle.readline()
+        self.client.api_post('job', {'job': 'update', 'file': file_handle})
+        self.assertEqual(len(self.server.requests), 2)
+        for request in self.server.requests:
+            self.assertIn(b'\r\n\r\n{"id":"a@example.com"}\n\r\n', request['body'])
+            self.assertNotIn(b'skipped', request['body'])
+
+        self.client.api_post('job', {'job': 'update', 'file': iter([b'{"id":"a@example.com"}\n'])})
+        self.assertEqual(len(self.server.requests), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for Outbox
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_outbox import Outbox
+from stub_server import StubServer, request_payload
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.up = True
+        self.accepted = []
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def handler(self, request):
+        if not self.up:
+            return 503, {'error': 9, 'errormsg': 'Service unavailable'}, None
+        payload = request_payload(request)
+        if payload.get('email') == 'bad@example.com':
+            return 400, {'error': 11, 'errormsg': 'Invalid email'}, None
+        self.accepted.append((request['action'], payload))
+        return 200, {'ok': True}, None
+
+    def outbox(self, **kwargs):
+        kwargs.setdefault('backoff_base', 0.01)
+        kwargs.setdefault('backoff_cap', 0.05)
+        kwargs.setdefault('fsync_interval', 0.001)
+        return Outbox(self.client, self.directory, **kwargs)
+
+    def sends(self):
+        return [(payload['email'], payload['vars']['n']) for action, payload in self.accepted if action == 'send']
+
+    def test_makes_queued_calls(self):
+        with self.outbox() as outbox:
+            outbox.send('welcome', 'a@example.com', {'n': 1})
+            outbox.purchase('a@example.com', [{'id': 'sku1', 'qty': 1}], incomplete=1)
+            outbox.save_user('a@example.com', {'vars': {'plan': 'pro'}})
+        self.assertEqual(sorted(action for action, payload in self.accepted), ['purchase', 'send', 'user'])
+        metrics = outbox.get_metrics()
+        self.assertEqual((metrics['enqueued'], metrics['sent'], metrics['pending'], metrics['segments']), (3, 3, 0, 1))
+
+    def test_keeps_order_per_email_through_an_outage(self):
+        self.up = False
+        outbox = self.outbox(workers=3)
+        for n in range(20):
+            outbox.send('welcome', 'user%d@example.com' % (n % 4), {'n': n})
+        time.sleep(0.2)
+        self.assertEqual(outbox.get_metrics()['sent'], 0)
+        self.up = True
+        self.assertTrue(outbox.wait(10))
+        outbox.close()
+
+        self.assertTrue(outbox.get_metrics()['retries'] > 0)
+        self.assertEqual(outbox.get_metrics()['sent'], 20)
+        for i in range(4):
+            email = 'user%d@example.com' % i
+            self.assertEqual([n for e, n in self.sends() if e == email], list(range(i, 20, 4)))
+
+    def test_replays_unacknowledged_calls_after_restart(self):
+        self.up = False
+        outbox = self.outbox()
+        for n in range(5):
+            outbox.send('welcome', 'a@example.com', {'n': n})
+        outbox.close(drain=False)
+        self.assertEqual(outbox.get_metrics()['pending'], 5)
+
+        self.up = True
+        with self.outbox() as outbox:
+            self.assertTrue(outbox.wait(10))
+        self.assertEqual(outbox.get_metrics()['sent'], 5)
+        self.assertEqual(os.listdir(self.directory), ['outbox-000000000002.log'])
+
+        with self.outbox() as outbox:
+            self.assertEqual(outbox.get_metrics()['pending'], 0)
+        self.assertEqual([n for email, n in self.sends()], list(range(5)))
+
+    def test_ignores_a_torn_last_line(self):
+        with self.outbox() as outbox:
+            pass
+        with open(os.path.join(self.directory, 'outbox-000000000001.log'), 'ab') as log:
+            log.write(b'{"id": 1, "action": "send", "key": "a@example.com", "args": {"template": "welcome", "email": "a@')
+        with self.outbox() as outbox:
+            outbox.send('welcome', 'b@example.com', {'n': 1})
+        self.assertEqual(self.sends(), [('b@example.com', 1)])
+
+    def test_rejected_calls_are_not_retried(self):
+        failures = []
+        with self.outbox(on_failure=lambda entry, response, error: failures.append((entry.key, response.get_status_code()))) as outbox:
+            outbox.send('welcome', 'bad@example.com', {'n': 1})
+        self.assertEqual(failures, [('bad@example.com', 400)])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(outbox.get_metrics()['failed'], 1)
+
+    def test_errors_in_calls_or_callbacks_do_not_stall_the_worker(self):
+        failures = []
+
+        def on_failure(entry, response, error):
+            failures.append((entry.key, error.__class__.__name__ if error is not None else response.get_status_code()))
+            raise RuntimeError('callback failed')
+
+        send = self.client.send
+
+        def broken_send(template, email, _vars=None, **kwargs):
+            if _vars['n'] == 3:
+                raise ValueError('not an API error')
+            return send(template, email, _vars, **kwargs)
+
+        self.client.send = broken_send
+        outbox = self.outbox(workers=1, on_failure=on_failure)
+        outbox.send('welcome', 'bad@example.com', {'n': 1})
+        outbox.send('welcome', 'a@example.com', {'n': 2})
+        outbox.send('welcome', 'a@example.com', {'n': 3})
+        outbox.send('welcome', 'a@example.com', {'n': 4})
+        self.assertTrue(outbox.wait(5))
+        outbox.close()
+        self.assertEqual(self.sends(), [('a@example.com', 2), ('a@example.com', 4)])
+        self.assertEqual(failures, [('bad@example.com', 400), ('a@example.com', 'ValueError')])
+        self.assertEqual(outbox.get_metrics()['pending'], 0)
+
+    def test_gives_up_after_max_attempts(self):
+        self.up = False
+        failures = []
+        with self.outbox(max_attempts=3, on_failure=lambda entry, response, error: failures.append(entry.attempts)) as outbox:
+            outbox.send('welcome', 'a@example.com', {'n': 1})
+        self.assertEqual(failures, [3])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_spools_to_disk_when_down(self):
+        self.up = False
+        outbox = self.outbox(workers=2, queue_size=5, segment_size=2048, max_pending=300)
+        for n in range(300):
+            outbox.send('welcome', 'user%d@example.com' % n, {'n': n})
+        metrics = outbox.get_metrics()
+        self.assertTrue(metrics['in_memory'] <= 10)
+        self.assertTrue(metrics['segments'] > 5)
+        self.assertRaises(SailthruClientError, outbox.send, 'welcome', 'late@example.com')
+
+        self.up = True
+        self.assertTrue(outbox.wait(20))
+        outbox.close()
+        self.assertEqual(len(self.sends()), 300)
+        self.assertEqual(outbox.get_metrics()['segments'], 1)
+        self.assertRaises(SailthruClientError, outbox.send, 'welcome', 'late@example.com')
+
+    def test_get_outbox(self):
+        outbox = self.client.get_outbox(self.directory, workers=2)
+        self.assertTrue(isinstance(outbox, Outbox))
+        self.assertEqual(len(outbox.queues), 2)
+        outbox.close()
+
+    def test_close_twice(self):
+        with self.outbox() as outbox:
+            outbox.send('welcome', 'praj@sailthru.com')
+            outbox.close(drain=False)
+        outbox.close()
+        self.assertRaises(SailthruClientError, outbox.send, 'welcome', 'late@example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for PostbackVerifier
+"""
+from mock import MagicMock
+import threading
+import time
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_postback import LookupCache, PostbackVerifier
+from sailthru.sailthru_signature import get_signature_hash
+from stub_server import StubServer, request_payload
+
+SECRET = 'super_secret'
+
+
+def signed(**params):
+    params['sig'] = get_signature_hash(params, SECRET)
+    return params
+
+
+class TestVerifySignature(unittest.TestCase):
+    def setUp(self):
+        self.verifier = PostbackVerifier(SECRET)
+
+    def test_valid_postbacks(self):
+        self.assertTrue(self.verifier.verify_signature(signed(action='optout', email='praj@sailthru.com')))
+        self.assertTrue(self.verifier.verify_signature(signed(action='update', email='praj@sailthru.com', vars='x'), 'update'))
+        self.assertTrue(self.verifier.verify(signed(action='hardbounce', email='praj@sailthru.com', blast_id='1')))
+
+    def test_invalid_postbacks(self):
+        postback = signed(action='optout', email='praj@sailthru.com')
+        self.assertFalse(self.verifier.verify_signature(postback, 'update'))
+        self.assertFalse(self.verifier.verify_signature(dict(postback, email='other@sailthru.com')))
+        self.assertFalse(self.verifier.verify_signature(dict(postback, sig=None)))
+        self.assertFalse(self.verifier.verify_signature(signed(action='verify', email='praj@sailthru.com')))
+        self.assertFalse(self.verifier.verify_signature(signed(action='unknown', email='praj@sailthru.com')))
+        self.assertFalse(self.verifier.verify_signature([]))
+
+    def test_does_not_modify_input(self):
+        postback = signed(action='optout', email='praj@sailthru.com')
+        original = dict(postback)
+        self.verifier.verify(postback)
+        self.assertEqual(postback, original)
+
+    def test_lookup_needs_a_client(self):
+        postback = signed(action='hardbounce', email='praj@sailthru.com', blast_id='42')
+        self.assertRaises(SailthruClientError, self.verifier.verify, postback, lookup=True)
+        self.assertRaises(SailthruClientError, self.verifier.verify_many, [postback], lookup=True)
+
+    def test_verify_many_without_lookup(self):
+        postbacks = [signed(action='optout', email='a@sailthru.com'), {'action': 'optout', 'email': 'b', 'sig': 'x'}]
+        self.assertEqual(self.verifier.verify_many(postbacks), [True, False])
+
+
+class TestLookups(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', SECRET, api_url=self.server.url)
+        self.verifier = self.client.get_postback_verifier()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def handler(self, request):
+        if request['action'] == 'blast':
+            blast_id = request_payload(request)['blast_id']
+            if blast_id == 'missing':
+                return 400, {'error': 30, 'errormsg': 'Blast not found'}, None
+            return 200, {'blast_id': blast_id, 'name': 'Sale'}, None
+        return 200, {'email': 'praj@sailthru.com'}, None
+
+    def test_hardbounce_burst_makes_one_lookup(self):
+        postbacks = [signed(action='hardbounce', email='user%d@sailthru.com' % i, blast_id='42') for i in range(200)]
+        postbacks.append(signed(action='hardbounce', email='praj@sailthru.com', blast_id='missing'))
+        results = self.verifier.verify_many(postbacks, lookup=True)
+        self.assertEqual(results, [True] * 200 + [False])
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.verifier.verify(postbacks[0], 'hardbounce', lookup=True), True)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.verifier.get_metrics()['misses'], 2)
+
+    def test_verify_many_with_mixed_id_types(self):
+        postbacks = [signed(action='hardbounce', email='praj@sailthru.com', blast_id=blast_id) for blast_id in (43, '42', 43)]
+        self.assertEqual(self.verifier.verify_many(postbacks, lookup=True), [True] * 3)
+        blast_ids = [request_payload(request)['blast_id'] for request in self.server.requests]
+        self.assertEqual((len(blast_ids), 43 in blast_ids, '42' in blast_ids), (2, True, True))
+
+    def test_error_responses_are_not_cached(self):
+        handler = self.server.handler
+        self.server.handler = lambda request: (503, {'error': 9, 'errormsg': 'Service unavailable'}, None)
+        postback = signed(action='hardbounce', email='praj@sailthru.com', blast_id='42')
+        self.assertFalse(self.verifier.verify(postback, lookup=True))
+        self.server.handler = handler
+        self.assertEqual([self.verifier.verify(postback, lookup=True) for i in range(3)], [True] * 3)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_verify_checks_send_email(self):
+        self.assertTrue(self.verifier.verify(signed(action='verify', email='praj@sailthru.com', send_id='a'), lookup=True))
+        self.assertFalse(self.verifier.verify(signed(action='verify', email='other@sailthru.com', send_id='a'), lookup=True))
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class TestLookupCache(unittest.TestCase):
+    def test_concurrent_misses_share_one_fetch(self):
+        release = threading.Event()
+        fetch = MagicMock(side_effect=lambda: release.wait() and 'blast')
+        cache = LookupCache()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('42', fetch))) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['blast'] * 10)
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_concurrent_misses_share_the_error(self):
+        release = threading.Event()
+        fetch = MagicMock(side_effect=lambda: release.wait() and 1 / 0)
+        cache = LookupCache()
+        errors = []
+
+        def lookup():
+            try:
+                cache.get('42', fetch)
+            except ZeroDivisionError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=lookup) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        while cache.hits + cache.misses < 10:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 10)
+        self.assertTrue(all(error is errors[0] for error in errors))
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(cache.in_flight, {})
+
+    def test_entries_expire(self):
+        now = [0]
+        cache = LookupCache(ttl=10, clock=lambda: now[0])
+        fetch = MagicMock(return_value='blast')
+        cache.get('42', fetch)
+        now[0] = 5
+        cache.get('42', fetch)
+        now[0] = 11
+        cache.get('42', fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_size_is_bounded(self):
+        cache = LookupCache(maxsize=2)
+        for key in ('a', 'b', 'c'):
+            cache.get(key, lambda: key)
+        self.assertEqual(list(cache.entries), ['b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for PurchaseRecorder
+"""
+import threading
+import time
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from stub_server import StubServer, request_payload
+
+
+class TestPurchaseRecorder(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def handler(self, request):
+        if request_payload(request)['email'] == 'bad@example.com':
+            return 400, {'error': 9, 'errormsg': 'Invalid email'}, None
+        return 200, {'ok': True}, None
+
+    def purchases(self):
+        return [request_payload(r) for r in self.server.requests]
+
+    def test_coalesces_cart_updates(self):
+        recorder = self.client.get_purchase_recorder(flush_interval=60)
+        for qty in (1, 2, 3):
+            recorder.record('a@example.com', [{'id': 'sku1', 'qty': qty}], incomplete=1)
+        recorder.record('b@example.com', [{'id': 'sku2', 'qty': 1}], incomplete=1)
+        recorder.record('c@example.com', [{'id': 'sku3', 'qty': 1}])
+        recorder.record('c@example.com', [{'id': 'sku3', 'qty': 1}], incomplete=1)
+        recorder.record('b@example.com', [{'id': 'sku2', 'qty': 1}], extid='order-1')
+        recorder.flush()
+
+        purchases = self.purchases()
+        self.assertEqual(len(purchases), 4)
+        carts = [p for p in purchases if p.get('incomplete') == 1]
+        self.assertEqual(sorted((p['email'], p['items'][0]['qty']) for p in carts), [('a@example.com', 3), ('c@example.com', 1)])
+        self.assertEqual([p['extid'] for p in purchases if p['email'] == 'b@example.com'], ['order-1'])
+        self.assertEqual([p.get('incomplete') for p in purchases if p['email'] == 'c@example.com'], [None, 1])
+
+        metrics = recorder.get_metrics()
+        self.assertEqual((metrics['recorded'], metrics['coalesced'], metrics['sent'], metrics['queue_depth']), (7, 3, 4, 0))
+        self.assertAlmostEqual(metrics['coalescing_ratio'], 3 / 7.0)
+        recorder.close()
+
+    def test_flushes_when_batch_is_full(self):
+        recorder = self.client.get_purchase_recorder(max_batch=3, flush_interval=60)
+        for i in range(3):
+            recorder.record('user%d@example.com' % i, [{'id': 'sku', 'qty': 1}], incomplete=1)
+        deadline = time.time() + 5
+        while len(self.server.requests) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.server.requests), 3)
+        recorder.close()
+
+    def test_close_sends_buffered_events(self):
+        failed = []
+        with self.client.get_purchase_recorder(flush_interval=60, on_failure=lambda event, response, error: failed.append(event)) as recorder:
+            recorder.record('ok@example.com', [{'id': 'sku', 'qty': 1}])
+            recorder.record('bad@example.com', [{'id': 'sku', 'qty': 1}])
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual([event['email'] for event in failed], ['bad@example.com'])
+        self.assertEqual(recorder.get_metrics()['failed'], 1)
+        with self.assertRaises(SailthruClientError):
+            recorder.record('late@example.com', [])
+
+    def test_failing_callback_does_not_lose_purchases(self):
+        failed = []
+
+        def on_failure(event, response, error):
+            failed.append(event['extid'])
+            raise RuntimeError('callback failed')
+
+        with self.client.get_purchase_recorder(flush_interval=60, on_failure=on_failure) as recorder:
+            for n in range(3):
+                recorder.record('bad@example.com', [{'id': 'sku', 'qty': 1}], extid='order-%d' % n)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(failed, ['order-0', 'order-1', 'order-2'])
+        self.assertEqual(recorder.get_metrics()['failed'], 3)
+
+    def test_many_threads(self):
+        recorder = self.client.get_purchase_recorder(max_batch=50, flush_interval=0.05, concurrency=8, max_pending=20)
+
+        def checkout(worker):
+            for i in range(50):
+                recorder.record('user%d@example.com' % (i % 10), [{'id': 'sku', 'qty': worker}], incomplete=1)
+
+        threads = [threading.Thread(target=checkout, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        recorder.close()
+
+        metrics = recorder.get_metrics()
+        self.assertEqual(metrics['recorded'], 400)
+        self.assertEqual(metrics['sent'] + metrics['coalesced'], 400)
+        self.assertEqual(metrics['sent'], len(self.server.requests))
+        self.assertEqual(metrics['queue_depth'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
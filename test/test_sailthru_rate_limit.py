@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the rate limit scheduler
+"""
+import itertools
+import threading
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_rate_limit import RateLimiter, RateLimitInfo
+from stub_server import StubServer
+
+
+class FakeClock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(headroom=0.1, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_unknown_endpoints_are_not_throttled(self):
+        for i in range(100):
+            self.assertEqual(self.limiter.acquire('send', 'POST'), 0)
+        self.assertIsNone(self.limiter.get_budget('send', 'POST'))
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_paces_under_limit_and_waits_for_reset(self):
+        self.limiter.update('user', 'POST', {'limit': 20, 'remaining': 5, 'reset': 1030})
+        # 2 of the 5 remaining calls are held back as headroom
+        self.assertEqual(self.limiter.get_budget('user', 'POST'), 3)
+        for i in range(3):
+            self.assertEqual(self.limiter.acquire('user', 'post'), 0)
+        self.assertEqual(self.limiter.get_wait_time('user', 'POST'), 30)
+        self.assertEqual(self.limiter.acquire('user', 'POST'), 30)
+        self.assertEqual(self.clock.sleeps, [30])
+        # new window: full limit minus headroom, one token already spent
+        self.assertEqual(self.limiter.get_budget('user', 'POST'), 17)
+        metrics = self.limiter.get_metrics()[('user', 'POST')]
+        self.assertEqual(metrics['throttled'], 1)
+        self.assertEqual(metrics['waited'], 30)
+        self.assertEqual(metrics['reset'], 1090)
+
+    def test_corrected_by_later_headers(self):
+        self.limiter.update('send', 'POST', {'limit': 100, 'remaining': 80, 'reset': 1060})
+        self.limiter.update('send', 'POST', {'limit': 100, 'remaining': 90, 'reset': 1060})
+        self.assertEqual(self.limiter.get_budget('send', 'POST'), 70)
+        self.limiter.update('send', 'POST', {'limit': 100, 'remaining': 99, 'reset': 1120})
+        self.assertEqual(self.limiter.get_budget('send', 'POST'), 89)
+
+    def test_acquire_timeout(self):
+        self.limiter.update('user', 'GET', {'limit': 10, 'remaining': 0, 'reset': 1060})
+        self.assertIsNone(self.limiter.acquire('user', 'GET', timeout=5))
+        self.assertEqual(self.clock.sleeps, [])
+
+
+class TestClientRateLimiting(unittest.TestCase):
+    def test_client_feeds_and_obeys_limiter(self):
+        headers = {'X-Rate-Limit-Limit': 10, 'X-Rate-Limit-Remaining': 2, 'X-Rate-Limit-Reset': 1060}
+        server = StubServer(lambda request: (200, {}, headers)).start()
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+        try:
+            with SailthruClient('test', 'super_secret', api_url=server.url, rate_limiter=limiter) as client:
+                client.get_user('praj@sailthru.com')
+                self.assertEqual(limiter.get_budget('user', 'GET'), 1)
+                client.get_user('praj@sailthru.com')
+                self.assertEqual(clock.sleeps, [])
+                # the last remaining call is kept as headroom, so the next one waits for the reset
+                client.get_user('praj@sailthru.com')
+                self.assertEqual(clock.sleeps, [60])
+        finally:
+            server.stop()
+        self.assertEqual(len(server.requests), 3)
+
+
+class TestConcurrentRateLimitInfo(unittest.TestCase):
+    def test_no_lost_updates_under_contention(self):
+        info = RateLimitInfo()
+        snapshots = []
+        done = threading.Event()
+
+        def writer(action):
+            for remaining in range(5000, -1, -1):
+                info.update(action, 'post' if remaining % 2 else 'GET', {'limit': 5000, 'remaining': remaining, 'reset': 1060})
+
+        def reader():
+            while not done.is_set():
+                snapshots.append(info.snapshot())
+
+        threads = [threading.Thread(target=writer, args=('action%d' % i,)) for i in range(16)]
+        snapshot_thread = threading.Thread(target=reader)
+        snapshot_thread.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        snapshot_thread.join()
+
+        final = info.snapshot()
+        self.assertEqual(len(final), 16)
+        for i in range(16):
+            self.assertEqual(final['action%d' % i]['GET']['remaining'], 0)
+            self.assertEqual(final['action%d' % i]['POST']['remaining'], 1)
+        for snapshot in snapshots:
+            for methods in snapshot.values():
+                for entry in methods.values():
+                    self.assertEqual(sorted(entry), ['limit', 'remaining', 'reset'])
+
+    def test_client_shared_by_many_threads(self):
+        actions = ['user', 'send', 'list', 'blast', 'template', 'content', 'purchase', 'stats']
+        counters = dict((key, itertools.count()) for key in itertools.product(actions, ['GET', 'POST']))
+        lock = threading.Lock()
+
+        def handler(request):
+            with lock:
+                used = next(counters[(request['action'], request['method'])])
+            return 200, {}, {'X-Rate-Limit-Limit': 1000, 'X-Rate-Limit-Remaining': 1000 - used, 'X-Rate-Limit-Reset': 1060}
+
+        server = StubServer(handler).start()
+        errors = []
+        shared_headers = {'X-Custom': 'yes'}
+
+        def worker(client, offset):
+            try:
+                for i in range(16):
+                    action = actions[(offset + i) % len(actions)]
+                    if i % 2:
+                        client.api_post(action, {'id': 'user%d@example.com' % offset})
+                    else:
+                        client.api_get(action, {'id': 'user%d@example.com' % offset}, shared_headers)
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            with SailthruClient('test', 'super_secret', api_url=server.url, pool_maxsize=32) as client:
+                threads = [threading.Thread(target=worker, args=(client, offset)) for offset in range(32)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                snapshot = client.get_rate_limit_snapshot()
+        finally:
+            server.stop()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(server.requests), 32 * 16)
+        self.assertEqual(shared_headers, {'X-Custom': 'yes'})
+        seen = set((request['action'], request['method']) for request in server.requests)
+        self.assertEqual(set((action, method) for action in snapshot for method in snapshot[action]), seen)
+        for action, methods in snapshot.items():
+            for method, entry in methods.items():
+                self.assertEqual(entry['limit'], 1000)
+                self.assertTrue(1000 - 32 * 16 < entry['remaining'] <= 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for SailthruResponse
+"""
+from mock import MagicMock, patch
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru import sailthru_json
+from sailthru.sailthru_response import CompactResponse, SailthruResponse
+
+
+def http_response(content, status_code=200, headers=None):
+    response = MagicMock()
+    response.content = content
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+class TestSailthruResponse(unittest.TestCase):
+    def test_decoding_is_lazy_and_cached(self):
+        with patch('sailthru.sailthru_response.json_loads', side_effect=sailthru_json.json_loads) as json_loads:
+            response = SailthruResponse(http_response(b'{"email": "praj@sailthru.com"}',
+                                                      headers={'X-Rate-Limit-Limit': '10',
+                                                               'X-Rate-Limit-Remaining': '9',
+                                                               'X-Rate-Limit-Reset': '100'}))
+            self.assertEqual(response.get_status_code(), 200)
+            self.assertEqual(response.get_rate_limit_headers(), {'limit': 10, 'remaining': 9, 'reset': 100})
+            self.assertEqual(response.get_body(as_dictionary=False), b'{"email": "praj@sailthru.com"}')
+            self.assertFalse(json_loads.called)
+
+            self.assertTrue(response.is_ok())
+            self.assertEqual(response.get_body(), {'email': 'praj@sailthru.com'})
+            self.assertEqual(json_loads.call_count, 1)
+
+    def test_utf8_body(self):
+        response = SailthruResponse(http_response(u'{"name": "J\xfcrgen"}'.encode('utf-8')))
+        self.assertEqual(response.get_body(), {'name': u'J\xfcrgen'})
+
+    def test_api_error(self):
+        response = SailthruResponse(http_response(b'{"error": 99, "errormsg": "Invalid email"}', 400))
+        self.assertFalse(response.is_ok())
+        self.assertEqual(response.get_error().get_error_code(), 99)
+        self.assertEqual(response.get_error().get_message(), 'Invalid email')
+
+    def test_invalid_json(self):
+        response = SailthruResponse(http_response(b'<html>Bad Gateway</html>', 502))
+        self.assertFalse(response.is_ok())
+        self.assertIsNone(response.get_body())
+        self.assertIsNotNone(response.json_error)
+        self.assertEqual(response.get_error().get_error_code(), 0)
+
+    def test_backend(self):
+        self.assertIn(sailthru_json.JSON_BACKEND, ('orjson', 'ujson', 'simplejson', 'json'))
+
+
+class TestCompactResponse(unittest.TestCase):
+    def test_keeps_body_status_and_rate_limit(self):
+        response = CompactResponse.from_response(SailthruResponse(http_response(
+            b'{"send_id": "abc"}', headers={'X-Rate-Limit-Limit': '10', 'X-Rate-Limit-Remaining': '9',
+                                            'X-Rate-Limit-Reset': '100'})))
+        self.assertTrue(response.is_ok())
+        self.assertEqual(response.get_body(), {'send_id': 'abc'})
+        self.assertEqual(response.get_status_code(), 200)
+        self.assertEqual(response.rate_limit, (10, 9, 100))
+        self.assertEqual(response.get_rate_limit_headers(), {'limit': 10, 'remaining': 9, 'reset': 100})
+        self.assertIsNone(response.get_response())
+        self.assertFalse(response.get_error())
+        self.assertFalse(hasattr(response, '__dict__'))
+        self.assertTrue(CompactResponse.from_response(response) is response)
+
+    def test_keeps_errors_only(self):
+        response = CompactResponse.from_response(SailthruResponse(http_response(
+            b'{"error": 99, "errormsg": "Invalid email"}', 400)))
+        self.assertFalse(response.is_ok())
+        self.assertIsNone(response.get_body())
+        self.assertIsNone(response.get_rate_limit_headers())
+        self.assertEqual((response.get_error().get_error_code(), response.get_error().get_message()), (99, 'Invalid email'))
+
+        response = CompactResponse.from_response(SailthruResponse(http_response(b'<html>Bad Gateway</html>', 502)))
+        self.assertFalse(response.is_ok())
+        self.assertEqual(response.get_status_code(), 502)
+        self.assertEqual(response.get_error().get_error_code(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
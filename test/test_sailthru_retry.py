@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for retries with backoff
+"""
+from mock import MagicMock
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_retry import RetryPolicy
+from stub_server import StubServer
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_backoff_is_exponential_and_capped(self):
+        policy = RetryPolicy(backoff_base=1, backoff_cap=5, jitter=False)
+        self.assertEqual([policy.get_delay(attempt) for attempt in range(1, 6)], [1, 2, 4, 5, 5])
+
+    def test_jitter(self):
+        policy = RetryPolicy(backoff_base=1, random=lambda: 0.5)
+        self.assertEqual(policy.get_delay(3), 2)
+
+    def test_429_waits_for_rate_limit_reset(self):
+        response = MagicMock()
+        response.get_status_code.return_value = 429
+        response.get_rate_limit_headers.return_value = {'limit': 10, 'remaining': 0, 'reset': 1042}
+        policy = RetryPolicy(clock=lambda: 1000)
+        self.assertEqual(policy.get_delay(1, response), 42)
+
+    def test_only_idempotent_calls_are_retried(self):
+        policy = RetryPolicy()
+        error = SailthruClientError('connection reset')
+        self.assertTrue(policy.should_retry('user', 'GET', 1, error=error))
+        self.assertTrue(policy.should_retry('user', 'POST', 1, error=error))
+        self.assertFalse(policy.should_retry('send', 'POST', 1, error=error))
+        self.assertFalse(policy.should_retry('purchase', 'POST', 1, error=error))
+        self.assertFalse(policy.should_retry('user', 'GET', 3, error=error))
+
+
+class TestClientRetries(unittest.TestCase):
+    def setUp(self):
+        self.statuses = []
+        self.server = StubServer(self.handler).start()
+        self.retries = []
+        self.sleeps = []
+        self.policy = RetryPolicy(max_attempts=3, jitter=False, sleep=self.sleeps.append,
+                                  on_retry=lambda *args: self.retries.append(args))
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url, retry_policy=self.policy)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def handler(self, request):
+        status = self.statuses.pop(0) if self.statuses else 200
+        return status, {'status': status}, None
+
+    def test_retries_transient_errors(self):
+        self.statuses = [503, 502]
+        response = self.client.get_template('welcome')
+        self.assertEqual(response.get_status_code(), 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        self.assertEqual([(r[0], r[1], r[2]) for r in self.retries], [('template', 'GET', 1), ('template', 'GET', 2)])
+        self.assertEqual(self.policy.get_metrics(), {('template', 'GET'): 2})
+
+    def test_gives_up_after_max_attempts(self):
+        self.statuses = [500, 500, 500, 500]
+        response = self.client.get_template('welcome')
+        self.assertEqual(response.get_status_code(), 500)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_send_is_not_retried(self):
+        self.statuses = [503]
+        response = self.client.send('welcome', 'praj@sailthru.com')
+        self.assertEqual(response.get_status_code(), 503)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.retries, [])
+
+    def test_connection_errors_are_retried(self):
+        client = SailthruClient('test', 'super_secret', api_url='http://127.0.0.1:1', retry_policy=self.policy)
+        with self.assertRaises(SailthruClientError):
+            client.get_template('welcome')
+        client.close()
+        self.assertEqual(len(self.retries), 2)
+        self.assertIsInstance(self.retries[0][5], SailthruClientError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for request signing
+"""
+import hashlib
+import random
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru import sailthru_signature as s
+
+
+def legacy_signature_hash(params, secret):
+    """ The recursive implementation get_signature_hash replaced """
+    def extract(params):
+        values = []
+        if isinstance(params, dict):
+            for value in params.values():
+                values.extend(extract(value))
+        elif isinstance(params, list):
+            for value in params:
+                values.extend(extract(value))
+        else:
+            values.append(params)
+        return values
+    str_list = sorted(str(item) for item in extract(params))
+    return hashlib.md5((secret + ''.join(str_list)).encode('utf-8')).hexdigest()
+
+
+def random_params(rng, depth=0):
+    kind = rng.randint(0, 6 if depth < 4 else 3)
+    if kind == 0:
+        return rng.randint(-1000, 1000)
+    if kind == 1:
+        return rng.random()
+    if kind == 2:
+        return rng.choice([True, False, None, u'caf\xe9', u'☃ snow', ''])
+    if kind == 3:
+        return 'value%d' % rng.randint(0, 50)
+    if kind == 4:
+        return [random_params(rng, depth + 1) for i in range(rng.randint(0, 5))]
+    return dict(('key%d' % i, random_params(rng, depth + 1)) for i in range(rng.randint(0, 5)))
+
+
+class TestSignature(unittest.TestCase):
+    def test_extract_params_keeps_order(self):
+        params = {'a': [1, {'b': 2, 'c': [3, 4]}, 5]}
+        self.assertEqual(s.extract_params(params), [1, 2, 3, 4, 5])
+        self.assertEqual(s.extract_params('scalar'), ['scalar'])
+        self.assertEqual(s.extract_params({}), [])
+
+    def test_matches_legacy_algorithm(self):
+        rng = random.Random(42)
+        for i in range(300):
+            params = {'vars': random_params(rng), 'api_key': 'test'}
+            self.assertEqual(s.get_signature_hash(params, 'super_secret'), legacy_signature_hash(params, 'super_secret'))
+
+    def test_signature_hash_matches_signature_string(self):
+        params = {'email': u'praj@sailthru.com', 'vars': {'name': u'J\xfcrgen', 'count': 3}}
+        for secret in ('super_secret', u's\xe9cret'):
+            expected = hashlib.md5(s.get_signature_string(params, secret).encode('utf-8')).hexdigest()
+            self.assertEqual(s.get_signature_hash(params, secret), expected)
+            # second call goes through the cached secret state
+            self.assertEqual(s.get_signature_hash(params, secret), expected)
+
+    def test_payload_signature_matches_signature_hash(self):
+        for json_data in ('{}', '{"template": "welcome", "vars": {"name": "J\\u00fcrgen"}}', u'{"name": "J\xfcrgen"}'):
+            payload = {'api_key': 'test', 'format': 'json', 'json': json_data}
+            self.assertEqual(s.get_payload_signature('test', json_data, 'super_secret'),
+                             s.get_signature_hash(payload, 'super_secret'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for SingleFlight
+"""
+import threading
+import time
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError, SailthruTimeoutError
+from sailthru.sailthru_single_flight import SingleFlight
+from sailthru.sailthru_timeout import deadline
+from stub_server import StubServer
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.005)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.server = StubServer(self.handler).start()
+        self.single_flight = SingleFlight()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url, single_flight=self.single_flight)
+
+    def tearDown(self):
+        self.release.set()
+        self.client.close()
+        self.server.stop()
+
+    def handler(self, request):
+        self.release.wait(5)
+        return 200, {'action': request['action']}, None
+
+    def made(self):
+        metrics = self.single_flight.get_metrics()
+        return metrics['calls'] + metrics['deduplicated']
+
+    def concurrently(self, calls):
+        results = [None] * len(calls)
+        made = self.made()
+
+        def run(i):
+            results[i] = calls[i]()
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: self.made() == made + len(calls))
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_gets_share_one_call(self):
+        responses = self.concurrently([lambda: self.client.get_template('welcome')] * 8)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertTrue(all(response is responses[0] for response in responses))
+        self.assertEqual(responses[0].get_body()['action'], 'template')
+        self.assertEqual(self.single_flight.get_metrics(), {'calls': 1, 'deduplicated': 7, 'in_flight': 0})
+
+        self.release.clear()
+        self.concurrently([lambda: self.client.get_template('welcome')] * 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_different_gets_and_writes_are_not_shared(self):
+        self.concurrently([lambda: self.client.get_template('welcome'),
+                           lambda: self.client.get_template('receipt'),
+                           lambda: self.client.api_get('user', {'id': 'praj@sailthru.com', 'fields': {'vars': 1}}),
+                           lambda: self.client.api_get('user', {'fields': {'vars': 1}, 'id': 'praj@sailthru.com'})])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.single_flight.get_metrics()['deduplicated'], 1)
+
+        self.client.save_template('welcome', {'subject': 'Hi'})
+        self.client.save_template('welcome', {'subject': 'Hi'})
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_followers_keep_their_own_deadline(self):
+        leader = threading.Thread(target=self.client.get_template, args=('welcome',))
+        leader.start()
+        wait_for(lambda: self.single_flight.get_metrics()['in_flight'] == 1)
+        started = time.time()
+        with deadline(0.1):
+            self.assertRaises(SailthruTimeoutError, self.client.get_template, 'welcome')
+        self.assertLess(time.time() - started, 0.5)
+        self.release.set()
+        leader.join()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_errors_are_shared(self):
+        calls = []
+
+        def fail():
+            calls.append(1)
+            time.sleep(0.1)
+            raise SailthruClientError('connection refused')
+        errors = []
+
+        def run():
+            try:
+                self.single_flight.do('key', fail)
+            except SailthruClientError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(errors), 4)
+        self.assertTrue(all(error is errors[0] for error in errors))
+        self.assertEqual(self.single_flight.get_metrics()['in_flight'], 0)
+
+    def test_followers_retry_after_the_leaders_deadline(self):
+        calls, errors = [], []
+
+        def leader():
+            calls.append('leader')
+            time.sleep(0.1)
+            raise SailthruTimeoutError('deadline of the template call exceeded')
+
+        def follower():
+            calls.append('follower')
+            return 'response'
+
+        def run():
+            try:
+                self.single_flight.do('key', leader)
+            except SailthruTimeoutError as e:
+                errors.append(e)
+        thread = threading.Thread(target=run)
+        thread.start()
+        wait_for(lambda: self.single_flight.get_metrics()['in_flight'] == 1)
+        self.assertEqual(self.single_flight.do('key', follower), 'response')
+        thread.join()
+        self.assertEqual(calls, ['leader', 'follower'])
+        self.assertEqual(len(errors), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
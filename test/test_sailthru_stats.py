@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for StatsExporter
+"""
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_stats import StatsExporter, date_windows, stats_row, to_columns, write_csv, write_jsonl
+from stub_server import StubServer, request_payload
+
+
+class TestStatsRows(unittest.TestCase):
+    def test_day_and_week_windows(self):
+        self.assertEqual(len(date_windows('2016-01-01', '2016-01-31')), 31)
+        weeks = date_windows(datetime.date(2016, 1, 1), '2016-01-20', 'week')
+        self.assertEqual([(start.isoformat(), end.isoformat()) for start, end in weeks],
+                         [('2016-01-01', '2016-01-03'), ('2016-01-04', '2016-01-10'),
+                          ('2016-01-11', '2016-01-17'), ('2016-01-18', '2016-01-20')])
+        with self.assertRaises(ValueError):
+            date_windows('2016-01-01', '2016-01-02', 'month')
+
+    def test_typed_flat_row(self):
+        day = datetime.date(2016, 1, 1)
+        row = stats_row('send', 'welcome', day, day, {'count': 10, 'rev': '12.50', 'open_total': '7', 'name': 'Welcome',
+                                                      'click_times': {'0': 3, '1': 4}, 'domains': ['a', 'b']})
+        self.assertEqual(row['count'], 10)
+        self.assertEqual(row['rev'], 12.5)
+        self.assertEqual(row['open_total'], 7)
+        self.assertEqual(row['name'], 'Welcome')
+        self.assertEqual((row['click_times.0'], row['click_times.1']), (3, 4))
+        self.assertEqual(row['domains'], '["a", "b"]')
+        self.assertEqual((row['stat'], row['key'], row['start_date']), ('send', 'welcome', day))
+
+    def test_only_decimal_strings_become_numbers(self):
+        day = datetime.date(2016, 1, 1)
+        row = stats_row('send', 'welcome', day, day, {'a': '-3', 'b': '.5', 'c': '2.', 'd': 'nan', 'e': 'inf', 'f': '1e5', 'g': ' 7'})
+        self.assertEqual([row[name] for name in 'abc'], [-3, 0.5, 2.0])
+        self.assertEqual([row[name] for name in 'defg'], ['nan', 'inf', '1e5', ' 7'])
+
+
+class TestStatsExporter(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def handler(self, request):
+        payload = request_payload(request)
+        if payload.get('template') == 'missing':
+            return 400, {'error': 14, 'errormsg': 'Unknown template'}, None
+        if payload.get('template') == 'broken':
+            return 200, ['not', 'an', 'object'], None
+        day = int(payload.get('start_date', payload.get('date', '2016-01-01'))[-2:])
+        return 200, {'count': day * 10, 'beacon': str(day)}, None
+
+    def exporter(self, **kwargs):
+        return StatsExporter(self.client, today=lambda: datetime.date(2016, 1, 10), **kwargs)
+
+    def test_fetches_windows_in_parallel_and_in_order(self):
+        exporter = self.exporter(concurrency=4)
+        rows = list(exporter.fetch_many('send', ['welcome', 'missing', 'receipt'], '2016-01-01', '2016-01-05',
+                                        options={'beacon_times': 1}))
+        self.assertEqual([(row['key'], row['start_date'].day) for row in rows],
+                         [('welcome', day) for day in range(1, 6)] + [('receipt', day) for day in range(1, 6)])
+        self.assertEqual(rows[2]['count'], 30)
+        self.assertEqual(rows[2]['beacon'], 3)
+        self.assertEqual(len(exporter.failures), 5)
+        self.assertEqual(exporter.failures[0][3].get_error_code(), 14)
+        payload = request_payload(self.server.requests[0])
+        self.assertEqual(payload['beacon_times'], 1)
+        self.assertEqual(payload['stat'], 'send')
+
+    def test_failures_of_each_call(self):
+        exporter = self.exporter()
+        broken = exporter.fetch('send', 'broken', '2016-01-01', '2016-01-02')
+        broken_failures = exporter.failures
+        missing = exporter.fetch('send', 'missing', '2016-01-01', '2016-01-01')
+        self.assertEqual(list(broken), [])
+        self.assertEqual(list(missing), [])
+        self.assertEqual([failure[3].get_error_code() for failure in exporter.failures], [14])
+        # a 200 whose body is not an object
+        self.assertEqual(len(broken_failures), 2)
+        self.assertTrue(all(isinstance(failure[3], SailthruClientError) for failure in broken_failures))
+
+    def test_week_windows_and_list_stats(self):
+        rows = list(self.exporter(window='week').fetch('blast', None, '2016-01-01', '2016-01-10'))
+        self.assertEqual([(row['start_date'].day, row['end_date'].day) for row in rows], [(1, 3), (4, 10)])
+        rows = list(self.exporter(window='week').fetch('list', 'main', '2016-01-01', '2016-01-03'))
+        self.assertEqual([row['start_date'].day for row in rows], [1, 2, 3])
+        self.assertEqual(sorted(request_payload(r).get('date') for r in self.server.requests[2:]),
+                         ['2016-01-01', '2016-01-02', '2016-01-03'])
+
+    def test_closed_windows_are_cached(self):
+        rows = list(self.exporter(cache_dir=self.cache_dir).fetch('send', 'welcome', '2016-01-01', '2016-01-10'))
+        self.assertEqual(len(self.server.requests), 10)
+        exporter = self.exporter(cache_dir=self.cache_dir)
+        self.assertEqual(list(exporter.fetch('send', 'welcome', '2016-01-01', '2016-01-10')), rows)
+        # 2016-01-09 and 2016-01-10 are less than settle_days old
+        self.assertEqual(len(self.server.requests), 12)
+        self.assertEqual((exporter.cached, exporter.fetched), (8, 2))
+
+    def test_writers(self):
+        rows = list(self.exporter().fetch('send', 'welcome', '2016-01-01', '2016-01-02'))
+        rows[1]['extra'] = 'x'
+        csv_path = os.path.join(self.directory, 'stats.csv')
+        self.assertEqual(write_csv(rows, csv_path), 2)
+        with open(csv_path) as f:
+            self.assertEqual(f.read().splitlines(), ['stat,key,start_date,end_date,beacon,count,extra',
+                                                     'send,welcome,2016-01-01,2016-01-01,1,10,',
+                                                     'send,welcome,2016-01-02,2016-01-02,2,20,x'])
+        jsonl_path = os.path.join(self.directory, 'stats.jsonl')
+        write_jsonl(rows, jsonl_path)
+        with open(jsonl_path) as f:
+            self.assertEqual(json.loads(f.readline())['start_date'], '2016-01-01')
+        columns = to_columns(rows)
+        self.assertEqual(columns['count'], [10, 20])
+        self.assertEqual(columns['extra'], [None, 'x'])
+
+
+if __name__ == '__main__':
+    unittest.main()
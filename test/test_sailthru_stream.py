@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for streamed GET responses
+"""
+import json
+import requests
+import tracemalloc
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from mock import MagicMock
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError
+from sailthru.sailthru_stream import SailthruStreamResponse, iter_json_items
+from stub_server import StubServer
+
+BODY = {'templates': [{'name': 'welcome', 'subject': u'Hi {name} — "quoted" [brackets] {braces} \\ back'},
+                      {'name': 'receipt', 'count': 12345678901234, 'rate': -0.25e-3, 'tags': [], 'vars': {}},
+                      {'name': u'\U0001f600', 'active': True, 'deleted': False, 'parent': None}],
+        'skipped': {'nested': [[1, 2, {'x': '}]"'}], 'a\\"b'], 'n': 3},
+        'count': 3}
+
+
+def chunked(content, size):
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+class TestIterJSONItems(unittest.TestCase):
+    def items(self, body, item_path, size):
+        return list(iter_json_items(chunked(json.dumps(body, ensure_ascii=False).encode('utf-8'), size), item_path))
+
+    def test_items_across_any_chunk_boundary(self):
+        for size in (1, 2, 3, 7, 64, 100000):
+            self.assertEqual(self.items(BODY, 'templates', size), BODY['templates'])
+            self.assertEqual(self.items(BODY, 'count', size), [3])
+            self.assertEqual(self.items({'n': [123456, 7.5, 1e10]}, 'n', size), [123456, 7.5, 1e10])
+
+    def test_object_entries_and_nested_paths(self):
+        body = {'list': 'main', 'stats': {'days': {'2016-01-01': {'count': 1}, '2016-01-02': {'count': 2}}}}
+        for size in (1, 5, 1000):
+            self.assertEqual(self.items(body, 'stats.days', size),
+                             [('2016-01-01', {'count': 1}), ('2016-01-02', {'count': 2})])
+            self.assertEqual(self.items([1, [2], {'3': 3}], None, size), [1, [2], {'3': 3}])
+
+    def test_missing_paths_and_empty_containers(self):
+        self.assertEqual(self.items(BODY, 'lists', 4), [])
+        self.assertEqual(self.items(BODY, 'count.value', 4), [])
+        self.assertEqual(self.items({'templates': []}, 'templates', 1), [])
+        self.assertEqual(self.items({'templates': {}}, 'templates', 1), [])
+
+    def test_truncated_or_malformed_body(self):
+        content = json.dumps(BODY).encode('utf-8')
+        with self.assertRaises(SailthruClientError):
+            list(iter_json_items(chunked(content[:60], 7), 'templates'))
+        with self.assertRaises(SailthruClientError):
+            list(iter_json_items([b'{"templates": [1, 2 3]}'], 'templates'))
+
+    def test_memory_is_proportional_to_one_item(self):
+        item = json.dumps({'name': 'template', 'content_html': 'x' * 1000}).encode('utf-8')
+
+        def chunks():
+            yield b'{"skipped": "'
+            for i in range(16):
+                yield b'y' * 65536
+            yield b'", "templates": ['
+            for i in range(20000):
+                yield item + (b',' if i < 19999 else b']}')
+
+        tracemalloc.start()
+        try:
+            count = sum(1 for template in iter_json_items(chunks(), 'templates'))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(count, 20000)
+        # a 21MB body, parsed with a few chunks' worth of memory
+        self.assertLess(peak, 512 * 1024)
+
+
+class TestStreamedGet(unittest.TestCase):
+    def setUp(self):
+        self.status = 200
+        self.server = StubServer(lambda request: (self.status, self.body, None)).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+        self.body = BODY
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_api_get_stream(self):
+        response = self.client.api_get('template', {}, stream=True, item_path='templates')
+        self.assertTrue(isinstance(response, SailthruStreamResponse))
+        self.assertTrue(response.is_ok())
+        self.assertEqual([template['name'] for template in response], ['welcome', 'receipt', u'\U0001f600'])
+        self.assertEqual(self.server.requests[0]['method'], 'GET')
+
+        with self.client.api_get('template', {}, stream=True) as response:
+            self.assertEqual(dict(response.iter_items('skipped'))['n'], 3)
+
+    def test_error_response(self):
+        self.status = 403
+        self.body = {'error': 3, 'errormsg': 'Unauthorized'}
+        response = self.client.api_get('template', {}, stream=True, item_path='templates')
+        self.assertFalse(response.is_ok())
+        self.assertEqual(response.get_error().get_error_code(), 3)
+        self.assertRaises(SailthruClientError, list, response)
+
+    def test_transport_errors_while_iterating(self):
+        def iter_content(chunk_size):
+            yield b'{"templates": [{"name": "welcome"}, '
+            raise requests.exceptions.ChunkedEncodingError('Connection broken: IncompleteRead')
+
+        http_response = MagicMock(status_code=200, headers={})
+        http_response.iter_content.side_effect = iter_content
+        response = SailthruStreamResponse(http_response, 'templates')
+        items = []
+        with self.assertRaises(SailthruClientError):
+            for template in response:
+                items.append(template)
+        self.assertEqual(items, [{'name': 'welcome'}])
+        http_response.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for UserSyncPipeline
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_sync import UserSyncPipeline, merge_user_options
+from stub_server import StubServer, request_payload
+
+
+class TestMergeUserOptions(unittest.TestCase):
+    def test_nested_dicts_are_merged(self):
+        options = {'vars': {'a': 1, 'b': 2}, 'lists': {'main': 1}, 'optout_email': 'none'}
+        merge_user_options(options, {'vars': {'b': 3}, 'lists': {'sale': 1}, 'optout_email': 'all'})
+        self.assertEqual(options, {'vars': {'a': 1, 'b': 3}, 'lists': {'main': 1, 'sale': 1}, 'optout_email': 'all'})
+
+
+class TestUserSyncPipeline(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'sync.checkpoint')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def handler(self, request):
+        payload = request_payload(request)
+        if payload['id'] == 'bad@example.com':
+            return 400, {'error': 11, 'errormsg': 'Invalid email'}, None
+        return 200, {'ok': True}, None
+
+    def saved(self):
+        return [request_payload(r) for r in self.server.requests]
+
+    def test_coalesces_updates_within_window(self):
+        records = [('a@example.com', {'vars': {'x': 1}}),
+                   {'id': 'b@example.com', 'lists': {'main': 1}},
+                   ('a@example.com', {'vars': {'y': 2}}),
+                   ('c@example.com', None)]
+        summary = UserSyncPipeline(self.client, window=10).run(records)
+        self.assertEqual((summary.records, summary.coalesced, summary.succeeded, summary.failed), (4, 1, 3, 0))
+        saved = dict((payload['id'], payload) for payload in self.saved())
+        self.assertEqual(saved['a@example.com']['vars'], {'x': 1, 'y': 2})
+        self.assertEqual(saved['b@example.com']['lists'], {'main': 1})
+        self.assertTrue(summary.per_second > 0)
+
+    def test_failures_are_reported(self):
+        failed = []
+        pipeline = UserSyncPipeline(self.client, on_failure=lambda idvalue, options, result: failed.append(idvalue))
+        summary = pipeline.run([('ok@example.com', {}), ('bad@example.com', {})])
+        self.assertEqual((summary.succeeded, summary.failed), (1, 1))
+        self.assertEqual(failed, ['bad@example.com'])
+        self.assertEqual(summary.failures[0][1].get_error_code(), 11)
+
+    def test_resumes_from_checkpoint(self):
+        def records(count):
+            for i in range(count):
+                yield ('user%d@example.com' % i, {'vars': {'n': i}})
+
+        pipeline = UserSyncPipeline(self.client, window=3, checkpoint_path=self.checkpoint)
+
+        class Crash(Exception):
+            pass
+
+        def crashing():
+            for i, record in enumerate(records(10)):
+                if i == 7:
+                    raise Crash()
+                yield record
+
+        with self.assertRaises(Crash):
+            pipeline.run(crashing())
+        self.assertEqual(pipeline.read_checkpoint(), 6)
+        self.assertEqual(len(self.server.requests), 6)
+
+        summary = pipeline.run(records(10))
+        self.assertEqual((summary.skipped, summary.records, summary.succeeded), (6, 4, 4))
+        self.assertEqual(sorted(p['vars']['n'] for p in self.saved()), list(range(10)))
+        self.assertEqual(pipeline.read_checkpoint(), 10)
+        pipeline.clear_checkpoint()
+        self.assertEqual(pipeline.read_checkpoint(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
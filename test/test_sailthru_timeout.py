@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for timeouts and deadlines
+"""
+import time
+import unittest
+import sys
+
+sys.path[0:0] = [""]
+
+from mock import patch
+from sailthru.sailthru_bulk import BulkResults
+from sailthru.sailthru_client import SailthruClient
+from sailthru.sailthru_error import SailthruClientError, SailthruTimeoutError
+from sailthru.sailthru_rate_limit import RateLimiter
+from sailthru.sailthru_retry import RetryPolicy
+from sailthru.sailthru_timeout import DEFAULT_TIMEOUTS, Timeout, current_deadline, deadline
+from stub_server import StubServer
+
+
+class TestTimeout(unittest.TestCase):
+    def test_of(self):
+        self.assertEqual(Timeout.of(10), Timeout(10, 10))
+        self.assertEqual(Timeout.of((3, 30)), Timeout(3, 30))
+        self.assertEqual(Timeout.of(None), Timeout())
+        timeout = Timeout(1, 2, 3)
+        self.assertTrue(Timeout.of(timeout) is timeout)
+
+    def test_request_timeout_fits_in_remaining_time(self):
+        timeout = Timeout(connect=2, read=5)
+        self.assertEqual(timeout.get_request_timeout(), (2, 5))
+        self.assertEqual(timeout.get_request_timeout(3), (2, 3))
+        self.assertEqual(Timeout().get_request_timeout(3), (3, 3))
+
+    def test_deadline_nesting(self):
+        self.assertEqual(current_deadline(), None)
+        with deadline(at=1000) as outer:
+            self.assertEqual(outer, 1000)
+            with deadline(at=2000):
+                self.assertEqual(current_deadline(), 1000)
+            with deadline(at=500):
+                self.assertEqual(current_deadline(), 500)
+            self.assertEqual(current_deadline(), 1000)
+            self.assertEqual(Timeout(total=5).get_deadline(100), 105)
+            self.assertEqual(Timeout(total=5000).get_deadline(100), 1000)
+        self.assertEqual(current_deadline(), None)
+        self.assertEqual(Timeout().get_deadline(100), None)
+
+
+class TestClientTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.delay = 0
+        self.status = 200
+        self.server = StubServer(self.handler).start()
+        self.client = SailthruClient('test', 'super_secret', api_url=self.server.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def handler(self, request):
+        time.sleep(self.delay)
+        return self.status, {'ok': True}, None
+
+    def test_timeouts_per_action(self):
+        client = SailthruClient('test', 'super_secret', request_timeout=(4, 40), timeouts={'stats': 90})
+        self.assertEqual(client.get_timeout('stats'), Timeout(90, 90))
+        self.assertEqual(client.get_timeout('template'), Timeout(4, 40))
+        self.assertEqual(self.client.get_timeout('send'), DEFAULT_TIMEOUTS['send'])
+        self.assertEqual(self.client.get_timeout('template'), Timeout(10, 10))
+        client = SailthruClient('test', 'super_secret', request_timeout=30)
+        self.assertEqual(client.get_timeout('send'), Timeout(30, 30))
+        self.assertEqual(client.get_timeout('stats'), Timeout(30, 30))
+
+        with patch('sailthru.sailthru_client.sailthru_http_request') as request:
+            self.client.send('welcome', 'praj@sailthru.com')
+            self.client.stats_send('welcome', '2016-01-01', '2016-01-31')
+            self.client.get_template('welcome')
+        self.assertEqual([call[0][5] for call in request.call_args_list], [(2, 5), (5, 60), (10, 10)])
+
+    def test_deadline_spans_retries(self):
+        self.status = 503
+        self.client.retry_policy = RetryPolicy(max_attempts=10, backoff_base=0.2, jitter=False)
+        started = time.time()
+        with deadline(0.5):
+            response = self.client.get_template('welcome')
+        self.assertEqual(response.get_status_code(), 503)
+        self.assertTrue(time.time() - started < 0.5)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_deadline_cuts_slow_responses_short(self):
+        self.delay = 1
+        started = time.time()
+        with deadline(0.2):
+            self.assertRaises(SailthruClientError, self.client.get_template, 'welcome')
+        self.assertTrue(time.time() - started < 0.8)
+
+    def test_total_timeout(self):
+        self.delay = 1
+        self.client.timeouts['template'] = Timeout(connect=1, read=5, total=0.2)
+        started = time.time()
+        self.assertRaises(SailthruClientError, self.client.get_template, 'welcome')
+        self.assertTrue(time.time() - started < 0.8)
+
+    def test_rate_limit_wait_past_the_deadline(self):
+        limiter = RateLimiter(sleep=self.fail)
+        limiter.update('template', 'GET', {'limit': 10, 'remaining': 0, 'reset': time.time() + 60})
+        self.client.rate_limiter = limiter
+        with deadline(1):
+            self.assertRaises(SailthruTimeoutError, self.client.get_template, 'welcome')
+        self.assertEqual(self.server.requests, [])
+
+    def test_expired_deadline(self):
+        with deadline(at=time.time() - 1):
+            self.assertRaises(SailthruTimeoutError, self.client.send, 'welcome', 'praj@sailthru.com')
+        self.assertEqual(self.server.requests, [])
+
+    def test_bulk_helpers_inherit_the_deadline(self):
+        self.delay = 0.15
+        with deadline(0.4):
+            results = list(self.client.send_many([('welcome', 'user%d@example.com' % i) for i in range(6)], concurrency=1))
+        self.assertTrue(results[0].is_ok())
+        self.assertTrue(isinstance(results[-1].error, SailthruTimeoutError))
+
+        deadlines = []
+        with deadline(at=1000):
+            results = BulkResults(lambda item: deadlines.append(current_deadline()), range(3), concurrency=2)
+        list(results)
+        self.assertEqual(deadlines, [1000] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()